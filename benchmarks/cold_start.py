@@ -0,0 +1,73 @@
+"""
+Measure how long the jukebox takes to come up.
+
+    python -m benchmarks.cold_start [--rounds 5]
+
+"import" times `import src.main` and `import src.api_server` in a fresh interpreter each round,
+without the interpreter's own startup. "first request" starts the API server in a fresh process
+and times how long until GET /queue answers. The server runs with `run_jukebox=False`, so the
+benchmark neither plays nor changes the real queue.
+"""
+import argparse, sys, os, time, socket, subprocess, statistics, urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+SERVER_SCRIPT = ("import uvicorn; from src.api_server import create_app; "
+                 "uvicorn.run(create_app(run_jukebox=False), host='127.0.0.1', port={port}, log_level='warning')")
+
+def report(name, timings):
+    print(f"{name:22} n={len(timings):3}  median={statistics.median(timings) * 1000:7.1f}ms  "
+          f"min={min(timings) * 1000:7.1f}ms  max={max(timings) * 1000:7.1f}ms")
+
+def import_time(module, rounds):
+    timings = []
+    for _ in range(rounds):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    report(f"import {module}", timings)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def first_request(rounds, timeout):
+    timings = []
+    for _ in range(rounds):
+        port = free_port()
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT.format(port=port)], cwd=ROOT,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/queue", timeout=1) as response:
+                        if response.status == 200:
+                            timings.append(time.perf_counter() - start)
+                            break
+                except OSError:
+                    if server.poll() is not None:
+                        print("first request: the server exited before answering")
+                        return
+                    time.sleep(0.01)
+        finally:
+            server.terminate()
+            server.wait()
+    if timings:
+        report("first request", timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for the server to answer")
+    args = parser.parse_args()
+
+    import_time("src.main", args.rounds)
+    import_time("src.api_server", args.rounds)
+    first_request(args.rounds, args.timeout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare yt-dlp extraction modes.
+
+    python -m benchmarks.extraction [--rounds 3] [--workers 2] [URL ...]
+
+"fresh" builds a new YoutubeDL for every extraction (the old behaviour), "thread" reuses a warm
+instance per thread and "process" runs extractions in a pool of worker processes.
+Needs network access; the numbers include YouTube's response time.
+"""
+import argparse, sys, os, time, statistics, concurrent.futures
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.extractor import ExtractionService, new_youtube_dl, summarize_info
+
+DEFAULT_URLS = [
+    "https://www.youtube.com/watch?v=gGdGFtwCNBE",
+    "https://www.youtube.com/watch?v=fJ9rUzIMcZQ",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+]
+
+def extract_fresh(url):
+    with new_youtube_dl() as ydl:
+        return summarize_info(ydl.extract_info(url, download=False))
+
+def run(name, extract, urls, rounds, workers):
+    timings = []
+    def timed(url):
+        start = time.perf_counter()
+        extract(url)
+        return time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(rounds):
+            timings.extend(executor.map(timed, urls))
+    wall = time.perf_counter() - wall_start
+    print(f"{name:8} n={len(timings):3}  mean={statistics.mean(timings):6.2f}s  "
+          f"median={statistics.median(timings):6.2f}s  max={max(timings):6.2f}s  wall={wall:6.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="*", default=DEFAULT_URLS)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    run("fresh", extract_fresh, args.urls, args.rounds, args.workers)
+
+    threaded = ExtractionService(mode="thread")
+    run("thread", threaded.extract, args.urls, args.rounds, args.workers)
+
+    processes = ExtractionService(mode="process", workers=args.workers)
+    processes.extract(args.urls[0])  # Start the pool outside the measurement
+    run("process", processes.extract, args.urls, args.rounds, args.workers)
+    processes.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure the queue scanner's track transitions on the fake player, no audio hardware needed.
+
+    python -m benchmarks.scanner [--songs 20] [--length 30] [--speed 20] [--gapless-lead 15]
+
+Each song is `--length` seconds long and plays `--speed` times faster than real time. The queue
+runs once with the gapless handoff off ("restart": stop, clear and add for every song) and
+once with it on ("gapless"). After that, the per-call command latency of every player backend
+that can start on this machine is measured.
+"""
+import argparse, sys, os, time, queue, threading, tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import media_scanner
+from src.player import FakePlayer, create_player, PLAYER_BACKENDS
+from src.song import Song
+from src.stream_cache import StreamUrlCache
+from src.utils.logger import DebouncedJsonWriter
+
+def run_queue(name, songs, speed, gapless_lead):
+    media_scanner.player = FakePlayer(speed=speed)
+    media_scanner.GAPLESS_LEAD = gapless_lead
+    media_scanner.playback_stats.update(transitions=0, gapless_transitions=0, last_gap=None, max_gap=None, total_gap=0.0)
+
+    song_queue, condition = queue.Queue(), threading.Condition()
+    for song in songs:
+        song_queue.put(song)
+    start = time.perf_counter()
+    threading.Thread(target=media_scanner.scan_queue, args=(song_queue, condition), daemon=True).start()
+
+    deadline = time.time() + len(songs) * songs[0].duration / speed * 2 + 10
+    while media_scanner.playback_stats["transitions"] < len(songs) - 1 and time.time() < deadline:
+        time.sleep(0.05)
+    wall = time.perf_counter() - start
+    stats = media_scanner.get_playback_stats()
+    average = f"{stats['average_gap'] * 1000:7.1f}ms" if stats["average_gap"] is not None else "      -"
+    worst = f"{stats['max_gap'] * 1000:7.1f}ms" if stats["max_gap"] is not None else "      -"
+    print(f"{name:8} transitions={stats['transitions']:3}  gapless={stats['gapless_transitions']:3}  "
+          f"mean gap={average}  max gap={worst}  wall={wall:6.2f}s")
+    media_scanner.skip_playback()
+
+def command_latency(rounds):
+    for name in PLAYER_BACKENDS:
+        player = create_player(name)
+        if player.name != name or not player.start():
+            print(f"{name:8} not available here")
+            continue
+        start = time.perf_counter()
+        for i in range(rounds):
+            player.set_volume(200 + i % 50)
+        per_call = (time.perf_counter() - start) / rounds
+        print(f"{name:8} set_volume  n={rounds}  mean={per_call * 1e6:8.1f}us")
+        player.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=20)
+    parser.add_argument("--length", type=int, default=30, help="Song length in seconds of song time")
+    parser.add_argument("--speed", type=float, default=20)
+    parser.add_argument("--gapless-lead", type=int, default=15)
+    parser.add_argument("--commands", type=int, default=500)
+    args = parser.parse_args()
+
+    # Keep the benchmark away from the jukebox's own history, now-playing file and caches
+    tmp = tempfile.mkdtemp()
+    media_scanner.write_played_song = lambda song: None
+    media_scanner.current_song_mirror = DebouncedJsonWriter(os.path.join(tmp, "currently_playing.json"))
+    media_scanner.stream_cache = StreamUrlCache(None)
+    media_scanner.START_TIMEOUT = 5
+
+    songs = [Song(f"Song {i}", f"https://www.youtube.com/watch?v=bench{i:06d}", args.length, "Benchmark")
+             for i in range(args.songs)]
+    for song in songs:
+        media_scanner.stream_cache.put(song.video_id, f"https://example.invalid/{song.video_id}?expire={int(time.time()) + 86400}")
+
+    run_queue("restart", songs, args.speed, gapless_lead=0)
+    run_queue("gapless", songs, args.speed, gapless_lead=args.gapless_lead)
+    command_latency(args.commands)
+
+if __name__ == "__main__":
+    main()
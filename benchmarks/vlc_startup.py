@@ -0,0 +1,42 @@
+"""
+Measure how long it takes to get VLC ready for commands.
+
+    python -m benchmarks.vlc_startup [--rounds 5]
+
+"probe" starts VLC with no cached audio output, so the outputs are probed first (cold start),
+"cached" starts it with the probe result cached (crash recovery and later starts).
+Needs VLC installed; on Linux it also needs a working audio output.
+"""
+import argparse, sys, os, time, statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.player import rc
+
+def run(name, player, rounds, before_start):
+    timings = []
+    for _ in range(rounds):
+        before_start()
+        start = time.perf_counter()
+        if not player.start():
+            print(f"{name:7} VLC failed to start")
+            return
+        timings.append(time.perf_counter() - start)
+        player.shutdown()
+    print(f"{name:7} n={len(timings):3}  mean={statistics.mean(timings):6.2f}s  "
+          f"median={statistics.median(timings):6.2f}s  max={max(timings):6.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    player = rc.RcPlayer()
+    run("probe", player, args.rounds, rc.invalidate_audio_output)
+    run("cached", player, args.rounds, lambda: None)
+    probe = player.startup_stats["last_audio_probe"]
+    if probe is not None:
+        print(f"last audio output probe: {probe:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 export interface SongResponse {
-  status: string;
-  song: string;
-  author: string;
+  request_id: string;
+  prompt: string;
+  status: string; // pending, resolving, queued, not_found or failed
+  song: string | null;
+  author: string | null;
+  error: string | null;
 }
 
 export interface QueueSong {
+  id: number;
   name: string;
   author: string;
   duration: number;
@@ -18,6 +22,8 @@ export interface CurrentSong {
   played_at: string | null;
   active: boolean;
   paused: boolean; // Make sure this field exists
+  elapsed?: number | null; // Seconds into the song, as reported by the player
+  remaining?: number | null;
 }
 
 export interface SkipResponse {
@@ -28,6 +34,13 @@ export interface PauseResponse {
   status: string;
 }
 
+export async function fetchRequestStatus(requestId: string): Promise<SongResponse> {
+  const apiUrl = `http://${window.location.hostname}:8000/requests/${requestId}`;
+  const res = await fetch(apiUrl);
+  if (!res.ok) throw new Error("Failed to fetch the request status");
+  return res.json();
+}
+
 export async function sendPrompt(prompt: string): Promise<SongResponse> {
   const apiUrl = `http://${window.location.hostname}:8000/request_song`;
   const res = await fetch(apiUrl, {
@@ -36,9 +49,54 @@ export async function sendPrompt(prompt: string): Promise<SongResponse> {
     body: JSON.stringify({ prompt: prompt }),
   });
   if (!res.ok) throw new Error("API error");
+  // The server answers right away with a ticket, wait for the search to finish
+  let ticket: SongResponse = await res.json();
+  while (ticket.status === "pending" || ticket.status === "resolving") {
+    await new Promise((resolve) => setTimeout(resolve, 500));
+    ticket = await fetchRequestStatus(ticket.request_id);
+  }
+  if (ticket.status !== "queued") throw new Error(ticket.error || "Song not found");
+  return ticket;
+}
+
+export interface BulkRequest {
+  bulk_id: string;
+  status: string; // resolving or done
+  total: number;
+  queued: number;
+  not_found: number;
+  failed: number;
+}
+
+// Queue prompts, YouTube URLs and playlist URLs in order. Progress arrives as bulk_update messages on /ws
+export async function sendPrompts(prompts: string[]): Promise<BulkRequest> {
+  const apiUrl = `http://${window.location.hostname}:8000/request_songs`;
+  const res = await fetch(apiUrl, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ prompts }),
+  });
+  if (!res.ok) throw new Error("API error");
   return res.json();
 }
 
+export interface SearchCandidate {
+  video_id: string;
+  url: string;
+  name: string;
+  author: string;
+  duration: number;
+}
+
+// Request the chosen candidate by passing its url to sendPrompt
+export async function searchSongs(prompt: string, limit = 5): Promise<SearchCandidate[]> {
+  const params = new URLSearchParams({ prompt, limit: String(limit) });
+  const apiUrl = `http://${window.location.hostname}:8000/search?${params}`;
+  const res = await fetch(apiUrl);
+  if (!res.ok) throw new Error("Failed to search");
+  return (await res.json()).candidates;
+}
+
 export async function skipSong(): Promise<SkipResponse> {
   const apiUrl = `http://${window.location.hostname}:8000/skip`;
   const res = await fetch(apiUrl, {
@@ -75,3 +133,87 @@ export async function fetchQueue(): Promise<QueueSong[]> {
   return res.json();
 }
 
+
+export interface JukeboxState {
+  queue: QueueSong[];
+  currentSong: CurrentSong | null;
+}
+
+// Applies one /ws event to the state the client holds
+function applyEvent(state: JukeboxState, event: any): JukeboxState {
+  switch (event.type) {
+    case "song_added":
+      return { ...state, queue: [...state.queue, event.entry] };
+    case "song_removed":
+      return { ...state, queue: state.queue.filter((song) => song.id !== event.id) };
+    case "song_moved": {
+      const moved = state.queue.find((song) => song.id === event.id);
+      if (!moved) return state;
+      const queue = state.queue.filter((song) => song.id !== event.id);
+      queue.splice(event.position, 0, moved);
+      return { ...state, queue };
+    }
+    case "queue_cleared":
+      return { ...state, queue: [] };
+    case "now_playing":
+      return { ...state, currentSong: event.song && event.song.name ? event.song : null };
+    case "paused":
+      return state.currentSong ? { ...state, currentSong: { ...state.currentSong, paused: event.paused } } : state;
+    case "progress":
+      return state.currentSong
+        ? { ...state, currentSong: { ...state.currentSong, elapsed: event.elapsed, remaining: event.remaining } }
+        : state;
+    default:
+      return state;
+  }
+}
+
+// Follows the jukebox state over the /ws event stream, reconnecting (and catching up) when the connection drops.
+// Returns a function that closes the subscription.
+export function subscribeToJukebox(
+  onChange: (state: JukeboxState) => void,
+  onConnectionChange?: (connected: boolean) => void
+): () => void {
+  let socket: WebSocket | null = null;
+  let stopped = false;
+  let retry: ReturnType<typeof setTimeout> | undefined;
+  let version: number | null = null;
+  let epoch: string | null = null;
+  let state: JukeboxState = { queue: [], currentSong: null };
+
+  const connect = () => {
+    const resume = version !== null && epoch ? `?since=${version}&epoch=${epoch}` : "";
+    socket = new WebSocket(`ws://${window.location.hostname}:8000/ws${resume}`);
+    socket.onopen = () => onConnectionChange?.(true);
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type === "ping") {
+        // The server drops clients it hasn't heard from in a while
+        socket?.send(JSON.stringify({ type: "pong" }));
+        return;
+      }
+      if (event.type === "snapshot") {
+        epoch = event.epoch;
+        version = event.version;
+        state = { queue: event.queue, currentSong: event.current_song && event.current_song.name ? event.current_song : null };
+        onChange(state);
+        return;
+      }
+      if (typeof event.version !== "number" || version === null || event.version <= version) return;
+      version = event.version;
+      state = applyEvent(state, event);
+      onChange(state);
+    };
+    socket.onclose = () => {
+      onConnectionChange?.(false);
+      if (!stopped) retry = setTimeout(connect, 2000);
+    };
+  };
+
+  connect();
+  return () => {
+    stopped = true;
+    clearTimeout(retry);
+    socket?.close();
+  };
+}
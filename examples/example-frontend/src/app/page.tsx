@@ -1,6 +1,6 @@
 "use client";
 import { useState, useEffect } from "react";
-import { sendPrompt, fetchCurrentSong, fetchQueue, skipSong, pauseSong } from "./api";
+import { sendPrompt, fetchCurrentSong, fetchQueue, skipSong, pauseSong, subscribeToJukebox } from "./api";
 import type { SongResponse, QueueSong, CurrentSong } from "./api";
 
 export default function Home() {
@@ -12,6 +12,7 @@ export default function Home() {
   const [queue, setQueue] = useState<QueueSong[]>([]);
   const [skipLoading, setSkipLoading] = useState(false);
   const [pauseLoading, setPauseLoading] = useState(false);
+  const [connected, setConnected] = useState(false);
 
   const handleChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setSearchPrompt(e.target.value);
@@ -81,8 +82,16 @@ export default function Home() {
     }
   };
 
-  // Fetch current song and queue on mount and every 5 seconds
+  // Follow the jukebox over the websocket, and only poll while it is disconnected
   useEffect(() => {
+    return subscribeToJukebox((state) => {
+      setCurrentSong(state.currentSong);
+      setQueue(state.queue);
+    }, setConnected);
+  }, []);
+
+  useEffect(() => {
+    if (connected) return;
     const getSong = async () => {
       try {
         const song = await fetchCurrentSong();
@@ -106,9 +115,9 @@ export default function Home() {
     const interval = setInterval(() => {
       getSong();
       getQueue();
-    }, 500);
+    }, 5000);
     return () => clearInterval(interval);
-  }, []);
+  }, [connected]);
 
   return (
     <div className="min-h-screen flex flex-col items-center justify-center font-sans">
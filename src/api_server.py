@@ -1,57 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import json, os
+import os, json, time, asyncio, logging
 import socket
 
-from src.main import add_song_to_queue, set_clean_mode, get_clean_mode, song_queue
-from src.media_scanner import pause_playback, skip_playback
+from src.main import add_song_to_queue, set_clean_mode, get_clean_mode, song_queue, find_song, start_jukebox, stop_jukebox
+from src.main import search_candidates, candidate_cache, speculative_prefetcher, SPECULATIVE_PREFETCH
+from src.main import add_songs_to_queue, expand_prompts, BULK_WORKERS, BULK_MAX_ITEMS
+from src.song import Song
+from src.request_pipeline import RequestPipeline, PipelineFullError, BulkEnqueuer
+from src.connection_manager import ConnectionManager
+from src.media_scanner import pause_playback, skip_playback, get_now_playing, get_playback_stats, get_playback_position, is_stream_ready
+from src.event_log import events, LoopBridge, ChangeWaiters
+from src import metrics
 from src.utils.logger import write_current_restriction_mode
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        
-    def disconnect(self, websocket: WebSocket):
-        try:
-            self.active_connections.remove(websocket)
-        except ValueError:
-            pass
-        
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_json(message)
-            
+from typing import Callable, Optional, List
+from contextlib import asynccontextmanager
+
 manager = ConnectionManager()
+metrics.websocket_clients.set_function(lambda: len(manager.connections))
 
 def get_queue_data():
-    with song_queue.mutex:
-        queue = [
-            {
-                "name": song.name,
-                "author": song.author,
-                "duration": song.duration,
-                "url": song.url,
-                "search_prompt": getattr(song, 'search_prompt', None)
-            }
-            for song in list(song_queue.queue)
-        ]
-    return queue
+    """The queue as entry dicts, cached by the queue until it changes. Don't modify the result."""
+    return song_queue.snapshot()
 
 def get_current_song_data():
-    try:
-        with open(get_current_song_path(), "r") as f:
-            data = json.load(f)
-            if data is None:
-                return None
-            return data
-    except Exception:
-        return None
+    data = get_now_playing()
+    if data is not None:
+        data.update(get_playback_position())
+    return data
 
 def get_local_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -64,36 +42,19 @@ def get_local_ip():
         s.close()
     return IP
 
-local_ip = get_local_ip()
-hostname = socket.gethostname()
-local_hostname_local = f"{hostname}.local"
-local_hostname_lan = f"{hostname}.lan"
-
-allowed_origins = [
-    "http://localhost:3000",
-    "http://127.0.0.1:3000",
-    f"http://{local_ip}:3000",
-    f"http://{local_hostname_local}:3000",
-    f"http://{local_hostname_lan}:3000",
-]
-
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-print("CORS allowed_origins:", allowed_origins)
-
-def get_current_song_path():
-    return os.path.join(os.path.dirname(__file__), "logs", "currently_playing.json")
+def get_allowed_origins() -> list:
+    """Origins the frontend can be reached from on this machine. Looks up the LAN address, so only call it on start."""
+    local_ip = get_local_ip()
+    hostname = socket.gethostname()
+    return [
+        "http://localhost:3000",
+        "http://127.0.0.1:3000",
+        f"http://{local_ip}:3000",
+        f"http://{hostname}.local:3000",
+        f"http://{hostname}.lan:3000",
+    ]
 
-def get_queue_path():
-    return os.path.join(os.path.dirname(__file__), "logs", "all_queued_songs.json")
+router = APIRouter()
 
 class SongRequest(BaseModel):
     prompt: str
@@ -101,22 +62,31 @@ class SongRequest(BaseModel):
 class ToggleCleanModeRequest(BaseModel):
     prompt: bool
 
-class SongResponse(BaseModel):
+class SongRequestStatus(BaseModel):
+    request_id: str
+    prompt: str
     status: str
-    song: str
-    author: str
+    song: Optional[str] = None
+    author: Optional[str] = None
+    url: Optional[str] = None
+    duration: Optional[int] = None
+    error: Optional[str] = None
 
 class ToggleRestrictionResponse(BaseModel):
     status: str
     clean_mode: bool
 
 class QueueSong(BaseModel):
+    id: int
     name: str
     author: str
     duration: int
     url: str
     search_prompt: Optional[str] = None
 
+class MoveQueueEntryRequest(BaseModel):
+    position: int
+
 class CurrentlyPlayingResponse(BaseModel):
     name: Optional[str]
     author: Optional[str]
@@ -125,80 +95,336 @@ class CurrentlyPlayingResponse(BaseModel):
     played_at: Optional[str]
     active: bool
     paused: bool
+    elapsed: Optional[float] = None
+    remaining: Optional[float] = None
+
+class BulkSongRequest(BaseModel):
+    prompts: List[str]
+
+class SearchCandidate(BaseModel):
+    video_id: str
+    url: str
+    name: str
+    duration: int
+    author: str
 
-async def broadcast_state():
-    await manager.broadcast({
-        "type": "queue_update",
-        "queue": get_queue_data(),
+class SearchResponse(BaseModel):
+    prompt: str
+    candidates: List[SearchCandidate]
+
+class PlaybackStatsResponse(BaseModel):
+    transitions: int
+    gapless_transitions: int
+    last_gap: Optional[float]
+    max_gap: Optional[float]
+    average_gap: Optional[float]
+    gapless_lead: int
+    player: str
+    vlc_starts: int
+    last_vlc_startup: Optional[float]
+    last_audio_probe: Optional[float]
+
+def get_state_snapshot() -> dict:
+    """The whole state plus the event version it is current as of, for clients that can't catch up on events."""
+    with song_queue.condition:
+        # Queue events are appended under the same lock, so the queue and the version agree
+        queue, version = get_queue_data(), events.version
+    return {
+        "type": "snapshot",
+        "epoch": events.epoch,
+        "version": version,
+        "queue": queue,
         "current_song": get_current_song_data(),
-    })
+    }
+
+def announce_if_ready(song: Song):
+    """Songs queued with their stream already resolved won't get a song_ready from the prefetcher, send it now."""
+    if is_stream_ready(song):
+        events.append("song_ready", url=song.url)
+
+def queue_requested_song(song: Song, prompt: str):
+    """Queue the song of a /request_song request. Runs on a resolver thread, in the order the requests came in."""
+    add_song_to_queue(song, prompt)
+    announce_if_ready(song)
+
+def queue_bulk_songs(items: list) -> list:
+    """Queue a batch of (song, prompt) pairs of a bulk request. Runs on a bulk worker thread."""
+    ids = add_songs_to_queue(items)
+    for song, _ in items:
+        announce_if_ready(song)
+    return ids
+
+# Events from the scanner, prefetcher and resolver threads reach the websocket clients on the API loop.
+# No loop yet means no websocket clients either, they start from a snapshot.
+change_waiters = ChangeWaiters()
+
+def deliver_event(message: dict):
+    """Runs on the API loop for every event: push it to websocket clients and wake long-polls."""
+    started = time.perf_counter()
+    manager.publish(message)
+    metrics.broadcast_seconds.observe(time.perf_counter() - started)
+    change_waiters.check()
+
+event_bridge = LoopBridge(deliver_event)
+events.subscribe(event_bridge)
+
+def attach_event_loop():
+    event_bridge.attach(asyncio.get_running_loop())
+
+def publish_request_update(request: dict):
+    """Called from resolver threads whenever a request changes state. The song itself arrives as a song_added event."""
+    event_bridge({"type": "request_update", "request": request})
+
+def publish_bulk_update(bulk: dict, item: dict):
+    """Called from bulk workers whenever an item of a bulk request changes state."""
+    event_bridge({"type": "bulk_update", "bulk": bulk, "item": item})
+
+RESOLVER_WORKERS = int(os.environ.get("JUKEBOX_RESOLVER_WORKERS", 2))
+request_pipeline = RequestPipeline(
+    find_song,
+    queue_requested_song,
+    max_workers=RESOLVER_WORKERS,
+    on_update=publish_request_update
+)
 
-@app.post("/request_song", response_model=SongResponse)
+bulk_enqueuer = BulkEnqueuer(
+    find_song,
+    queue_bulk_songs,
+    workers=BULK_WORKERS,
+    max_items=BULK_MAX_ITEMS,
+    on_update=publish_bulk_update
+)
+
+@router.post("/request_song", response_model=SongRequestStatus, status_code=202)
 async def request_song(song_request: SongRequest):
-    from src.main import search_song, Song
-    clean_mode = get_clean_mode()
-    url, name, duration, author = search_song(song_request.prompt, restricted=clean_mode)
-    if not url:
-        raise HTTPException(status_code=404, detail="Song not found")
-    song = Song(name, url, duration, author)
-    add_song_to_queue(song, song_request.prompt)
-    await broadcast_state()
-    return {"status": "added", "song": name, "author": author}
-
-@app.post("/toggle_clean_mode", response_model=ToggleRestrictionResponse)
+    """Accept a song request and resolve it in the background. Poll /requests/{id} or listen on /ws for the result."""
+    if not song_request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Search prompt cannot be empty")
+    attach_event_loop()
+    try:
+        ticket = request_pipeline.submit(song_request.prompt, get_clean_mode())
+    except PipelineFullError as e:
+        raise HTTPException(status_code=503, detail=f"Too many pending requests: {e}")
+    return ticket.to_dict()
+
+@router.post("/request_songs", status_code=202)
+async def request_songs(bulk_request: BulkSongRequest):
+    """
+    Queue a list of prompts, YouTube URLs and playlist URLs, in the given order. They are resolved in
+    the background, a few at a time. Poll /request_songs/{id} or listen on /ws for per-song progress.
+    """
+    prompts = [prompt.strip() for prompt in bulk_request.prompts if prompt.strip()]
+    if not prompts:
+        raise HTTPException(status_code=400, detail="No prompts given")
+    attach_event_loop()
+    try:
+        # Playlists are listed up front, one request each
+        entries = await run_in_threadpool(expand_prompts, prompts)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to list playlist: {e}")
+    try:
+        bulk = bulk_enqueuer.submit(entries, get_clean_mode())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return bulk.to_dict()
+
+@router.get("/request_songs/{bulk_id}")
+def get_bulk_request_status(bulk_id: str):
+    bulk = bulk_enqueuer.get(bulk_id)
+    if bulk is None:
+        raise HTTPException(status_code=404, detail="Unknown bulk request id")
+    return bulk
+
+SEARCH_CANDIDATES = int(os.environ.get("JUKEBOX_SEARCH_CANDIDATES", 5))
+SEARCH_CANDIDATES_MAX = 20  # About one page of YouTube results
+
+@router.get("/search", response_model=SearchResponse)
+def search(prompt: str, limit: int = SEARCH_CANDIDATES):
+    """
+    The best `limit` matches for a prompt, to choose from. The first one's stream starts resolving
+    right away. Request the chosen one by its url with /request_song.
+    """
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Search prompt cannot be empty")
+    restricted = get_clean_mode()
+    limit = max(1, min(limit, SEARCH_CANDIDATES_MAX))
+    songs = [Song(name, url, duration, author) for url, name, duration, author in search_candidates(prompt, restricted, limit)]
+    if SPECULATIVE_PREFETCH:
+        speculative_prefetcher.speculate(candidate_cache.make_key(prompt, restricted), songs)
+    return {
+        "prompt": prompt,
+        "candidates": [
+            {"video_id": song.video_id, "url": song.url, "name": song.name, "duration": song.duration, "author": song.author}
+            for song in songs
+        ],
+    }
+
+@router.get("/requests/{request_id}", response_model=SongRequestStatus)
+def get_request_status(request_id: str):
+    request = request_pipeline.get(request_id)
+    if request is None:
+        raise HTTPException(status_code=404, detail="Unknown request id")
+    return request
+
+@router.post("/toggle_clean_mode", response_model=ToggleRestrictionResponse)
 def toggle_clean_mode(toggle_clean_mode_request: ToggleCleanModeRequest):
     write_current_restriction_mode(toggle_clean_mode_request.prompt)
     set_clean_mode(toggle_clean_mode_request.prompt)
     return {"status": "Toggled", "clean_mode": toggle_clean_mode_request.prompt}
 
-@app.get("/queue", response_model=list[QueueSong])
-def get_queue():
-    """Return the current queue state (songs waiting to be played)."""
-    songs = []
-    with song_queue.mutex:
-        for song in list(song_queue.queue):
-            songs.append({
-                "name": song.name,
-                "author": song.author,
-                "duration": song.duration,
-                "url": song.url,
-                "search_prompt": getattr(song, 'search_prompt', None)
-            })
-    return songs
-
-@app.get("/currentlyPlayingSong", response_model=CurrentlyPlayingResponse)
-def get_currently_playing(current_song_path: str = Depends(get_current_song_path)):
-    try:
-        with open(current_song_path, "r") as f:
-            data = json.load(f)
-            if data is None:
-                return {"name": None, "author": None, "duration": None, "url": None, "played_at": None, "active": False, "paused": False}
-        # Ensure paused field exists in the response
-        if "paused" not in data:
-            data["paused"] = False
-        return CurrentlyPlayingResponse(**data)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"name": None, "author": None, "duration": None, "url": None, "played_at": None, "active": False, "paused": False}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# Long-polls wait at most this long, whatever timeout they ask for
+LONG_POLL_MAX_TIMEOUT = float(os.environ.get("JUKEBOX_LONG_POLL_MAX_TIMEOUT", 60))
+# Events that change what /currentlyPlayingSong returns
+PLAYBACK_EVENTS = ("now_playing", "paused", "progress")
+
+def playback_version() -> int:
+    return events.last_version(*PLAYBACK_EVENTS)
 
-@app.post("/pauseToggle")
+async def wait_for_change(changed, timeout: float):
+    """Park a long-poll until `changed()` is true or the timeout runs out."""
+    attach_event_loop()
+    await change_waiters.wait(changed, max(0.0, min(timeout, LONG_POLL_MAX_TIMEOUT)))
+
+def state_headers(version: int) -> dict:
+    return {"ETag": f'W/"{events.epoch}-{version}"', "X-State-Version": str(version), "Cache-Control": "no-cache"}
+
+def client_has_version(request: Request, version: int) -> bool:
+    """True if the request's If-None-Match already names this state version."""
+    known = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return state_headers(version)["ETag"] in known or "*" in known
+
+def versioned_response(request: Request, version: int, body: Callable[[], str]) -> Response:
+    """
+    A JSON response tagged with the state version it was built from.
+    If the client already has this version the answer is an empty 304 and `body` is never called.
+    """
+    if client_has_version(request, version):
+        return Response(status_code=304, headers=state_headers(version))
+    return Response(content=body(), media_type="application/json", headers=state_headers(version))
+
+@router.get("/queue", response_model=list[QueueSong])
+async def get_queue(request: Request, wait_for_version: Optional[int] = None, timeout: float = 30):
+    """
+    Return the current queue state (songs waiting to be played).
+    With `wait_for_version`, the request waits until the queue is newer than that version (its
+    X-State-Version header) or `timeout` seconds pass.
+    """
+    if wait_for_version is not None:
+        await wait_for_change(lambda: song_queue.version > wait_for_version, timeout)
+    # The queue keeps this serialized until it changes, so skip revalidating it on every call
+    return versioned_response(request, song_queue.version, song_queue.snapshot_json)
+
+@router.delete("/queue/{entry_id}", response_model=QueueSong)
+def remove_queue_entry(entry_id: int):
+    """Remove a song from the queue by its entry id."""
+    # Not async: the queue lock and the journal write must not block the event loop
+    entry = song_queue.remove(entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown queue entry")
+    return entry.to_dict()
+
+@router.post("/queue/{entry_id}/move", response_model=list[QueueSong])
+def move_queue_entry(entry_id: int, move_request: MoveQueueEntryRequest):
+    """Move a song to another position in the queue, 0 being next up. Returns the new queue."""
+    # Not async: the queue lock and the journal write must not block the event loop
+    if not song_queue.move(entry_id, move_request.position):
+        raise HTTPException(status_code=404, detail="Unknown queue entry")
+    # Tagged like /queue, so the client can long-poll from here without another GET
+    with song_queue.condition:
+        version, body = song_queue.version, song_queue.snapshot_json()
+    return Response(content=body, media_type="application/json", headers=state_headers(version))
+
+@router.get("/currentlyPlayingSong", response_model=CurrentlyPlayingResponse)
+async def get_currently_playing(request: Request, wait_for_version: Optional[int] = None, timeout: float = 30):
+    """
+    The song that is playing. Supports If-None-Match and `wait_for_version` like /queue.
+    The version only moves on song, pause and progress changes, so `elapsed` in a response may
+    be a few seconds old.
+    """
+    if wait_for_version is not None:
+        await wait_for_change(lambda: playback_version() > wait_for_version, timeout)
+    version = playback_version()
+    if client_has_version(request, version):
+        return Response(status_code=304, headers=state_headers(version))
+    data = await run_in_threadpool(get_current_song_data)  # Asks the player for its position
+    if data is None:
+        data = {"name": None, "author": None, "duration": None, "url": None, "played_at": None, "active": False, "paused": False}
+    return Response(content=json.dumps(data), media_type="application/json", headers=state_headers(version))
+
+@router.get("/playbackStats", response_model=PlaybackStatsResponse)
+def playback_stats():
+    """Measured gaps between consecutive tracks."""
+    return get_playback_stats()
+
+@router.post("/pauseToggle")
 async def pause_toggle():
     pause_playback()
-    await broadcast_state()
     return {"status": "toggled pause/play"}
 
-@app.post("/skip")
+@router.post("/skip")
 async def skip():
     skip_playback()
-    await broadcast_state()
     return {"status": "skipped current song"}
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+@router.get("/metrics")
+def get_metrics():
+    """Latency histograms and counters of the request-to-playback pipeline, in the Prometheus text format."""
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None):
+    """
+    Versioned event stream. New clients get a snapshot, then every event after it.
+    A client reconnecting with `since` (and `epoch`) from the last event it saw only gets the
+    events it missed, or a fresh snapshot if they are no longer in the event log.
+    """
+    attach_event_loop()
     await manager.connect(websocket)
+    missed = events.since(since, epoch) if since is not None else None
+    if missed is None or len(missed) > manager.max_pending:
+        snapshot = get_state_snapshot()
+        manager.set_version(websocket, snapshot["version"])
+        await manager.send_to(websocket, snapshot)
+    else:
+        for event in missed:
+            await manager.send_to(websocket, event)
+        manager.set_version(websocket, missed[-1]["version"] if missed else since)
     try:
         while True:
-            await websocket.receive_text()  # Keep connection alive
-    except WebSocketDisconnect:
+            await websocket.receive_text()  # Any message, usually the answer to a ping, shows the client is alive
+            manager.received(websocket)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the manager already closed the socket of an evicted client
+        pass
+    finally:
         manager.disconnect(websocket)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    attach_event_loop()
+    if app.state.run_jukebox:
+        start_jukebox()
+    logging.info(f"CORS allowed_origins: {get_allowed_origins()}")
+    yield
+    event_bridge.detach()
+    if app.state.run_jukebox:
+        stop_jukebox()
+
+def create_app(run_jukebox: bool = True) -> FastAPI:
+    """
+    Build the API app. Building and importing it start nothing: the lifespan restores the queue and
+    starts the playback threads when the server starts, unless `run_jukebox` is False.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.state.run_jukebox = run_jukebox
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+app = create_app()
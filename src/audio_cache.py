@@ -0,0 +1,185 @@
+import os, re, time, hashlib, threading, logging, urllib.request
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from src.utils.singleflight import SingleFlight
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+class AudioCache:
+    """
+    Local copies of upcoming tracks, kept under a byte budget with least-recently-used eviction.
+
+    Downloads are streamed to a `.part` file in `chunk_size` pieces and renamed when complete, so
+    a file that `path_for` returns is always whole. googlevideo throttles long single requests,
+    so files are fetched with HTTP range requests of `range_size` bytes. A download that doesn't
+    add up to the size the server announced is thrown away.
+
+    `in_use` returns the video ids the player has open or queued; those are never evicted.
+    """
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024, chunk_size: int = 256 * 1024,
+                 range_size: int = 10 * 1024 * 1024, timeout: float = 30,
+                 in_use: Optional[Callable[[], Iterable[str]]] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.range_size = range_size
+        self.timeout = timeout
+        self.in_use = in_use
+        self._files = OrderedDict()  # video_id -> size, least recently used first
+        self._lock = threading.Lock()
+        self._downloads = SingleFlight()
+        self._scan()
+
+    def path_for(self, video_id: str) -> Optional[str]:
+        """Return the local file for `video_id` if it has been fully downloaded."""
+        video_id = self._key(video_id)
+        with self._lock:
+            if video_id not in self._files:
+                return None
+            path = self._path(video_id)
+            if not os.path.exists(path):
+                del self._files[video_id]
+                return None
+            self._files.move_to_end(video_id)
+            return path
+
+    def is_cached(self, video_id: str) -> bool:
+        video_id = self._key(video_id)
+        with self._lock:
+            return video_id in self._files
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(self._files.values())
+
+    def download(self, video_id: str, url: str) -> Optional[str]:
+        """Download `url` as the audio for `video_id`. Concurrent calls for one video share a download."""
+        existing = self.path_for(video_id)
+        if existing:
+            return existing
+        video_id = self._key(video_id)
+        return self._downloads.do(video_id, self._download, video_id, url)
+
+    def discard(self, video_id: str):
+        video_id = self._key(video_id)
+        with self._lock:
+            self._files.pop(video_id, None)
+            self._remove(self._path(video_id))
+
+    def _download(self, video_id: str, url: str) -> Optional[str]:
+        path = self._path(video_id)
+        part_path = path + ".part"
+        start = time.time()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(part_path, "wb") as f:
+                size = self._fetch_into(url, f)
+        except Exception as e:
+            logging.error(f"Failed to download audio for {video_id}: {e}")
+            self._remove(part_path)
+            return None
+        if size > self.max_bytes:
+            logging.warning(f"Audio for {video_id} is larger than the whole cache budget, not keeping it")
+            self._remove(part_path)
+            return None
+
+        with self._lock:
+            self._evict(self.max_bytes - size)
+            os.replace(part_path, path)
+            self._files[video_id] = size
+        logging.info(f"Downloaded audio for {video_id} ({size / 1024 / 1024:.1f} MiB in {time.time() - start:.1f}s)")
+        return path
+
+    def _fetch_into(self, url: str, f) -> int:
+        """
+        Stream `url` into the open file `f` with range requests and return the number of bytes written.
+        Raises IOError unless that is exactly the size from Content-Range (or Content-Length, when
+        the server ignores the range).
+        """
+        offset = 0
+        total = None
+        while total is None or offset < total:
+            request = urllib.request.Request(url, headers={
+                "User-Agent": USER_AGENT,
+                "Range": f"bytes={offset}-{offset + self.range_size - 1}",
+            })
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = getattr(response, "status", 200)
+                if status == 206:
+                    content_range = response.headers.get("Content-Range", "")
+                    match = re.match(r"bytes (\d+)-\d+/(\d+)", content_range)
+                    if not match or int(match.group(1)) != offset:
+                        raise IOError(f"Asked for bytes from {offset}, got Content-Range {content_range!r}")
+                    total = int(match.group(2))
+                elif offset == 0:
+                    # The server ignored the range and sends the whole file
+                    length = response.headers.get("Content-Length")
+                    total = int(length) if length and length.isdigit() else None
+                else:
+                    raise IOError(f"Range request from {offset} answered with status {status}")
+                received = 0
+                for chunk in iter(lambda: response.read(self.chunk_size), b""):
+                    f.write(chunk)
+                    received += len(chunk)
+                offset += received
+                if status != 206 or received == 0:
+                    break
+        if total is None:
+            raise IOError("The server didn't say how large the file is")
+        if offset != total:
+            raise IOError(f"Got {offset} of {total} bytes")
+        return offset
+
+    def _evict(self, budget: int):
+        """
+        Remove least recently used files until the cache fits in `budget` bytes, skipping the ones
+        in use. Caller holds the lock.
+        """
+        total = sum(self._files.values())
+        if total <= budget:
+            return
+        in_use = {self._key(video_id) for video_id in self.in_use() if video_id} if self.in_use else set()
+        for video_id in list(self._files):
+            if total <= budget:
+                break
+            if video_id in in_use:
+                continue
+            total -= self._files.pop(video_id)
+            self._remove(self._path(video_id))
+            logging.debug(f"Evicted cached audio for: {video_id}")
+
+    def _scan(self):
+        """Index files left by a previous run, oldest first, and drop unfinished downloads."""
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                self._remove(path)
+            elif name.endswith(".audio"):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name[:-len(".audio")], stat.st_size))
+        for _, video_id, size in sorted(found):
+            self._files[video_id] = size
+        self._evict(self.max_bytes)
+
+    @staticmethod
+    def _key(video_id: str) -> str:
+        """File-name safe key. YouTube ids are used as they are, anything else is hashed."""
+        if re.fullmatch(r"[A-Za-z0-9_-]+", video_id):
+            return video_id
+        return hashlib.sha1(video_id.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.audio")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Failed to remove {path}: {e}")
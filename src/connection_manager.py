@@ -0,0 +1,192 @@
+import os, json, time, asyncio, logging
+from collections import deque
+from typing import Optional
+
+from fastapi import WebSocket
+
+WS_MAX_PENDING = int(os.environ.get("JUKEBOX_WS_MAX_PENDING", 32))
+WS_SEND_TIMEOUT = float(os.environ.get("JUKEBOX_WS_SEND_TIMEOUT", 10))
+WS_HEARTBEAT_INTERVAL = float(os.environ.get("JUKEBOX_WS_HEARTBEAT_INTERVAL", 20))
+WS_IDLE_TIMEOUT = float(os.environ.get("JUKEBOX_WS_IDLE_TIMEOUT", 60))
+
+# Only the newest of these matters, so a client that is behind skips the older ones
+COALESCED_TYPES = {"progress", "ping"}
+
+class ClientConnection:
+    """
+    One websocket client with its own outbound queue and sender task.
+
+    Broadcasts only queue the already serialized message, so a slow client never holds up the
+    others. A pending message of a coalesced type is dropped when a newer one of its type arrives.
+    `version` is the newest event version the client has, older events aren't sent to it again.
+    """
+    def __init__(self, websocket: WebSocket, max_pending: int):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.connected_at = time.monotonic()
+        self.last_sent = None
+        self.last_received = self.connected_at
+        self.sent = 0
+        self.version = 0
+        self.coalesced = 0
+        self.task: Optional[asyncio.Task] = None
+        self._pending = deque()  # [type, text] cells, oldest first
+        self._latest = {}  # Coalesced type -> its pending cell
+        self._wakeup = asyncio.Event()
+
+    def offer(self, kind: str, text: str) -> bool:
+        """
+        Queue a serialized message.
+
+        Returns:
+            bool: False if the client is too far behind to take it.
+        """
+        cell = self._latest.pop(kind, None)
+        if cell is not None:
+            # Drop the stale one rather than overwrite it, so messages still go out in order
+            self._pending.remove(cell)
+            self.coalesced += 1
+        if len(self._pending) >= self.max_pending:
+            return False
+        cell = [kind, text]
+        self._pending.append(cell)
+        if kind in COALESCED_TYPES:
+            self._latest[kind] = cell
+        self._wakeup.set()
+        return True
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def send_pending(self, send_timeout: float):
+        """Send queued messages until cancelled. Raises if a send fails or takes too long."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                cell = self._pending.popleft()
+                if self._latest.get(cell[0]) is cell:
+                    del self._latest[cell[0]]
+                await asyncio.wait_for(self.websocket.send_text(cell[1]), send_timeout)
+                self.last_sent = time.monotonic()
+                self.sent += 1
+
+class ConnectionManager:
+    """
+    Fans messages out to the connected websocket clients.
+
+    Each message is serialized once per broadcast and handed to every client's own queue, so
+    `broadcast` never waits on the network. Clients whose queue overflows or whose send doesn't
+    finish within `send_timeout` are evicted. A heartbeat is sent every `heartbeat_interval`
+    seconds, which clients answer. Clients that haven't sent anything for `idle_timeout` seconds
+    died silently and are evicted at the next heartbeat.
+    """
+    def __init__(self, max_pending: int = WS_MAX_PENDING, send_timeout: float = WS_SEND_TIMEOUT,
+                 heartbeat_interval: float = WS_HEARTBEAT_INTERVAL, idle_timeout: float = WS_IDLE_TIMEOUT):
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.connections: dict = {}  # WebSocket -> ClientConnection
+        self.stats = {"broadcasts": 0, "evicted": 0}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @property
+    def active_connections(self) -> list:
+        return list(self.connections)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        connection = ClientConnection(websocket, self.max_pending)
+        connection.task = asyncio.create_task(self._sender(connection))
+        self.connections[websocket] = connection
+        if self.heartbeat_interval > 0 and (self._heartbeat_task is None or self._heartbeat_task.done()):
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.connections.pop(websocket, None)
+        if connection and connection.task and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+
+    async def broadcast(self, message: dict):
+        self.publish(message)
+
+    def publish(self, message: dict):
+        """Serialize `message` once and queue it for every client. Must run on the event loop."""
+        text = json.dumps(message)
+        kind = message.get("type", "")
+        version = message.get("version")
+        self.stats["broadcasts"] += 1
+        for websocket, connection in list(self.connections.items()):
+            if version is not None:
+                if version <= connection.version:
+                    continue  # Already covered by the snapshot or replay the client started from
+                connection.version = version
+            if not connection.offer(kind, text):
+                self._evict(connection, f"more than {self.max_pending} messages behind")
+
+    async def send_to(self, websocket: WebSocket, message: dict):
+        """Queue a message for one client only."""
+        connection = self.connections.get(websocket)
+        if connection and not connection.offer(message.get("type", ""), json.dumps(message)):
+            self._evict(connection, f"more than {self.max_pending} messages behind")
+
+    def received(self, websocket: WebSocket):
+        """Record that the client sent something, so it is still there."""
+        connection = self.connections.get(websocket)
+        if connection:
+            connection.last_received = time.monotonic()
+
+    def set_version(self, websocket: WebSocket, version: int):
+        """Record that the client is up to date as of event `version`."""
+        connection = self.connections.get(websocket)
+        if connection:
+            connection.version = version
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "connections": len(self.connections),
+            "pending": sum(connection.pending for connection in self.connections.values()),
+            "coalesced": sum(connection.coalesced for connection in self.connections.values()),
+        }
+
+    async def _sender(self, connection: ClientConnection):
+        try:
+            await connection.send_pending(self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._evict(connection, f"send took longer than {self.send_timeout}s")
+        except Exception as e:
+            self._evict(connection, f"send failed: {e}")
+
+    def _evict(self, connection: ClientConnection, reason: str):
+        if self.connections.get(connection.websocket) is not connection:
+            return
+        logging.info(f"Dropping websocket client: {reason}")
+        self.stats["evicted"] += 1
+        self.disconnect(connection.websocket)
+        asyncio.ensure_future(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        # The client may be gone or stuck, don't wait on it for long
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        while self.connections:
+            await asyncio.sleep(self.heartbeat_interval)
+            self._evict_idle()
+            self.publish({"type": "ping", "at": time.time()})
+
+    def _evict_idle(self):
+        if self.idle_timeout <= 0:
+            return
+        now = time.monotonic()
+        for connection in list(self.connections.values()):
+            if now - connection.last_received > self.idle_timeout:
+                self._evict(connection, f"nothing received for {self.idle_timeout:g}s")
@@ -0,0 +1,159 @@
+import os, time, uuid, asyncio, threading, logging
+from collections import deque
+from itertools import islice
+from typing import Callable, Optional
+
+EVENT_LOG_SIZE = int(os.environ.get("JUKEBOX_EVENT_LOG_SIZE", 1000))
+
+class EventLog:
+    """
+    Numbered log of state changes (song_added, song_removed, now_playing, paused, ...).
+
+    Every event gets the next `version`. The newest `max_events` events are kept, so a client
+    that reconnects with the last version it saw can be sent just the events it missed.
+    `epoch` changes on every start, since versions from an earlier run mean nothing to this one.
+    Events may be appended from any thread. Subscribers are called in version order, under the
+    log's lock, so they must hand the event off rather than do any work of their own.
+    """
+    def __init__(self, max_events: int = EVENT_LOG_SIZE):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self._events = deque(maxlen=max_events)
+        self._type_versions = {}  # Event type -> version of its newest event
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def append(self, kind: str, **data) -> dict:
+        """Record an event and pass it to the subscribers. Returns the event."""
+        with self._lock:
+            self.version += 1
+            event = {"type": kind, "version": self.version, "at": time.time(), **data}
+            self._events.append(event)
+            self._type_versions[kind] = self.version
+            for subscriber in self._subscribers:
+                subscriber(event)
+            return event
+
+    def since(self, version: int, epoch: Optional[str] = None) -> Optional[list]:
+        """
+        Events newer than `version`, oldest first.
+
+        Returns:
+            list or None: None if they can't be replayed (the gap is older than the log, or the
+            version is from another run), in which case the client needs a full snapshot.
+        """
+        with self._lock:
+            if (epoch is not None and epoch != self.epoch) or version > self.version or version < 0:
+                return None
+            missed = self.version - version
+            if missed > len(self._events):
+                return None
+            return list(islice(self._events, len(self._events) - missed, None))
+
+    def last_version(self, *kinds: str) -> int:
+        """Version of the newest event of any of these types, 0 if there was none yet."""
+        with self._lock:
+            return max((self._type_versions.get(kind, 0) for kind in kinds), default=0)
+
+    def subscribe(self, subscriber: Callable[[dict], None]):
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: Callable[[dict], None]):
+        with self._lock:
+            try:
+                self._subscribers.remove(subscriber)
+            except ValueError:
+                pass
+
+class LoopBridge:
+    """
+    Hands messages from any thread to `deliver` on an asyncio loop.
+
+    A burst of messages posted before the loop gets to them costs a single `call_soon_threadsafe`
+    wakeup, and they are delivered in the order they were posted. Messages posted while no loop
+    is attached are dropped.
+    """
+    def __init__(self, deliver: Callable[[dict], None]):
+        self.deliver = deliver
+        self.loop = None
+        self._pending = deque()
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def attach(self, loop):
+        with self._lock:
+            if loop is not self.loop:
+                # A drain scheduled on the old loop will never run
+                self._pending.clear()
+                self._scheduled = False
+            self.loop = loop
+
+    def detach(self):
+        with self._lock:
+            self.loop = None
+            self._pending.clear()
+            self._scheduled = False
+
+    def __call__(self, message: dict):
+        with self._lock:
+            loop = self.loop
+            if loop is None or loop.is_closed():
+                return
+            self._pending.append(message)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # The loop closed in the meantime
+            self.detach()
+
+    def _drain(self):
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            self._scheduled = False
+        for message in batch:
+            try:
+                self.deliver(message)
+            except Exception as e:
+                logging.error(f"Failed to deliver {message.get('type')} message: {e}")
+
+class ChangeWaiters:
+    """
+    Lets requests on the event loop wait until some state has changed.
+    Call `check` from the loop whenever something may have changed (e.g. after every event).
+    """
+    def __init__(self):
+        self._waiters = set()
+
+    async def wait(self, changed: Callable[[], bool], timeout: float) -> bool:
+        """
+        Wait until `changed()` is true, for at most `timeout` seconds.
+
+        Returns:
+            bool: False if it timed out.
+        """
+        if changed():
+            return True
+        waiter = (changed, asyncio.get_running_loop().create_future())
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters.discard(waiter)
+
+    def check(self):
+        for changed, future in list(self._waiters):
+            if not future.done() and changed():
+                future.set_result(None)
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+events = EventLog()
@@ -0,0 +1,175 @@
+import threading, logging, multiprocessing, concurrent.futures, concurrent.futures.process
+from typing import Optional
+
+EXTRACTION_MODES = ("thread", "process")
+
+class ExtractionError(Exception):
+    """yt-dlp failed in a worker process. yt-dlp's own errors can't be pickled back to the parent."""
+
+# Best-effort yt-dlp options for highest-quality audio extraction
+YDL_OPTS = {
+    'format': 'bestaudio[ext=m4a]/bestaudio/best',
+    'quiet': True,
+    'skip_download': True,
+    'retries': 5,
+    'socket_timeout': 30,
+    'nocheckcertificate': True,
+    'no_warnings': True,
+    'source_address': '0.0.0.0',
+    'cookiefile': None,
+    'extract_flat': False,
+    'writethumbnail': False,
+    'writeinfojson': False,
+}
+
+def choose_best_format(info: dict) -> Optional[str]:
+    """
+    Given yt-dlp info dict, pick the best audio stream URL available.
+    Prefer direct 'url' if present; otherwise inspect 'formats' for highest bitrate audio.
+    """
+    if not info:
+        return None
+
+    if 'url' in info and not info.get('is_live', False):
+        return info['url']
+
+    formats = info.get('formats') or info.get('requested_formats') or []
+    if not formats:
+        return None
+
+    audio_formats = []
+    for f in formats:
+        if not f.get('url'):
+            continue
+        acodec = f.get('acodec')
+        if acodec and acodec != 'none':
+            audio_formats.append(f)
+        else:
+            if f.get('abr') or f.get('tbr'):
+                audio_formats.append(f)
+
+    if not audio_formats:
+        return None
+
+    def score(f):
+        return (
+            float(f.get('abr') or f.get('tbr') or 0.0),
+            float(f.get('filesize') or 0)
+        )
+    best = max(audio_formats, key=score)
+    return best.get('url')
+
+def summarize_info(info: dict) -> Optional[dict]:
+    """Reduce a yt-dlp info dict to the few fields the jukebox uses (cheap to pass between processes)."""
+    stream_url = choose_best_format(info)
+    if not stream_url:
+        return None
+    return {
+        "stream_url": stream_url,
+        "id": info.get("id"),
+        "title": info.get("title"),
+        "duration": int(info.get("duration") or 0),
+        "author": info.get("uploader") or info.get("channel"),
+        "webpage_url": info.get("webpage_url"),
+    }
+
+def new_youtube_dl(opts: Optional[dict] = None):
+    import yt_dlp  # Imported on first use, it is slow to import
+    return yt_dlp.YoutubeDL(opts or YDL_OPTS)
+
+def list_playlist(url: str) -> list:
+    """
+    List a playlist's videos with one request, without extracting them.
+
+    Returns:
+        list: {"id", "title", "duration", "author"} dicts in playlist order.
+    """
+    with new_youtube_dl({**YDL_OPTS, "extract_flat": "in_playlist"}) as ydl:
+        info = ydl.extract_info(url, download=False)
+    videos = []
+    for entry in (info or {}).get("entries") or []:
+        if entry and entry.get("id"):
+            videos.append({
+                "id": entry["id"],
+                "title": entry.get("title"),
+                "duration": int(entry.get("duration") or 0),
+                "author": entry.get("uploader") or entry.get("channel"),
+            })
+    return videos
+
+# Warm YoutubeDL instance of a process-pool worker, created by _init_process_worker
+_process_ydl = None
+
+def _init_process_worker(opts: dict):
+    global _process_ydl
+    _process_ydl = new_youtube_dl(opts)
+
+def _extract_in_process(url: str) -> Optional[dict]:
+    global _process_ydl
+    try:
+        return summarize_info(_process_ydl.extract_info(url, download=False))
+    except Exception as e:
+        # Don't reuse an instance that failed half way through an extraction
+        _process_ydl = new_youtube_dl(_process_ydl.params)
+        raise ExtractionError(str(e)) from None
+
+class ExtractionService:
+    """
+    Runs yt-dlp extractions on warm YoutubeDL instances.
+
+    In "thread" mode the extraction runs on the calling thread with a YoutubeDL instance kept per
+    thread, so extractor registration and setup happen once per thread instead of once per song.
+    In "process" mode extractions run in a pool of `workers` processes that each keep their own
+    instance, which moves info-dict parsing and signature work off the API's interpreter.
+    """
+    def __init__(self, opts: Optional[dict] = None, mode: str = "thread", workers: int = 2, timeout: float = 120):
+        if mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode {mode!r}, expected one of {EXTRACTION_MODES}")
+        self.opts = opts or YDL_OPTS
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def extract(self, url: str) -> Optional[dict]:
+        """Extract a video and return its summary (see summarize_info), or None if it has no usable stream."""
+        if self.mode == "process":
+            try:
+                return self._process_pool().submit(_extract_in_process, url).result(timeout=self.timeout)
+            except concurrent.futures.process.BrokenProcessPool:
+                self.shutdown()  # A worker died, start a new pool on the next call
+                raise
+
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            ydl = self._local.ydl = new_youtube_dl(self.opts)
+        try:
+            return summarize_info(ydl.extract_info(url, download=False))
+        except Exception:
+            self._local.ydl = None  # Start from a fresh instance after a failure
+            raise
+
+    def extract_url(self, url: str) -> Optional[str]:
+        summary = self.extract(url)
+        return summary["stream_url"] if summary else None
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _process_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                logging.info(f"Starting {self.workers} extraction worker processes")
+                # spawn instead of fork, forking a process that runs threads isn't safe
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker,
+                    initargs=(self.opts,)
+                )
+            return self._pool
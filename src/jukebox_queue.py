@@ -0,0 +1,258 @@
+import time, json, threading, logging
+from collections import OrderedDict
+from typing import Optional
+
+from src.song import Song
+from src.queue_journal import QueueJournal
+
+class QueueEntry:
+    """A song in the queue. `id` stays the same while the song is queued, whatever moves around it."""
+    __slots__ = ("id", "song", "search_prompt", "added_at")
+
+    def __init__(self, entry_id: int, song: Song, search_prompt: str = "", added_at: Optional[float] = None):
+        self.id = entry_id
+        self.song = song
+        self.search_prompt = search_prompt
+        self.added_at = added_at or time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.song.name,
+            "author": self.song.author,
+            "duration": self.song.duration,
+            "url": self.song.url,
+            "search_prompt": self.search_prompt or None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QueueEntry":
+        song = Song(data["name"], data["url"], data["duration"], data["author"])
+        return cls(data["id"], song, data.get("search_prompt") or "", data.get("added_at"))
+
+class JukeboxQueue:
+    """
+    The song queue, with stable entry ids, O(1) lookup and removal by id, and a version number.
+
+    It uses `condition`'s lock for everything and notifies the condition on every change, so the
+    scanner and the prefetcher can keep sleeping on the same condition they always have.
+    It keeps the parts of queue.Queue the jukebox relies on (put, get, empty, qsize and `queue`).
+
+    Every change bumps `version`. `snapshot()` and `snapshot_json()` are rebuilt at most once per
+    version, so the API can serve the queue repeatedly without copying it under the lock.
+
+    With a `journal`, the queue is restored from it on creation and every change is logged to it.
+    Listeners added with `add_listener` get every change as the same dict the journal records,
+    called under the lock in the order the changes happen.
+    """
+    def __init__(self, condition: Optional[threading.Condition] = None, journal: Optional[QueueJournal] = None):
+        self.condition = condition or threading.Condition()
+        self.version = 0
+        self._entries = OrderedDict()  # entry id -> QueueEntry, in play order
+        self._by_video = {}  # video id -> {entry id: None}, for duplicate checks
+        self._next_id = 1
+        self._journal = journal
+        self._listeners = []
+        self._snapshot_thread = None
+        self._songs = None  # Caches, valid for `_cached_version`
+        self._snapshot = None
+        self._snapshot_json = None
+        self._cached_version = -1
+        if journal:
+            self.attach_journal(journal)
+
+    def put(self, song: Song, search_prompt: str = "") -> int:
+        """Add a song to the end of the queue and return its entry id."""
+        with self.condition:
+            entry = QueueEntry(self._next_id, song, search_prompt)
+            self._next_id += 1
+            self._add(entry)
+            self._log({"op": "add", "id": entry.id, "entry": self._entry_record(entry)})
+            self._changed()
+            return entry.id
+
+    def put_many(self, items: list) -> list:
+        """Add (song, search_prompt) pairs to the end of the queue, in order and next to each other. Returns their entry ids."""
+        with self.condition:
+            ids = []
+            for song, search_prompt in items:
+                entry = QueueEntry(self._next_id, song, search_prompt)
+                self._next_id += 1
+                self._add(entry)
+                self._log({"op": "add", "id": entry.id, "entry": self._entry_record(entry)})
+                ids.append(entry.id)
+            if ids:
+                self._changed()
+            return ids
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Song:
+        """Remove and return the song at the head of the queue, waiting for one if `block` is set."""
+        with self.condition:
+            if block and not self.condition.wait_for(lambda: self._entries, timeout):
+                raise IndexError("get from an empty JukeboxQueue")
+            if not self._entries:
+                raise IndexError("get from an empty JukeboxQueue")
+            entry_id = next(iter(self._entries))
+            return self._remove(entry_id).song
+
+    def get_nowait(self) -> Song:
+        return self.get(block=False)
+
+    def peek(self) -> Optional[QueueEntry]:
+        with self.condition:
+            return next(iter(self._entries.values()), None)
+
+    def remove(self, entry_id: int) -> Optional[QueueEntry]:
+        """Remove an entry by id. Returns the removed entry, or None if it isn't queued."""
+        with self.condition:
+            if entry_id not in self._entries:
+                return None
+            return self._remove(entry_id)
+
+    def move(self, entry_id: int, position: int) -> bool:
+        """
+        Move an entry to `position` (0 is the head, out of range positions are clamped).
+
+        Returns:
+            bool: False if the entry isn't queued.
+        """
+        with self.condition:
+            if entry_id not in self._entries:
+                return False
+            position = max(0, min(position, len(self._entries) - 1))
+            if position == 0:
+                self._entries.move_to_end(entry_id, last=False)
+            elif position == len(self._entries) - 1:
+                self._entries.move_to_end(entry_id)
+            else:
+                order = [key for key in self._entries if key != entry_id]
+                order.insert(position, entry_id)
+                self._entries = OrderedDict((key, self._entries[key]) for key in order)
+            self._log({"op": "move", "id": entry_id, "position": position})
+            self._changed()
+            return True
+
+    def entry(self, entry_id: int) -> Optional[QueueEntry]:
+        with self.condition:
+            return self._entries.get(entry_id)
+
+    def contains_video(self, video_id: str) -> bool:
+        with self.condition:
+            return video_id in self._by_video
+
+    def clear(self):
+        with self.condition:
+            self._entries.clear()
+            self._by_video.clear()
+            self._log({"op": "clear"})
+            self._changed()
+
+    def empty(self) -> bool:
+        with self.condition:
+            return not self._entries
+
+    def qsize(self) -> int:
+        with self.condition:
+            return len(self._entries)
+
+    def __len__(self) -> int:
+        return self.qsize()
+
+    @property
+    def queue(self) -> tuple:
+        """The queued songs in play order, like queue.Queue's `queue` attribute (read-only here)."""
+        with self.condition:
+            self._refresh_cache()
+            return self._songs
+
+    def snapshot(self) -> list:
+        """The queue as a list of entry dicts. Shared between callers, don't modify it."""
+        with self.condition:
+            self._refresh_cache()
+            return self._snapshot
+
+    def snapshot_json(self) -> str:
+        with self.condition:
+            self._refresh_cache()
+            if self._snapshot_json is None:
+                self._snapshot_json = json.dumps(self._snapshot)
+            return self._snapshot_json
+
+    def _add(self, entry: QueueEntry):
+        self._entries[entry.id] = entry
+        self._by_video.setdefault(entry.song.video_id, {})[entry.id] = None
+
+    def _remove(self, entry_id: int) -> QueueEntry:
+        entry = self._entries.pop(entry_id)
+        ids = self._by_video.get(entry.song.video_id)
+        if ids is not None:
+            ids.pop(entry_id, None)
+            if not ids:
+                del self._by_video[entry.song.video_id]
+        self._log({"op": "remove", "id": entry_id})
+        self._changed()
+        return entry
+
+    def attach_journal(self, journal: QueueJournal):
+        """Restore the queue from `journal` and log every change to it from now on. Do it before queueing anything."""
+        with self.condition:
+            if self._entries:
+                raise RuntimeError("The journal must be attached before songs are queued")
+            self._journal = journal
+            self._restore()
+            self._changed()
+
+    def snapshot_journal(self):
+        """Write a journal snapshot now, e.g. before shutting down."""
+        if self._journal:
+            self._write_journal_snapshot()
+
+    def add_listener(self, listener):
+        with self.condition:
+            self._listeners.append(listener)
+
+    def _log(self, op: dict):
+        for listener in self._listeners:
+            try:
+                listener(op)
+            except Exception as e:
+                logging.error(f"Queue listener failed: {e}")
+        if self._journal and self._journal.record(op):
+            # Copying and writing the whole queue happens off the mutating thread
+            if self._snapshot_thread is None or not self._snapshot_thread.is_alive():
+                self._snapshot_thread = threading.Thread(target=self._write_journal_snapshot, daemon=True)
+                self._snapshot_thread.start()
+
+    def _write_journal_snapshot(self):
+        with self.condition:
+            entries = list(self._entries.values())
+            next_id = self._next_id
+            generation = self._journal.start_generation()
+        self._journal.write_snapshot(generation, next_id, [self._entry_record(entry) for entry in entries])
+
+    def _restore(self):
+        records, next_id = self._journal.load()
+        for record in records:
+            try:
+                self._add(QueueEntry.from_dict(record))
+            except (KeyError, TypeError) as e:
+                logging.warning(f"Skipping unreadable queue entry {record!r}: {e}")
+        self._next_id = max(next_id, max(self._entries, default=0) + 1)
+
+    @staticmethod
+    def _entry_record(entry: QueueEntry) -> dict:
+        record = entry.to_dict()
+        record["added_at"] = entry.added_at
+        return record
+
+    def _changed(self):
+        self.version += 1
+        self.condition.notify_all()
+
+    def _refresh_cache(self):
+        if self._cached_version != self.version:
+            entries = list(self._entries.values())
+            self._songs = tuple(entry.song for entry in entries)
+            self._snapshot = [entry.to_dict() for entry in entries]
+            self._snapshot_json = None  # Serialized on first use
+            self._cached_version = self.version
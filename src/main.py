@@ -1,17 +1,73 @@
-from pytubefix import Search
 from datetime import datetime, timedelta
-import time, threading, shutil, sys, subprocess, platform, queue, logging
+import time, threading, shutil, sys, subprocess, platform, logging, argparse
 import json, os
+from typing import Optional
 
-from src.utils.logger import write_current_song
-from src.song import Song
-from src.media_scanner import scan_queue, prefetch_audio_urls
+from src.song import Song, video_id_from_prompt, playlist_id_from_prompt
+from src.jukebox_queue import JukeboxQueue
+from src.queue_journal import QueueJournal
+from src.event_log import events
+from src import media_scanner, metrics
+from src.media_scanner import scan_queue, prefetch_audio_urls, current_song_mirror
+from src.search_cache import SearchCache
+from src.speculation import SpeculativePrefetcher
+from src.request_pipeline import BulkEnqueuer
+from src.extractor import list_playlist
+from src.utils.singleflight import SingleFlight
 
-song_queue = queue.Queue() # Use a python Queue instead of a list
-queue_condition = threading.Condition() 
+# Queue changes are journaled so a restart or crash picks the queue back up where it was
+QUEUE_JOURNAL_DIR = os.path.join(os.path.dirname(__file__), "logs")
+QUEUE_SNAPSHOT_EVERY = int(os.environ.get("JUKEBOX_QUEUE_SNAPSHOT_EVERY", 500))
+QUEUE_FSYNC = bool(int(os.environ.get("JUKEBOX_QUEUE_FSYNC", 0)))
+queue_journal = None  # Opened by start_jukebox
+
+queue_condition = threading.Condition()
+song_queue = JukeboxQueue(queue_condition) # Shares the condition's lock, so waiters on it see every change. start_jukebox attaches the journal
+
+# Queue changes as they appear in the websocket event stream
+QUEUE_EVENTS = {"add": "song_added", "remove": "song_removed", "move": "song_moved", "clear": "queue_cleared"}
+
+def publish_queue_change(op: dict):
+    """Turn a queue change into an event for the websocket clients."""
+    events.append(QUEUE_EVENTS[op["op"]], **{key: value for key, value in op.items() if key != "op"})
+
+song_queue.add_listener(publish_queue_change)
+metrics.queue_depth.set_function(song_queue.qsize)
 
 clean_mode = False
 
+# pytubefix is slow to import, _search_youtube imports it on the first search
+Search = None
+
+# Resolved searches are cached in memory and in SQLite so repeat prompts skip YouTube entirely
+SEARCH_CACHE_PATH = os.path.join(os.path.dirname(__file__), "logs", "search_cache.sqlite3")
+SEARCH_CACHE_TTL = float(os.environ.get("JUKEBOX_SEARCH_CACHE_TTL", 7 * 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("JUKEBOX_SEARCH_CACHE_MAX_ENTRIES", 5000))
+search_cache = None  # Created by get_search_cache on first use
+_search_cache_lock = threading.Lock()
+
+def get_search_cache() -> SearchCache:
+    global search_cache
+    if search_cache is None:
+        with _search_cache_lock:
+            if search_cache is None:
+                search_cache = SearchCache(SEARCH_CACHE_PATH, max_disk_entries=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL)
+    return search_cache
+
+# Identical prompts searched at the same time share one YouTube round trip
+search_flight = SingleFlight()
+
+# Whole result pages for /search, so asking again or picking from them costs no extra search
+SEARCH_CANDIDATES_TTL = float(os.environ.get("JUKEBOX_SEARCH_CANDIDATES_TTL", 3600))
+candidate_cache = SearchCache(None, ttl=SEARCH_CANDIDATES_TTL)
+# The stream of the first candidate is resolved while the user is still choosing
+SPECULATIVE_PREFETCH = bool(int(os.environ.get("JUKEBOX_SPECULATIVE_PREFETCH", 1)))
+SPECULATION_WAIT = float(os.environ.get("JUKEBOX_SPECULATION_WAIT", 10))  # How long a pick waits for its stream
+
+# Bulk requests (lists of prompts, playlists) are resolved this many at a time
+BULK_WORKERS = int(os.environ.get("JUKEBOX_BULK_WORKERS", 4))
+BULK_MAX_ITEMS = int(os.environ.get("JUKEBOX_BULK_MAX_ITEMS", 500))
+
 def set_clean_mode(value: bool):
     global clean_mode
     clean_mode = value
@@ -25,27 +81,112 @@ logging.basicConfig(
 # dont skip if no songs in cache
 
 # TODO - current song should be cleared when the program starts, in case the program ended before the currently playing song did.
-# TODO - Add a way to request a song with a Youtube URL
 # TODO - Add a recently played songs that displays up to the 10 last recently played songs
 # TODO - On the frontend add a check next to the song in the queue if its ready to be played
 
 
-def search_song(search_prompt: str, restricted: bool = False, retries: int = 3, delay: float = 1.0) -> tuple[str, str, int, str]:
+def search_song(search_prompt: str, restricted: bool = False, retries: int = 3, delay: float = 1.0, use_cache: bool = True) -> tuple[str, str, int, str]:
     """
     Finds a respective video on youtube and returns the title, link, duration and author.
     Use the retries and delays if your internet connection is poor, defaults should be okay though.
+    Concurrent calls for the same prompt and clean mode share a single search.
     
     Args:
         search_prompt (str): The search query.
         retries (int): Number of retry attempts on failure.
         delay (float): Delay between retries in seconds.
+        use_cache (bool): Look the prompt up in the search cache first and store new results in it.
 
     Returns:
         tuple: (song_link, song_name, song_duration, song_author)
     """
     if not search_prompt:
         raise ValueError("Search prompt cannot be empty")
-    
+
+    started = time.perf_counter()
+    try:
+        if use_cache:
+            cached = get_search_cache().get(search_prompt, restricted)
+            if cached:
+                logging.info(f"Search cache hit for '{search_prompt}'")
+                return cached
+
+        key = get_search_cache().make_key(search_prompt, restricted)
+        result = search_flight.do(key, _search_youtube, search_prompt, restricted, retries, delay)
+        if use_cache and result[0]:
+            get_search_cache().put(search_prompt, restricted, result)
+        return result
+    finally:
+        metrics.search_seconds.observe(time.perf_counter() - started)
+
+def search_candidates(search_prompt: str, restricted: bool = False, limit: int = 5, retries: int = 3, delay: float = 1.0) -> list:
+    """
+    Finds up to `limit` videos for a prompt, best match first. The whole result page is cached
+    per prompt and clean mode, so asking again, or for more, doesn't search again.
+
+    Returns:
+        list: (song_link, song_name, song_duration, song_author) tuples, empty if nothing was found.
+    """
+    if not search_prompt:
+        raise ValueError("Search prompt cannot be empty")
+
+    page = candidate_cache.get(search_prompt, restricted)
+    if page is None:
+        key = "page:" + candidate_cache.make_key(search_prompt, restricted)
+        page = search_flight.do(key, _search_youtube_page, search_prompt, restricted, retries, delay)
+        if page is None:
+            return []  # The search failed, try again next time
+        candidate_cache.put(search_prompt, restricted, page)
+        if page:
+            # Requesting the prompt itself is a cache hit from now on
+            get_search_cache().put(search_prompt, restricted, page[0])
+    return list(page[:limit])
+
+def _fetch_speculative_url(song: Song) -> Optional[str]:
+    if media_scanner.is_stream_ready(song):
+        return None  # Already resolved, nothing to do
+    return media_scanner.extract_audio_url(song)
+
+def _store_speculative_url(song: Song, url: str):
+    media_scanner.get_stream_cache().put(song.video_id, url)
+
+speculative_prefetcher = SpeculativePrefetcher(_fetch_speculative_url, _store_speculative_url)
+
+def resolve_direct_request(prompt: str) -> Optional[Song]:
+    """
+    Get the song for a prompt that is a YouTube URL or video id without searching: one extraction
+    gives both the song and its stream URL, and a candidate picked from /search needs none at all.
+    Clean mode doesn't apply, the video was asked for by name.
+
+    Returns:
+        Song or None: None if the prompt isn't a video, or the video couldn't be extracted,
+        in which case the prompt should be searched for instead.
+    """
+    video_id = video_id_from_prompt(prompt)
+    if video_id is None:
+        return None
+    # A candidate from /search is already known, and its stream may be resolved already
+    song = speculative_prefetcher.pick(video_id, timeout=SPECULATION_WAIT)
+    if song is not None:
+        return song
+    return media_scanner.extract_song(video_id)
+
+def _search_youtube(search_prompt: str, restricted: bool, retries: int, delay: float) -> tuple[str, str, int, str]:
+    """Run the actual pytubefix search for search_song, see it for the arguments."""
+    page = _search_youtube_page(search_prompt, restricted, retries, delay)
+    return page[0] if page else (None, None, None, None)
+
+def _search_youtube_page(search_prompt: str, restricted: bool, retries: int, delay: float) -> Optional[tuple]:
+    """
+    Search YouTube and keep the whole first page of results.
+
+    Returns:
+        tuple or None: (song_link, song_name, song_duration, song_author) tuples in result order,
+        or None if the search itself failed.
+    """
+    global Search
+    if Search is None:
+        from pytubefix import Search
     if restricted:
         search_prompt = f'{search_prompt} clean'
     attempt = 0
@@ -59,43 +200,94 @@ def search_song(search_prompt: str, restricted: bool = False, retries: int = 3,
             if attempt < retries:
                 time.sleep(delay)
             else:
-                return None, None, None, None
-    
-    if not results.videos:
-        return None, None, None, None
-    
-    #print("Results for search query:")
-    #for video in results.videos:
-    #    print(f"Title: {video.title}")
-    #    print(f"Url: {video.watch_url}")
-    #    print(f'Duration: {video.length} sec')
-    #    print('---')
-    
-    first_video = results.videos[0]
-    song_name = first_video.title
-    song_link = first_video.watch_url
-    song_duration = first_video.length
-    song_author = first_video.author
-    #song_released = first_video.publish_date
-    return song_link, song_name, song_duration, song_author
-
-def add_song_to_queue(song: Song, search_prompt: str = ""):
+                return None
+    return tuple((video.watch_url, video.title, video.length, video.author) for video in results.videos)
+
+def find_song(prompt: str, restricted: bool = False) -> Optional[Song]:
+    """Get the song for a prompt, from its URL or video id if it is one, otherwise by searching for it."""
+    requested_at = time.time()
+    song = resolve_direct_request(prompt)
+    if song is None:
+        song_url, song_name, song_duration, song_author = search_song(prompt, restricted=restricted)
+        if not song_url:
+            return None
+        song = Song(song_name, song_url, song_duration, song_author)
+    song.requested_at = requested_at  # For the time until it is heard
+    return song
+
+def playlist_songs(playlist_id: str) -> list:
+    """The songs of a YouTube playlist in playlist order, listed with one request. Their streams are resolved once queued."""
+    songs = []
+    for video in list_playlist(f"https://www.youtube.com/playlist?list={playlist_id}"):
+        url = f"https://www.youtube.com/watch?v={video['id']}"
+        songs.append(Song(video["title"] or url, url, video["duration"], video["author"] or "Unknown"))
+    return songs
+
+def expand_prompts(prompts: list) -> list:
+    """Replace the YouTube playlist URLs in a list of prompts with the playlists' songs, the other prompts stay as they are."""
+    entries = []
+    for prompt in prompts:
+        playlist_id = playlist_id_from_prompt(prompt)
+        if playlist_id:
+            entries.extend(playlist_songs(playlist_id))
+        else:
+            entries.append(prompt)
+    return entries
+
+def add_song_to_queue(song: Song, search_prompt: str = "") -> int:
     """
     Adds a song to the queue.
     
     Args:
         song (Song): The song to add to queue.
         search_prompt (str): Optional search prompt to log with the queued song.
+
+    Returns:
+        int: The queue entry id of the song.
     """
     logging.info(f"[{datetime.now()}] Adding song to queue {song.name} by {song.author} (Duration: {timedelta(seconds=song.duration)})")
     from src.utils.logger import write_queued_song  # Import here to avoid circular imports
     # Log the queued song (do not touch currently_playing.json here)
     write_queued_song(song, search_prompt, active=False)
     
-    with queue_condition:
-        song_queue.put(song)  # Use put instead of append for Queue objects
-        queue_condition.notify()  # Notify the media_scanner that there's a new song in the queue
+    if song.requested_at is None:
+        song.requested_at = time.time()
+    # put() notifies queue_condition, waking the media_scanner and the prefetcher
+    return song_queue.put(song, search_prompt)
         
+def add_songs_to_queue(items: list) -> list:
+    """
+    Adds several songs to the queue in order, with a single history write.
+
+    Args:
+        items (list): (song, search_prompt) pairs.
+
+    Returns:
+        list: The queue entry ids of the songs.
+    """
+    logging.info(f"[{datetime.now()}] Adding {len(items)} songs to queue")
+    from src.utils.logger import write_queued_songs  # Import here to avoid circular imports
+    write_queued_songs(items)
+    now = time.time()
+    for song, _ in items:
+        if song.requested_at is None:
+            song.requested_at = now
+    return song_queue.put_many(items)
+
+def queue_from_file(path: str, restricted: bool = False):
+    """Queue the prompts and playlist URLs in a file, one per line, in order. Blank lines and lines starting with # are skipped."""
+    with open(path, "r") as f:
+        prompts = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    def report(bulk: dict, item: dict):
+        if item["status"] in ("queued", "not_found", "failed"):
+            logging.info(f"[{bulk['queued'] + bulk['not_found'] + bulk['failed']}/{bulk['total']}] {item['prompt']}: {item['status']}")
+    enqueuer = BulkEnqueuer(find_song, add_songs_to_queue, workers=BULK_WORKERS, max_items=BULK_MAX_ITEMS, on_update=report)
+    bulk = enqueuer.submit(expand_prompts(prompts), restricted)
+    bulk.finished.wait()
+    enqueuer.shutdown()
+    result = bulk.to_dict(items=False)
+    logging.info(f"Queued {result['queued']} of {result['total']} songs from {path}")
+
 def is_vlc_installed() -> bool:
     """Checks if VLC is installed and available in PATH."""
     return shutil.which("vlc") is not None
@@ -104,9 +296,40 @@ def start_scanner():
     """Starts the Media Scanner which scans the queue and plays the added songs."""
     scan_queue(song_queue, queue_condition)
 
-threading.Thread(target=prefetch_audio_urls, args=(song_queue, queue_condition), daemon=True).start()
-scanner_thread = threading.Thread(target=start_scanner, daemon=True)
-scanner_thread.start()
+# Set by start_jukebox, importing this module starts nothing
+scanner_thread = None
+prefetch_thread = None
+_start_lock = threading.Lock()
+
+def start_jukebox():
+    """
+    Restore the queue from its journal and start the prefetch and scanner threads.
+    Only the first call does anything, the API server calls it from its lifespan and the CLI on start.
+    """
+    global scanner_thread, prefetch_thread, queue_journal
+    with _start_lock:
+        if scanner_thread is not None:
+            return
+        queue_journal = QueueJournal(QUEUE_JOURNAL_DIR, snapshot_every=QUEUE_SNAPSHOT_EVERY, fsync=QUEUE_FSYNC)
+        song_queue.attach_journal(queue_journal)
+        # Nothing is playing yet, clear whatever the last run left in currently_playing.json
+        current_song_mirror.schedule(None)
+        prefetch_thread = threading.Thread(target=prefetch_audio_urls, args=(song_queue, queue_condition), daemon=True)
+        prefetch_thread.start()
+        scanner_thread = threading.Thread(target=start_scanner, daemon=True)
+        scanner_thread.start()
+
+def stop_jukebox():
+    """Write what is pending to disk and stop the player. The threads are daemons and end with the process."""
+    if scanner_thread is None:
+        return
+    song_queue.snapshot_journal()
+    current_song_mirror.flush()
+    media_scanner.get_stream_cache().flush()
+    try:
+        media_scanner.get_player().shutdown()
+    except Exception as e:
+        logging.error(f"Failed to stop the player: {e}")
 
 
 
@@ -139,8 +362,6 @@ scanner_thread.start()
 # else:
 #     logging.info("Vlc Installed Already.")
 
-write_current_song(None)
-
 def get_clean_mode():
     path = os.path.join(os.path.dirname(__file__), "logs", "current_restriction_mode.json")
     try:
@@ -151,10 +372,18 @@ def get_clean_mode():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the jukebox from the command line.")
+    parser.add_argument("--from-file", help="Queue the prompts and playlist URLs in this file, one per line, before asking for more")
+    args = parser.parse_args()
+    start_jukebox()
+    if args.from_file:
+        queue_from_file(args.from_file, restricted=get_clean_mode())
     while True:
         song_search_prompt = input("\nSearch for a song > ")
         clean_mode = get_clean_mode()
-        song_url, song_name, song_duration, song_author = search_song(song_search_prompt, restricted=clean_mode)
-        song = Song(song_name, song_url, song_duration, song_author)
-        add_song_to_queue(song)
-        time.sleep(1)  # Wait until the song starts playing
\ No newline at end of file
+        song = find_song(song_search_prompt, restricted=clean_mode)
+        if song is None:
+            logging.error(f"No results for '{song_search_prompt}'")
+            continue
+        add_song_to_queue(song, song_search_prompt)
+        time.sleep(1)  # Wait until the song starts playing
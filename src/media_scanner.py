@@ -1,191 +1,175 @@
-from src.utils.logger import write_current_song, write_played_song
-import yt_dlp, subprocess, sys, time, logging, concurrent.futures, os, shutil
-from collections import OrderedDict
+from src.utils.logger import write_played_song, current_song_data, DebouncedJsonWriter, CURRENT_SONG
+import subprocess, sys, time, logging, os, pathlib
 import threading
+from collections import deque
 from typing import Optional
 
 from src.song import Song
-
-# Global variables
-vlc_process = None
-logfile_handle = None
-current_playing_song = None
-song_end_time = None  # Track when current song should end
-is_paused = False  # Add pause state tracking
-
-# Thread-safe LRU cache for extracted audio URLs
-CACHE_SIZE = 5
-audio_url_cache = OrderedDict()
-cache_lock = threading.Lock()
-in_progress_extractions = set()
-in_progress_lock = threading.Lock()
-
-# Best-effort yt-dlp options for highest-quality audio extraction
-ydl_opts = {
-    'format': 'bestaudio[ext=m4a]/bestaudio/best',
-    'quiet': True,
-    'skip_download': True,
-    'retries': 5,
-    'socket_timeout': 30,
-    'nocheckcertificate': True,
-    'no_warnings': True,
-    'source_address': '0.0.0.0',
-    'cookiefile': None,
-    'extract_flat': False,
-    'writethumbnail': False,
-    'writeinfojson': False,
-}
-
-# VLC volume settings (256 == 100% in VLC RC). Clamp to reasonable maximum.
-MAX_VLC_VOLUME = 384  # 150% volume (256 == 100%)
+from src.stream_cache import StreamUrlCache
+from src.prefetcher import Prefetcher
+from src.extractor import ExtractionService, EXTRACTION_MODES
+from src.audio_cache import AudioCache
+from src.player import create_player
+from src.utils.singleflight import SingleFlight
+from src.event_log import events
+from src import metrics
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s: %(message)s'
 )
 
-def send_vlc_command(command: str) -> bool:
-    """
-    Send a command to the current VLC Process RC interface.
-    """
-    global vlc_process
-    if vlc_process and vlc_process.poll() is None and vlc_process.stdin:
-        try:
-            vlc_process.stdin.write((command + '\n').encode())
-            vlc_process.stdin.flush()
-            logging.debug(f"Sent VLC command: {command}")
-            return True
-        except Exception as e:
-            logging.error(f"Failed to send VLC command: {e}")
-            return False
-    logging.debug("VLC process not available to send command")
-    return False
-
-def find_vlc_binary() -> Optional[str]:
-    """Return path to VLC binary for current platform, or None if not found."""
-    if sys.platform.startswith('linux'):
-        return shutil.which("cvlc") or shutil.which("vlc")
-    elif sys.platform == 'darwin':
-        # Prefer installed CLI wrapper first, then bundle binary
-        return shutil.which("vlc") or "/Applications/VLC.app/Contents/MacOS/VLC"
-    elif sys.platform.startswith('win'):
-        return shutil.which("vlc")
-    return None
-
-def ensure_vlc_running() -> bool:
-    """Make sure VLC is running and restart it if needed."""
-    global vlc_process, logfile_handle
-
-    if vlc_process and vlc_process.poll() is None:
-        return True
-
-    if vlc_process:
-        try:
-            vlc_process.terminate()
-            vlc_process.wait(timeout=2)
-        except (subprocess.TimeoutExpired, Exception):
-            vlc_process.kill()
-        vlc_process = None
-    
-    if logfile_handle and not logfile_handle.closed:
-        logfile_handle.close()
-        logfile_handle = None
-
-    vlc_cmd = find_vlc_binary()
-    if not vlc_cmd:
-        logging.error("VLC binary not found on PATH or expected locations.")
-        return False
-    if not os.path.exists(vlc_cmd) and not shutil.which(vlc_cmd):
-        logging.error(f"VLC binary not accessible: {vlc_cmd}")
-        return False
-
-    cmd = [
-        vlc_cmd,
-        '--intf', 'rc',
-        '--rc-fake-tty',
-        '--no-video',
-        '--audio-time-stretch',
-        '--audio-filter=compressor:normvol',
-        '--gain=2.0',
-        '--sout-keep',
-        '--no-loop',
-        '--no-repeat',
-        '--play-and-exit'
-    ]
-
-    env = None
-    if sys.platform.startswith('linux'):
-        # Try multiple audio output methods for better compatibility
-        audio_outputs = ['pulse', 'alsa', 'oss']
-        for aout in audio_outputs:
-            test_cmd = cmd + ['--aout', aout, '--intf', 'dummy', '--play-and-exit', '--run-time=1']
-            try:
-                test_process = subprocess.run(test_cmd, capture_output=True, timeout=5)
-                if test_process.returncode == 0:
-                    cmd.extend(['--aout', aout])
-                    logging.info(f"Using audio output: {aout}")
-                    break
-            except (subprocess.TimeoutExpired, Exception):
-                continue
-        else:
-            # Fallback to ALSA if nothing works
-            cmd.extend(['--aout', 'alsa'])
-            logging.warning("Using ALSA as fallback audio output")
-            
-        env = os.environ.copy()
-        # Set up environment for audio access
-        env.setdefault('PULSE_LATENCY_MSEC', '60')
-        env.setdefault('ALSA_PCM_CARD', '0')
-        env.setdefault('ALSA_PCM_DEVICE', '0')
-
-    try:
-        logging.info(f"Starting VLC process using: {vlc_cmd}")
-        vlc_process = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env
-        )
-        time.sleep(1.5)
-        # Ensure no looping/repeat is enabled
-        send_vlc_command('loop off')
-        send_vlc_command('repeat off')
-        set_vlc_volume(MAX_VLC_VOLUME)
-        logging.info("VLC process started successfully.")
-        return True
-    except Exception as e:
-        logging.error(f"Failed to start VLC: {e}")
-        return False
-
-def set_vlc_volume(volume: int) -> bool:
-    """Clamp and set VLC RC volume (256 == 100%)."""
-    vol = max(0, min(int(volume), MAX_VLC_VOLUME))
-    if ensure_vlc_running():
-        return send_vlc_command(f'volume {vol}')
-    return False
+# Global variables
+current_playing_song = None
+is_paused = False  # Add pause state tracking
+playback_lock = threading.RLock()  # Guards the playback state above against the API threads
+
+# The player backend: "rc" (VLC subprocess), "libvlc" (in-process, needs python-vlc) or "fake" (no audio)
+PLAYER_BACKEND = os.environ.get("JUKEBOX_PLAYER", "rc")
+player = None  # Created by get_player on first use
+
+# The scanner sleeps on the queue condition and is woken by queue changes and by player events,
+# so it does no work while idle or while a song plays.
+scanner_condition = None  # The queue condition, set once scan_queue runs
+player_events = deque()  # (kind, value, time) posted by the player backend
+awaiting_input = False  # True until the player reports the track we just started, older stop events are stale
+played_seconds = 0.0  # Play time of the current song before the last pause
+resumed_at = None  # When the current song last started or resumed playing, None while paused
+
+START_TIMEOUT = 20  # Seconds a track may take to start before it is given up on
+END_GRACE = 10  # Seconds past the song's duration before it is ended without an end-of-media event
+
+# Gapless handoff: shortly before a song ends, the next one is enqueued in the player so it moves on
+# by itself instead of waiting for the scanner to clear and re-add its playlist.
+GAPLESS_LEAD = int(os.environ.get("JUKEBOX_GAPLESS_LEAD", 15))  # Seconds before the end, 0 disables it
+HANDOFF_RETRY = 1.0  # How often to check again if the next song's audio isn't ready yet
+next_song = None  # (song, mrl) enqueued in the player behind the current song
+handoff_retry_at = 0.0
+last_track_end = None  # When the previous track stopped, to measure the gap before the next one starts
+last_handoff_gapless = False
+# Websocket clients get the play position this often while a song plays, and extrapolate in between
+PROGRESS_INTERVAL = float(os.environ.get("JUKEBOX_PROGRESS_INTERVAL", 5))  # 0 disables the periodic updates
+next_progress_at = 0.0
+playback_stats = {"transitions": 0, "gapless_transitions": 0, "last_gap": None, "max_gap": None, "total_gap": 0.0}
+
+# Authoritative now-playing snapshot served by the API.
+# currently_playing.json is only a debounced mirror of it for external readers.
+now_playing = None
+now_playing_lock = threading.Lock()
+current_song_mirror = DebouncedJsonWriter(CURRENT_SONG, delay=0.5)
+
+# Extracted stream URLs, keyed by video id and kept on disk until they expire
+STREAM_CACHE_PATH = os.path.join(os.path.dirname(__file__), "logs", "stream_cache.json")
+STREAM_CACHE_SIZE = int(os.environ.get("JUKEBOX_STREAM_CACHE_SIZE", 20))
+PREFETCH_AHEAD = int(os.environ.get("JUKEBOX_PREFETCH_AHEAD", 5))  # How many queued songs to resolve ahead of time
+PREFETCH_WORKERS = int(os.environ.get("JUKEBOX_PREFETCH_WORKERS", 3))
+STREAM_URL_MARGIN = 60  # A URL must stay valid this long past the end of the song to be played from cache
+stream_cache = None  # Loaded by get_stream_cache on first use
+prefetcher = None  # Set once prefetch_audio_urls starts
+# Audio of the next few songs is downloaded so playback doesn't depend on Wi-Fi at play time
+AUDIO_CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache", "audio")
+AUDIO_CACHE_BYTES = int(os.environ.get("JUKEBOX_AUDIO_CACHE_MB", 512)) * 1024 * 1024
+AUDIO_PREFETCH_AHEAD = int(os.environ.get("JUKEBOX_AUDIO_PREFETCH_AHEAD", 2))  # 0 disables downloads
+audio_cache = None  # Indexed by get_audio_cache on first use
+# yt-dlp runs on warm instances, either per thread or in a pool of worker processes
+EXTRACTION_MODE = os.environ.get("JUKEBOX_EXTRACTION_MODE", "thread")
+if EXTRACTION_MODE not in EXTRACTION_MODES:
+    logging.warning(f"Unknown JUKEBOX_EXTRACTION_MODE {EXTRACTION_MODE!r}, expected one of {EXTRACTION_MODES}, using thread")
+    EXTRACTION_MODE = "thread"
+EXTRACTION_WORKERS = int(os.environ.get("JUKEBOX_EXTRACTION_WORKERS", 2))
+extraction_service = ExtractionService(mode=EXTRACTION_MODE, workers=EXTRACTION_WORKERS)
+# Concurrent extractions of the same video (prefetch and playback) share one yt-dlp call
+extraction_flight = SingleFlight()
+
+# Importing this module must not start the player or touch logs/ and cache/, so these are only
+# created on first use. Tests and benchmarks may assign the module-level names directly.
+_init_lock = threading.Lock()
+
+def get_player():
+    global player
+    if player is None:
+        with _init_lock:
+            if player is None:
+                player = create_player(PLAYER_BACKEND)
+    return player
+
+def get_stream_cache() -> StreamUrlCache:
+    global stream_cache
+    if stream_cache is None:
+        with _init_lock:
+            if stream_cache is None:
+                stream_cache = StreamUrlCache(STREAM_CACHE_PATH, max_entries=STREAM_CACHE_SIZE)
+    return stream_cache
+
+def get_audio_cache() -> AudioCache:
+    global audio_cache
+    if audio_cache is None:
+        with _init_lock:
+            if audio_cache is None:
+                audio_cache = AudioCache(AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_BYTES, in_use=_audio_in_use)
+    return audio_cache
+
+def _audio_in_use() -> list:
+    """Video ids whose cached audio the player may be reading: the current song and the one enqueued behind it."""
+    playing, enqueued = current_playing_song, next_song
+    return [song.video_id for song in (playing, enqueued and enqueued[0]) if song]
 
 def pause_playback():
-    global is_paused
-    if ensure_vlc_running():
-        send_vlc_command('pause')
-        is_paused = not is_paused  # Toggle pause state
-        # Update the current song with new pause status
-        if current_playing_song:
-            write_current_song(current_playing_song, active=True, paused=is_paused)
+    global is_paused, played_seconds, resumed_at
+    if get_player().is_running():
+        get_player().toggle_pause()
+        with playback_lock:
+            is_paused = not is_paused  # Toggle pause state
+            # Stop the song's clock while paused so the end-of-song fallback doesn't fire early
+            if is_paused and resumed_at is not None:
+                played_seconds += time.time() - resumed_at
+                resumed_at = None
+            elif not is_paused and current_playing_song:
+                resumed_at = time.time()
+            # Update the current song with new pause status
+            if current_playing_song:
+                set_now_playing(current_playing_song, active=True, paused=is_paused)
+            events.append("paused", paused=is_paused)
+            _publish_progress()
         logging.info(f"Toggled pause/play - now {'paused' if is_paused else 'playing'}")
 
 def skip_playback():
-    global current_playing_song, song_end_time, is_paused
-    if ensure_vlc_running():
-        send_vlc_command('stop')  # Use stop to clear current song
-        send_vlc_command('clear')  # Clear the entire playlist
-        # Clear current song state immediately
-        current_playing_song = None
-        song_end_time = None
-        is_paused = False  # Reset pause state
-        write_current_song(None, active=False, paused=False)
-        logging.info("Skipped current song")
+    """
+    Skip the current song. Only the scanner thread changes the playback state, so while it runs
+    the skip is handed to it like a player event; otherwise there is nothing to race with.
+    """
+    if not get_player().is_running():
+        return
+    if scanner_condition is None:
+        _skip(current_playing_song)
+    else:
+        _post_player_event("skip", current_playing_song)
+
+def _skip(song: Optional[Song]):
+    """Stop the player and forget `song` and the one enqueued behind it, unless another song is current by now."""
+    with playback_lock:
+        if song is not None and current_playing_song is not song:
+            logging.info(f"Not skipping {song.name}, it already ended")
+            return
+        get_player().stop()  # Stops the current song and clears the playlist
+        _finish_current_song()
+    logging.info("Skipped current song")
+
+def set_now_playing(song: Optional[Song], active: bool = False, paused: bool = False):
+    """Update the now-playing snapshot and schedule a write of its JSON mirror."""
+    global now_playing
+    data = current_song_data(song, active, paused)
+    with now_playing_lock:
+        if data is None and now_playing is None:
+            return  # The idle scanner clears this repeatedly, don't rewrite the mirror each time
+        now_playing = data
+    current_song_mirror.schedule(data)
+    events.append("now_playing", song=data)
+
+def get_now_playing() -> Optional[dict]:
+    """Return a copy of the now-playing snapshot, or None when nothing is playing."""
+    with now_playing_lock:
+        return dict(now_playing) if now_playing else None
 
 def get_pause_status():
     """Get the current pause status."""
@@ -197,143 +181,342 @@ def get_current_playing_song():
     global current_playing_song
     return current_playing_song
 
-def _cache_put(song: Song, url: str):
-    """Insert into LRU cache with eviction."""
-    with cache_lock:
-        if song in audio_url_cache:
-            audio_url_cache.move_to_end(song)
-            audio_url_cache[song] = url
-        else:
-            audio_url_cache[song] = url
-            if len(audio_url_cache) > CACHE_SIZE:
-                evicted_song, _ = audio_url_cache.popitem(last=False)
-                logging.debug(f"Evicted cached URL for: {getattr(evicted_song, 'name', evicted_song)}")
-
 def prefetch_audio_urls(queue, queue_condition):
-    """Prefetch audio URLs for upcoming songs in the queue."""
+    """Prefetch audio URLs for upcoming songs in the queue. Blocks, run it on its own thread."""
+    global prefetcher
     logging.info("Starting URL prefetch thread")
-    while True:
-        try:
-            with queue_condition:
-                to_prefetch = list(queue.queue)[:CACHE_SIZE]
-            
-            if to_prefetch:
-                logging.debug(f"Prefetching URLs for up to {len(to_prefetch)} songs")
-                with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                    futures = []
-                    for song in to_prefetch:
-                        with cache_lock:
-                            cached = song in audio_url_cache
-                        with in_progress_lock:
-                            already_in_progress = song in in_progress_extractions
-                        if not cached and not already_in_progress:
-                            with in_progress_lock:
-                                in_progress_extractions.add(song)
-                            futures.append(executor.submit(extract_and_cache_url, song))
-                    if futures:
-                        concurrent.futures.wait(futures, timeout=30)
-            time.sleep(1)
-        except Exception as e:
-            logging.error(f"Error in prefetch thread: {e}")
-            time.sleep(2)
+    prefetcher = Prefetcher(
+        queue, queue_condition,
+        fetch=prefetch_song,
+        needs_fetch=song_needs_prefetch,
+        ahead=PREFETCH_AHEAD,
+        workers=PREFETCH_WORKERS
+    )
+    prefetcher.run()
+
+def song_needs_prefetch(song: Song, position: int) -> bool:
+    """True if the song at `position` in the queue still needs a fresh stream URL or a local download."""
+    if position < AUDIO_PREFETCH_AHEAD and get_audio_cache().is_cached(song.video_id):
+        return False
+    if get_stream_cache().needs_refresh(song.video_id):
+        return True
+    return position < AUDIO_PREFETCH_AHEAD
+
+def prefetch_song(song: Song, position: int):
+    """Resolve the stream URL for a queued song and, near the head of the queue, download its audio."""
+    if get_stream_cache().needs_refresh(song.video_id):
+        extract_and_cache_url(song)
+    if position < AUDIO_PREFETCH_AHEAD and not get_audio_cache().is_cached(song.video_id):
+        url = get_stream_cache().get(song.video_id)
+        if url:
+            get_audio_cache().download(song.video_id, url)
 
 def extract_and_cache_url(song: Song):
     """Extract and cache audio URL for a song (non-blocking callers should use prefetch)."""
     try:
         url = extract_audio_url(song)
         if url:
-            _cache_put(song, url)
+            get_stream_cache().put(song.video_id, url)
             logging.info(f"Cached URL for: {song.name}")
+            events.append("song_ready", url=song.url)
         else:
             logging.error(f"Failed to extract URL for: {song.name}")
+            events.append("extraction_failed", url=song.url, name=song.name)
     except Exception as e:
         logging.error(f"Prefetch error for {song.name}: {e}")
-    finally:
-        with in_progress_lock:
-            in_progress_extractions.discard(song)
+        events.append("extraction_failed", url=song.url, name=song.name)
 
-def _choose_best_format(info: dict) -> Optional[str]:
-    """
-    Given yt-dlp info dict, pick the best audio stream URL available.
-    Prefer direct 'url' if present; otherwise inspect 'formats' for highest bitrate audio.
-    """
-    if not info:
-        return None
-
-    if 'url' in info and not info.get('is_live', False):
-        return info['url']
+def is_stream_ready(song: Song) -> bool:
+    """True if the song's stream URL is cached and not about to expire."""
+    return not get_stream_cache().needs_refresh(song.video_id)
 
-    formats = info.get('formats') or info.get('requested_formats') or []
-    if not formats:
-        return None
-
-    audio_formats = []
-    for f in formats:
-        if not f.get('url'):
-            continue
-        acodec = f.get('acodec')
-        if acodec and acodec != 'none':
-            audio_formats.append(f)
-        else:
-            if f.get('abr') or f.get('tbr'):
-                audio_formats.append(f)
+def extract_song(video_id: str) -> Optional[Song]:
+    """
+    Build the Song for a YouTube video from a single extraction, for requests by URL or video id.
+    The stream URL from the same extraction is cached, so the song is ready to play once queued.
 
-    if not audio_formats:
+    Returns:
+        Song or None: None if the video couldn't be extracted.
+    """
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    started = time.perf_counter()
+    try:
+        summary = extraction_service.extract(url)
+    except Exception as e:
+        logging.error(f"Failed to extract {url}: {e}")
+        summary = None
+    metrics.extraction_seconds.observe(time.perf_counter() - started)
+    if not summary:
+        metrics.extraction_failures.inc()
+        logging.error(f"No stream found for {url}")
         return None
-
-    def score(f):
-        return (
-            float(f.get('abr') or f.get('tbr') or 0.0),
-            float(f.get('filesize') or 0)
-        )
-    best = max(audio_formats, key=score)
-    return best.get('url')
+    song = Song(summary["title"] or url, url, summary["duration"], summary["author"] or "Unknown")
+    get_stream_cache().put(song.video_id, summary["stream_url"])
+    logging.info(f"Extracted {song.name} and its stream URL in one go")
+    return song
 
 def extract_audio_url(song: Song) -> Optional[str]:
-    """Extract direct audio URL from a YouTube (or supported) video using yt-dlp."""
-    for attempt in range(3):
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(song.url, download=False)
-                url = _choose_best_format(info)
+    """
+    Extract direct audio URL from a YouTube (or supported) video using yt-dlp.
+    If the same video is already being extracted, wait for that result instead.
+    """
+    return extraction_flight.do(song.video_id, _extract_audio_url, song)
+
+def _extract_audio_url(song: Song) -> Optional[str]:
+    started = time.perf_counter()
+    try:
+        for attempt in range(3):
+            if attempt:
+                metrics.extraction_retries.inc()
+            try:
+                url = extraction_service.extract_url(song.url)
                 if url:
                     logging.info(f"Extracted stream URL for {song.name}")
                     return url
                 else:
-                    logging.debug(f"No direct stream URL found in info for {song.name}: keys={list(info.keys()) if isinstance(info, dict) else 'N/A'}")
-            time.sleep(1 + attempt)
-        except Exception as e:
-            logging.error(f"Error extracting URL (attempt {attempt+1}/3) for {song.name}: {e}")
-            time.sleep(1 + attempt)
-    return None
+                    logging.debug(f"No direct stream URL found for {song.name}")
+                time.sleep(1 + attempt)
+            except Exception as e:
+                logging.error(f"Error extracting URL (attempt {attempt+1}/3) for {song.name}: {e}")
+                time.sleep(1 + attempt)
+        metrics.extraction_failures.inc()
+        return None
+    finally:
+        metrics.extraction_seconds.observe(time.perf_counter() - started)
+
+def _song_elapsed() -> float:
+    """
+    Seconds into the current song. Uses the player's reported position once it is playing the song,
+    otherwise the scanner's own clock of the time it has been playing, not counting pauses.
+    """
+    with playback_lock:
+        elapsed = get_player().status.elapsed() if current_playing_song and not awaiting_input else None
+        if elapsed is not None:
+            return elapsed
+        if resumed_at is None:
+            return played_seconds
+        return played_seconds + time.time() - resumed_at
+
+def _song_deadline() -> Optional[float]:
+    """Seconds until the current song should be given up on, or None if there is nothing to time."""
+    with playback_lock:
+        if not current_playing_song or is_paused:
+            return None
+        if awaiting_input:
+            limit = START_TIMEOUT
+        else:
+            limit = (current_playing_song.duration or 0) + END_GRACE
+        return limit - _song_elapsed()
 
 def _is_song_finished() -> bool:
-    """Check if the current song has finished playing based on duration tracking."""
-    global song_end_time, current_playing_song
-    
-    if not current_playing_song or not song_end_time:
+    """Fallback end-of-song check for when the player never reports one: the song ran past its duration."""
+    if not current_playing_song:
         return True
-    
-    current_time = time.time()
-    return current_time >= song_end_time
+    deadline = _song_deadline()
+    return deadline is not None and deadline <= 0
 
 def _check_vlc_status() -> str:
-    """Check VLC playback status by sending 'status' command and reading response."""
-    global vlc_process
-    
-    if not vlc_process or vlc_process.poll() is not None:
+    """Return the playback state the player last reported ("playing", "paused" or "stopped")."""
+    if not get_player().is_running():
         return "stopped"
-    
-    try:
-        # Send status command
-        if send_vlc_command('status'):
-            # Try to read some output to check status
-            # This is a best-effort approach since VLC RC interface can be inconsistent
-            return "unknown"  # We'll rely on duration tracking instead
-    except Exception:
-        pass
-    
-    return "unknown"
+    return get_player().status.state
+
+def get_playback_position(refresh: bool = True) -> dict:
+    """
+    Elapsed and remaining seconds of the current song.
+    Uses the player's reported position when there is one, otherwise the scanner's own play clock.
+
+    Args:
+        refresh (bool): Ask the player for its position first instead of extrapolating the last one.
+    """
+    if refresh:
+        get_player().refresh()
+    with playback_lock:
+        song = current_playing_song
+        if not song:
+            return {"elapsed": None, "remaining": None}
+        elapsed = _song_elapsed()
+        length = (get_player().status.length if not awaiting_input else None) or song.duration
+    return {
+        "elapsed": round(elapsed, 1),
+        "remaining": round(max(length - elapsed, 0.0), 1) if length else None,
+    }
+
+def _publish_progress():
+    """Publish the play position for websocket clients and schedule the next periodic update."""
+    global next_progress_at
+    next_progress_at = time.time() + PROGRESS_INTERVAL
+    events.append("progress", **get_playback_position(refresh=False))
+
+def _progress_in() -> Optional[float]:
+    """Seconds until the next periodic progress update, or None while there is nothing to report."""
+    with playback_lock:
+        if PROGRESS_INTERVAL <= 0 or not current_playing_song or is_paused or awaiting_input:
+            return None
+    return next_progress_at - time.time()
+
+def _post_player_event(kind: str, value=None, at: Optional[float] = None):
+    """Hand a player event to the scanner. Called on the player backend's threads."""
+    condition = scanner_condition
+    if condition is None:
+        return
+    with condition:
+        player_events.append((kind, value, at or time.time()))
+        condition.notify_all()
+
+def _finish_current_song(ended_at: Optional[float] = None):
+    """Forget the current song (and anything enqueued behind it) and clear the now-playing state."""
+    global current_playing_song, is_paused, awaiting_input, played_seconds, resumed_at, next_song, last_track_end
+    with playback_lock:
+        if current_playing_song and not awaiting_input:
+            last_track_end = ended_at or time.time()
+        current_playing_song = None
+        next_song = None
+        is_paused = False  # Reset pause state
+        awaiting_input = False
+        played_seconds = 0.0
+        resumed_at = None
+        set_now_playing(None, active=False, paused=False)
+
+def _handle_player_event(kind: str, value, at: float) -> bool:
+    """
+    Apply one player event to the playback state. Runs on the scanner thread.
+
+    Returns:
+        bool: True if the player moved on to the song enqueued behind the current one.
+    """
+    global awaiting_input
+    with playback_lock:
+        if not current_playing_song:
+            return False
+        if kind == "state" and value == "playing":
+            started = awaiting_input
+            if started:
+                _record_gap(at)
+                if current_playing_song.requested_at is not None:
+                    metrics.first_audio_seconds.observe(max(0.0, at - current_playing_song.requested_at))
+                    current_playing_song.requested_at = None
+            awaiting_input = False
+            if started:
+                _publish_progress()  # The song really started, clients can start their clocks
+        elif kind == "new_input":
+            if next_song and not awaiting_input:
+                return True  # The current song ended and the player started the next one by itself
+        elif kind == "state" and value == "stopped" and not awaiting_input:
+            if next_song:
+                return True  # The player plays the enqueued song next, no need to touch the playlist
+            logging.info(f"Song finished: {current_playing_song.name}")
+            _finish_current_song(at)
+        elif kind == "exit":
+            logging.warning(f"The player exited while playing {current_playing_song.name}")
+            _finish_current_song()
+    return False
+
+def _ready_source(song: Song) -> Optional[str]:
+    """The local file or cached stream URL to play `song` from, or None if it would need an extraction first."""
+    # A finished download beats any stream URL, it doesn't depend on the network at all
+    local_path = get_audio_cache().path_for(song.video_id)
+    if local_path:
+        logging.info(f"Using the local audio cache for {song.name}")
+        return pathlib.Path(local_path).resolve().as_uri()
+    return get_stream_cache().get(song.video_id, min_valid_for=(song.duration or 0) + STREAM_URL_MARGIN)
+
+def _count_play_source(mrl: Optional[str]):
+    """Count whether a song about to play was prefetched (downloaded or stream cached) or needs extracting now."""
+    if not mrl:
+        metrics.play_sources.inc(1, "extracted")
+    elif mrl.startswith("file:"):
+        metrics.play_sources.inc(1, "audio_cache")
+    else:
+        metrics.play_sources.inc(1, "stream_cache")
+
+def _handoff_in() -> Optional[float]:
+    """Seconds until the next song should be enqueued behind the current one, or None if not now."""
+    with playback_lock:
+        if (not GAPLESS_LEAD or not current_playing_song or not current_playing_song.duration
+                or is_paused or awaiting_input or next_song):
+            return None
+        return max(current_playing_song.duration - GAPLESS_LEAD - _song_elapsed(), handoff_retry_at - time.time())
+
+def _enqueue_next(queue, queue_condition) -> bool:
+    """Enqueue the song at the head of the queue in the player if its audio is ready. Returns True if it was."""
+    global next_song, handoff_retry_at
+    with queue_condition:
+        head = queue.queue[0] if queue.qsize() else None
+    if head is None:
+        return False
+    mrl = _ready_source(head)
+    if not mrl or not get_player().enqueue(mrl, head.duration):
+        logging.debug(f"{head.name} isn't ready for a gapless handoff yet")
+        handoff_retry_at = time.time() + HANDOFF_RETRY
+        return False
+    _count_play_source(mrl)
+    with playback_lock:
+        next_song = (head, mrl)
+    logging.info(f"Enqueued {head.name} behind the current song")
+    return True
+
+def _start_next_song(queue, queue_condition, at: float):
+    """
+    The player moved on to the enqueued song: take it off the queue and make it the current song.
+    If it was removed or moved back in the meantime, stop it so the scanner starts the new head of the queue.
+    """
+    global current_playing_song, is_paused, awaiting_input, played_seconds, resumed_at
+    global next_song, last_track_end, last_handoff_gapless
+    song, _ = next_song
+    with queue_condition:
+        still_next = queue.qsize() and queue.queue[0] is song
+        if still_next:
+            queue.get()
+        queue_condition.notify_all()  # The head of the queue moved, let the prefetcher look further ahead
+    if not still_next:
+        # The players can't take back an enqueued track, so it is stopped as soon as it starts
+        logging.info(f"{song.name} left the front of the queue after it was enqueued in the player, skipping it")
+        get_player().stop()
+        logging.info(f"Song finished: {current_playing_song.name}")
+        _finish_current_song(at)
+        return
+
+    with playback_lock:
+        logging.info(f"Song finished: {current_playing_song.name}")
+        last_track_end = at
+        last_handoff_gapless = True
+        current_playing_song = song
+        next_song = None
+        is_paused = False
+        awaiting_input = True  # Until the player reports it playing, a stop event still belongs to the old song
+        played_seconds = 0.0
+        resumed_at = at
+    write_played_song(song)
+    set_now_playing(song, active=True, paused=False)
+    logging.info(f"Now playing: {song.name}")
+
+def _record_gap(started_at: float):
+    """Record the silence between the previous track stopping and the current one starting. Caller holds playback_lock."""
+    global last_track_end
+    if last_track_end is None:
+        return
+    gap = max(0.0, started_at - last_track_end)
+    last_track_end = None
+    playback_stats["transitions"] += 1
+    if last_handoff_gapless:
+        playback_stats["gapless_transitions"] += 1
+    playback_stats["last_gap"] = gap
+    playback_stats["max_gap"] = max(gap, playback_stats["max_gap"] or 0.0)
+    playback_stats["total_gap"] += gap
+    metrics.track_gap_seconds.observe(gap)
+    logging.info(f"Track transition took {gap:.2f}s ({'gapless' if last_handoff_gapless else 'restart'})")
+
+def get_playback_stats() -> dict:
+    """Gap measurements between consecutive tracks, in seconds."""
+    with playback_lock:
+        stats = dict(playback_stats)
+    transitions = stats.pop("total_gap")
+    stats["average_gap"] = transitions / stats["transitions"] if stats["transitions"] else None
+    stats["gapless_lead"] = GAPLESS_LEAD
+    stats["player"] = get_player().name
+    stats.update(get_player().startup_stats)
+    return stats
 
 def test_audio_system():
     """Test if audio system is accessible and working."""
@@ -362,106 +545,123 @@ def test_audio_system():
     return False
 
 def scan_queue(queue, queue_condition):
-    """Main function that scans the queue and plays songs."""
-    global vlc_process, current_playing_song, song_end_time, is_paused
+    """
+    Main function that scans the queue and plays songs.
+    It sleeps until the queue changes, the player reports a state change or the current song overruns.
+    """
+    global scanner_condition, last_track_end
 
-    logging.info("Starting queue scanner thread")
+    logging.info(f"Starting queue scanner thread with the {get_player().name} player")
+    scanner_condition = queue_condition
+    get_player().on_event = _post_player_event
     
     # Test audio system first
-    if not test_audio_system():
+    if get_player().uses_audio_hardware and not test_audio_system():
         logging.error("Audio system not accessible - check user permissions and audio group membership")
     
     while True:
         try:
-            # Check if current song has finished
+            with queue_condition:
+                handoff = _handoff_in()
+                # Song time runs faster than wall time in the fake player
+                timeouts = [t / get_player().status.rate for t in (_song_deadline(), handoff) if t is not None]
+                progress = _progress_in()
+                if progress is not None:
+                    timeouts.append(progress)
+                queue_condition.wait_for(
+                    lambda: player_events or (current_playing_song is None and not queue.empty())
+                            or (handoff is not None and handoff <= 0 and not queue.empty()),
+                    timeout=max(min(timeouts), 0) if timeouts else None
+                )
+                posted = list(player_events)
+                player_events.clear()
+
+            for kind, value, at in posted:
+                if kind == "skip":
+                    _skip(value)
+                elif _handle_player_event(kind, value, at):
+                    _start_next_song(queue, queue_condition, at)
+
             if current_playing_song and _is_song_finished():
+                # The player never reported the end (or never started the track), don't wait any longer
                 logging.info(f"Song finished: {current_playing_song.name}")
-                # Ensure VLC playlist is cleared when song finishes
-                if ensure_vlc_running():
-                    send_vlc_command('stop')
-                    send_vlc_command('clear')
-                current_playing_song = None
-                song_end_time = None
-                is_paused = False  # Reset pause state
-                write_current_song(None, active=False, paused=False)
-            
-            # If a song is currently playing, wait
-            if current_playing_song and not _is_song_finished():
-                time.sleep(0.5)
-                continue
-            
-            # If no song is playing, check if there's a song in the queue to play
-            if queue.empty():
-                if current_playing_song is None:
-                    write_current_song(None, active=False, paused=False)
-                    # Ensure VLC is stopped and cleared when no songs are queued
-                    if ensure_vlc_running():
-                        send_vlc_command('stop')
-                        send_vlc_command('clear')
-                time.sleep(1)
-                continue
-
-            # Get next song from queue
-            with queue_condition:
-                song_to_play = queue.get()
-            
-            logging.info(f"Preparing to play: {song_to_play.name}")
-
-            # Immediately write the song as the next one to play, but not yet active.
-            write_current_song(song_to_play, active=False, paused=False)
-
-            if not ensure_vlc_running():
-                logging.error("Failed to ensure VLC is running, retrying in 5 seconds")
-                # Put the song back in the queue
-                with queue_condition:
-                    queue.put(song_to_play)
-                time.sleep(5)
-                continue
-
-            with cache_lock:
-                stream_url = audio_url_cache.pop(song_to_play, None)
-
-            if not stream_url:
-                logging.info(f"No cached URL for {song_to_play.name}, extracting now...")
-                stream_url = extract_audio_url(song_to_play)
-
-            if not stream_url:
-                logging.error(f"Failed to get URL for {song_to_play.name}, skipping")
-                write_current_song(None, active=False, paused=False)
-                continue
-
-            # Clear any existing playlist and add only the new song
-            send_vlc_command('clear')
-            time.sleep(0.1)  # Small delay to ensure clear command is processed
-            
-            if send_vlc_command(f'add {stream_url}'):
-                # Ensure the song starts playing
-                send_vlc_command('play')
-                
-                # Update state AFTER successfully adding to VLC
-                current_playing_song = song_to_play
-                song_end_time = time.time() + song_to_play.duration + 3  # Add 3 second buffer
-                is_paused = False  # Song starts playing, not paused
-                
-                # Log the song as played and update the current song to be active
-                write_played_song(song_to_play)
-                write_current_song(song_to_play, active=True, paused=False)
-                
-                set_vlc_volume(MAX_VLC_VOLUME)
-                logging.info(f"Now playing: {song_to_play.name}")
-            else:
-                logging.error(f"Failed to add song to VLC: {song_to_play.name}")
-                write_current_song(None, active=False, paused=False)
+                get_player().stop()
+                _finish_current_song()
+
+            handoff = _handoff_in()
+            if handoff is not None and handoff <= 0:
+                _enqueue_next(queue, queue_condition)
+
+            progress = _progress_in()
+            if progress is not None and progress <= 0:
+                _publish_progress()
+
+            if current_playing_song is None:
+                if queue.empty():
+                    last_track_end = None  # Nothing followed the last track, that's not a gap
+                else:
+                    _play_next(queue, queue_condition)
 
         except Exception as e:
             logging.error(f"Error in queue scanner: {e}")
             try:
-                if vlc_process:
-                    vlc_process.terminate()
+                get_player().shutdown()  # Start from a fresh player
             except Exception:
                 pass
-            vlc_process = None
-            current_playing_song = None
-            song_end_time = None
-            is_paused = False  # Reset pause state on error
+            _finish_current_song()
             time.sleep(2)
+
+def _play_next(queue, queue_condition):
+    """Take the next song off the queue and start it in the player."""
+    global current_playing_song, is_paused, awaiting_input, played_seconds, resumed_at, last_handoff_gapless
+
+    # Get next song from queue
+    with queue_condition:
+        song_to_play = queue.get()
+        queue_condition.notify_all()  # The head of the queue moved, let the prefetcher look further ahead
+    
+    logging.info(f"Preparing to play: {song_to_play.name}")
+
+    # Immediately write the song as the next one to play, but not yet active.
+    set_now_playing(song_to_play, active=False, paused=False)
+
+    if not get_player().start():
+        logging.error("Failed to start the player, retrying in 5 seconds")
+        # Put the song back in the queue
+        with queue_condition:
+            queue.put(song_to_play)
+            queue_condition.notify_all()
+        set_now_playing(None, active=False, paused=False)
+        time.sleep(5)
+        return
+
+    stream_url = _ready_source(song_to_play)
+    _count_play_source(stream_url)
+    if not stream_url:
+        logging.info(f"No cached URL for {song_to_play.name}, extracting now...")
+        stream_url = extract_audio_url(song_to_play)
+
+    if not stream_url:
+        logging.error(f"Failed to get URL for {song_to_play.name}, skipping")
+        events.append("extraction_failed", url=song_to_play.url, name=song_to_play.name)
+        set_now_playing(None, active=False, paused=False)
+        return
+
+    if get_player().play(stream_url, song_to_play.duration):
+        # Update state AFTER the player accepted the song
+        with playback_lock:
+            current_playing_song = song_to_play
+            is_paused = False  # Song starts playing, not paused
+            awaiting_input = True
+            played_seconds = 0.0
+            resumed_at = time.time()
+            last_handoff_gapless = False
+        
+        # Log the song as played and update the current song to be active
+        write_played_song(song_to_play)
+        set_now_playing(song_to_play, active=True, paused=False)
+        logging.info(f"Now playing: {song_to_play.name}")
+    else:
+        logging.error(f"Failed to play song: {song_to_play.name}")
+        events.append("playback_failed", url=song_to_play.url, name=song_to_play.name)
+        set_now_playing(None, active=False, paused=False)
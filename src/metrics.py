@@ -0,0 +1,146 @@
+import bisect, threading
+from typing import Callable, Optional
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+GAP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+FIRST_AUDIO_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+FANOUT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """A number that only goes up, optionally split by label values."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [(self.name + _format_labels(self.labelnames, labels), value) for labels, value in self._values.items()]
+
+class Gauge:
+    """A number that goes up and down. `function` is called at scrape time instead, for values that are kept elsewhere."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def samples(self) -> list:
+        if self.function is None:
+            return [(self.name, self._value)]
+        try:
+            return [(self.name, self.function())]
+        except Exception:
+            return []  # A broken source is left out rather than failing the whole scrape
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets, plus their sum and count.
+    Observing is a bisect and three additions under a lock.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def samples(self) -> list:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            samples.append((f'{self.name}_bucket{{le="{_format_value(bound)}"}}', cumulative))
+        samples.append((f"{self.name}_sum", total))
+        samples.append((f"{self.name}_count", count))
+        return samples
+
+class Registry:
+    """The metrics served on /metrics, rendered in the Prometheus text format."""
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {_format_value(value)}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+search_seconds = registry.register(Histogram(
+    "jukebox_search_seconds", "Time search_song took, cache hits included."))
+extraction_seconds = registry.register(Histogram(
+    "jukebox_extraction_seconds", "Time resolving a stream URL took, retries included."))
+extraction_retries = registry.register(Counter(
+    "jukebox_extraction_retries_total", "Extraction attempts after the first one for a song."))
+extraction_failures = registry.register(Counter(
+    "jukebox_extraction_failures_total", "Songs whose stream URL couldn't be resolved."))
+play_sources = registry.register(Counter(
+    "jukebox_play_source_total", "Where songs were played from: the audio cache, the prefetched stream cache, or an extraction at play time.",
+    ("source",)))
+first_audio_seconds = registry.register(Histogram(
+    "jukebox_request_to_first_audio_seconds", "Time from a request starting to resolve until its song is heard.",
+    FIRST_AUDIO_BUCKETS))
+track_gap_seconds = registry.register(Histogram(
+    "jukebox_track_gap_seconds", "Silence between one track stopping and the next starting.", GAP_BUCKETS))
+queue_depth = registry.register(Gauge(
+    "jukebox_queue_depth", "Songs waiting in the queue."))
+websocket_clients = registry.register(Gauge(
+    "jukebox_websocket_clients", "Connected websocket clients."))
+broadcast_seconds = registry.register(Histogram(
+    "jukebox_broadcast_seconds", "Time handing one event to every websocket client took.", FANOUT_BUCKETS))
@@ -0,0 +1,25 @@
+import logging
+
+from src.player.base import PlayerBackend, MAX_VOLUME
+from src.player.state import PlayerState
+from src.player.rc import RcPlayer
+from src.player.libvlc import LibVlcPlayer
+from src.player.fake import FakePlayer
+
+PLAYER_BACKENDS = {
+    "rc": RcPlayer,
+    "libvlc": LibVlcPlayer,
+    "fake": FakePlayer,
+}
+
+def create_player(name: str = "rc", **kwargs) -> PlayerBackend:
+    """
+    Create the player backend called `name` ("rc", "libvlc" or "fake").
+    Falls back to the RC player if libvlc was asked for but python-vlc isn't installed.
+    """
+    if name not in PLAYER_BACKENDS:
+        raise ValueError(f"Unknown player {name!r}, expected one of {tuple(PLAYER_BACKENDS)}")
+    if name == "libvlc" and not LibVlcPlayer.available():
+        logging.warning("python-vlc is not installed, using the VLC RC player instead")
+        return RcPlayer()
+    return PLAYER_BACKENDS[name](**kwargs)
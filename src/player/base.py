@@ -0,0 +1,83 @@
+import time, logging
+from typing import Callable, Optional
+
+from src.player.state import PlayerState
+
+# VLC volume scale (256 == 100% in VLC RC). Clamp to reasonable maximum.
+MAX_VOLUME = 384  # 150% volume (256 == 100%)
+
+class PlayerBackend:
+    """
+    Plays stream URLs and local files for the queue scanner.
+
+    Backends report what the player does through `on_event(kind, value, at)`:
+    ("new_input", mrl) when the player moves to a track, ("state", "playing" | "paused" | "stopped")
+    and ("exit", None) when the player itself goes away. `status` is the live PlayerState model.
+    """
+    name = "base"
+    uses_audio_hardware = True
+
+    def __init__(self):
+        self.status = PlayerState()
+        self.on_event: Optional[Callable[[str, object, float], None]] = None
+        self.volume = MAX_VOLUME
+        self.startup_stats = {"vlc_starts": 0, "last_vlc_startup": None, "last_audio_probe": None}
+
+    def start(self) -> bool:
+        """Make sure the player is running, starting it if needed. Returns False if it can't run."""
+        raise NotImplementedError
+
+    def is_running(self) -> bool:
+        raise NotImplementedError
+
+    def play(self, mrl: str, length: Optional[float] = None) -> bool:
+        """
+        Replace the playlist with `mrl` and start playing it.
+
+        Args:
+            mrl (str): Stream URL or file:// URI.
+            length (float): Expected length in seconds. Only a hint for players that can't read it.
+        """
+        raise NotImplementedError
+
+    def enqueue(self, mrl: str, length: Optional[float] = None) -> bool:
+        """Add `mrl` to the end of the playlist, the player moves on to it when the current track ends."""
+        raise NotImplementedError
+
+    def toggle_pause(self) -> bool:
+        raise NotImplementedError
+
+    def stop(self) -> bool:
+        """Stop playback and clear the playlist."""
+        raise NotImplementedError
+
+    def set_volume(self, volume: int) -> bool:
+        """Set the volume on VLC's RC scale (256 == 100%), clamped to MAX_VOLUME."""
+        raise NotImplementedError
+
+    def refresh(self):
+        """Bring `status` up to date. Players that report their position continuously don't need to."""
+
+    def shutdown(self):
+        raise NotImplementedError
+
+    def _record_startup(self, started: float):
+        startup = time.time() - started
+        self.startup_stats["vlc_starts"] += 1
+        self.startup_stats["last_vlc_startup"] = round(startup, 3)
+        logging.info(f"{self.name} player started in {startup:.2f}s")
+
+    def _emit(self, kind: str, value=None, at: Optional[float] = None):
+        """Apply an event to `status` and pass it on to `on_event`."""
+        at = at or time.time()
+        if kind == "state":
+            self.status.set_state(value, at)
+        elif kind == "new_input":
+            self.status.set_input(value, at)
+        elif kind == "exit":
+            self.status.reset()
+        if self.on_event:
+            self.on_event(kind, value, at)
+
+def clamp_volume(volume: int) -> int:
+    return max(0, min(int(volume), MAX_VOLUME))
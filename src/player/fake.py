@@ -0,0 +1,139 @@
+import time, threading
+from typing import Optional
+
+from src.player.base import PlayerBackend, clamp_volume
+
+class FakePlayer(PlayerBackend):
+    """
+    A player that plays nothing, for tests and for benchmarking the scanner without audio hardware.
+
+    A track "plays" for its `length` (or `default_length`) divided by `speed` seconds and then ends
+    with the same events VLC sends, moving on to the next enqueued track. `finish()` ends the current
+    track right away. Every call is recorded in `commands`.
+    """
+    name = "fake"
+    uses_audio_hardware = False
+
+    def __init__(self, speed: float = 1.0, default_length: Optional[float] = None, startup_delay: float = 0.0):
+        super().__init__()
+        self.speed = speed
+        self.default_length = default_length
+        self.startup_delay = startup_delay
+        self.status.rate = speed
+        self.commands = []
+        self.playlist = []  # [mrl, length] pairs, the current track first
+        self._running = False
+        self._paused = False
+        self._timer = None
+        self._track_remaining = None  # Seconds of media left when the track last started or resumed
+        self._track_resumed_at = None
+        self._lock = threading.RLock()
+
+    def start(self) -> bool:
+        with self._lock:
+            if not self._running:
+                started = time.time()
+                time.sleep(self.startup_delay)
+                self._running = True
+                self.commands.append(("start",))
+                self._record_startup(started)
+            return True
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def play(self, mrl: str, length: Optional[float] = None) -> bool:
+        with self._lock:
+            self.commands.append(("play", mrl))
+            self._cancel_timer()
+            self.playlist = [[mrl, length or self.default_length]]
+            self._begin_track()
+        return True
+
+    def enqueue(self, mrl: str, length: Optional[float] = None) -> bool:
+        with self._lock:
+            self.commands.append(("enqueue", mrl))
+            self.playlist.append([mrl, length or self.default_length])
+        return True
+
+    def toggle_pause(self) -> bool:
+        with self._lock:
+            self.commands.append(("pause",))
+            if not self.playlist:
+                return True
+            if self._paused:
+                self._paused = False
+                self._schedule_end(self._track_remaining)
+                self._emit("state", "playing")
+            else:
+                self._paused = True
+                if self._track_remaining is not None:
+                    self._track_remaining -= (time.time() - self._track_resumed_at) * self.speed
+                self._cancel_timer()
+                self._emit("state", "paused")
+        return True
+
+    def stop(self) -> bool:
+        with self._lock:
+            self.commands.append(("stop",))
+            self._cancel_timer()
+            self.playlist = []
+            self._paused = False
+            if self.status.state != "stopped":
+                self._emit("state", "stopped")
+        return True
+
+    def set_volume(self, volume: int) -> bool:
+        with self._lock:
+            self.volume = clamp_volume(volume)
+            self.commands.append(("volume", self.volume))
+        return True
+
+    def finish(self):
+        """End the current track now, as if it played to the end."""
+        with self._lock:
+            if self.playlist:
+                self._end_track()
+
+    def shutdown(self):
+        with self._lock:
+            self._cancel_timer()
+            self.playlist = []
+            self._running = False
+            self._emit("exit")
+
+    def _begin_track(self):
+        mrl, length = self.playlist[0]
+        self._paused = False
+        self._emit("new_input", mrl)
+        self.status.set_length(length)
+        self._emit("state", "playing")
+        self._schedule_end(length)
+
+    def _end_track(self):
+        self._cancel_timer()
+        self.playlist.pop(0)
+        self._emit("state", "stopped")
+        if self.playlist:
+            self._begin_track()
+
+    def _schedule_end(self, remaining: Optional[float]):
+        self._track_remaining = remaining
+        self._track_resumed_at = time.time()
+        if remaining is None:
+            return  # Plays until finish() or stop()
+        timer = threading.Timer(max(remaining, 0) / self.speed, self._on_timer)
+        timer.daemon = True
+        self._timer = timer
+        timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            if threading.current_thread() is self._timer:
+                self._timer = None
+                self._end_track()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
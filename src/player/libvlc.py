@@ -0,0 +1,167 @@
+import time, logging, threading, importlib.util
+from typing import Optional
+
+from src.player.base import PlayerBackend, clamp_volume
+
+LIBVLC_OPTIONS = [
+    '--no-video',
+    '--audio-time-stretch',
+    '--audio-filter=compressor:normvol',
+    '--gain=2.0',
+    '--no-loop',
+    '--no-repeat',
+]
+
+class LibVlcPlayer(PlayerBackend):
+    """
+    VLC running inside this process through libvlc (the optional python-vlc package).
+
+    Commands are direct function calls instead of lines written to a pipe, and the end of a track
+    comes from libvlc's own events. The playlist is a media list, so enqueued tracks play gaplessly.
+    """
+    name = "libvlc"
+
+    def __init__(self, options: Optional[list] = None):
+        super().__init__()
+        self.options = options or LIBVLC_OPTIONS
+        self._instance = None
+        self._player = None
+        self._list_player = None
+        self._media_list = None
+        self._mrls = []  # MRLs of the media list, to name the track libvlc moves to
+        self._index = -1
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec("vlc") is not None
+
+    def start(self) -> bool:
+        with self._lock:
+            if self._instance is not None:
+                return True
+            try:
+                import vlc  # Optional dependency, only needed for this backend
+            except ImportError:
+                logging.error("The libvlc player needs the python-vlc package (pip install python-vlc)")
+                return False
+
+            started = time.time()
+            try:
+                self._instance = vlc.Instance(self.options)
+                self._player = self._instance.media_player_new()
+                self._list_player = self._instance.media_list_player_new()
+                self._list_player.set_media_player(self._player)
+                self._set_playlist([])
+
+                # Callbacks run on libvlc's threads and must not call back into libvlc
+                events = self._player.event_manager()
+                events.event_attach(vlc.EventType.MediaPlayerPlaying, lambda event: self._emit("state", "playing"))
+                events.event_attach(vlc.EventType.MediaPlayerPaused, lambda event: self._emit("state", "paused"))
+                events.event_attach(vlc.EventType.MediaPlayerStopped, lambda event: self._emit("state", "stopped"))
+                events.event_attach(vlc.EventType.MediaPlayerEndReached, lambda event: self._emit("state", "stopped"))
+                events.event_attach(vlc.EventType.MediaPlayerLengthChanged,
+                                    lambda event: self.status.set_length(event.u.new_length / 1000))
+                self._list_player.event_manager().event_attach(
+                    vlc.EventType.MediaListPlayerNextItemSet, self._on_next_item)
+
+                self._player.audio_set_volume(self._libvlc_volume(self.volume))
+            except Exception as e:
+                logging.error(f"Failed to start libvlc: {e}")
+                self._release()
+                return False
+            self._record_startup(started)
+            return True
+
+    def is_running(self) -> bool:
+        return self._instance is not None
+
+    def play(self, mrl: str, length: Optional[float] = None) -> bool:
+        with self._lock:
+            if not self._instance:
+                return False
+            try:
+                self._set_playlist([mrl])
+                self._list_player.play()
+                return True
+            except Exception as e:
+                logging.error(f"libvlc failed to play {mrl}: {e}")
+                return False
+
+    def enqueue(self, mrl: str, length: Optional[float] = None) -> bool:
+        with self._lock:
+            if not self._instance:
+                return False
+            try:
+                media = self._instance.media_new(mrl)
+                self._media_list.lock()
+                try:
+                    self._media_list.add_media(media)
+                finally:
+                    self._media_list.unlock()
+                self._mrls.append(mrl)
+                return True
+            except Exception as e:
+                logging.error(f"libvlc failed to enqueue {mrl}: {e}")
+                return False
+
+    def toggle_pause(self) -> bool:
+        with self._lock:
+            if not self._instance:
+                return False
+            self._list_player.pause()
+            return True
+
+    def stop(self) -> bool:
+        with self._lock:
+            if not self._instance:
+                return False
+            self._list_player.stop()
+            self._set_playlist([])
+            return True
+
+    def set_volume(self, volume: int) -> bool:
+        with self._lock:
+            self.volume = clamp_volume(volume)
+            if not self._instance:
+                return False
+            return self._player.audio_set_volume(self._libvlc_volume(self.volume)) == 0
+
+    def refresh(self):
+        with self._lock:
+            if not self._instance:
+                return
+            position = self._player.get_time()
+            if position >= 0:
+                self.status.set_position(position / 1000)
+
+    def shutdown(self):
+        with self._lock:
+            if self._instance is not None:
+                self._release()
+                self._emit("exit")
+
+    def _set_playlist(self, mrls: list):
+        self._mrls = list(mrls)
+        self._index = -1
+        self._media_list = self._instance.media_list_new(self._mrls)
+        self._list_player.set_media_list(self._media_list)
+
+    def _on_next_item(self, event):
+        self._index += 1
+        mrl = self._mrls[self._index] if self._index < len(self._mrls) else None
+        self._emit("new_input", mrl)
+
+    def _release(self):
+        for obj in (self._list_player, self._player, self._instance):
+            try:
+                if obj is not None:
+                    obj.release()
+            except Exception:
+                pass
+        self._instance = self._player = self._list_player = self._media_list = None
+
+    @staticmethod
+    def _libvlc_volume(volume: int) -> int:
+        """VLC RC volume (256 == 100%) to libvlc's percent."""
+        return round(volume * 100 / 256)
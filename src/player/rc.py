@@ -0,0 +1,397 @@
+import subprocess, sys, time, logging, os, shutil
+import threading, re, json, concurrent.futures
+from collections import deque
+from typing import Optional
+
+from src.player.base import PlayerBackend, clamp_volume
+
+# The audio output that works on this machine is probed once and remembered across restarts.
+# The choice is re-probed when the VLC binary changes, after AUDIO_OUTPUT_TTL, or when VLC fails to start with it.
+AUDIO_OUTPUT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs", "vlc_audio_output.json")
+AUDIO_OUTPUTS = ('pulse', 'alsa', 'oss')  # In order of preference
+AUDIO_OUTPUT_TTL = 7 * 24 * 3600
+audio_output = None  # Cached probe result: {"aout", "vlc", "probed_at"}
+
+# VLC is ready once its RC interface answers, instead of after a fixed sleep
+VLC_READY_TIMEOUT = float(os.environ.get("JUKEBOX_VLC_READY_TIMEOUT", 10))
+VLC_EARLY_EXIT = 5  # Seconds; VLC dying this soon after starting counts as a bad audio output
+POSITION_POLL_INTERVAL = float(os.environ.get("JUKEBOX_POSITION_POLL", 5))  # Seconds between position checks while playing
+RC_BANNER = "Remote control interface initialized"
+
+# Answers to RC queries are bare numbers, so they are matched to the queries in the order they were sent
+RC_QUERIES = ("get_time", "get_length", "is_playing")
+RC_NUMBER_PATTERN = re.compile(r"-?\d+")
+RC_STATE_PATTERN = re.compile(r"\(\s*(?:(\w+) state: \d+|state (\w+))\s*\)")
+RC_NEW_INPUT_PATTERN = re.compile(r"\(\s*new input: (.*?)\s*\)\s*$")
+RC_STATES = {
+    "play": "playing", "playing": "playing",
+    "pause": "paused", "paused": "paused",
+    "stop": "stopped", "stopped": "stopped", "end": "stopped", "ended": "stopped",
+}
+
+def find_vlc_binary() -> Optional[str]:
+    """Return path to VLC binary for current platform, or None if not found."""
+    if sys.platform.startswith('linux'):
+        return shutil.which("cvlc") or shutil.which("vlc")
+    elif sys.platform == 'darwin':
+        # Prefer installed CLI wrapper first, then bundle binary
+        return shutil.which("vlc") or "/Applications/VLC.app/Contents/MacOS/VLC"
+    elif sys.platform.startswith('win'):
+        return shutil.which("vlc")
+    return None
+
+def parse_rc_status(line: str) -> Optional[tuple]:
+    """
+    Parse a VLC RC status line, e.g. "status change: ( play state: 3 ): Play".
+
+    Returns:
+        tuple: ("new_input", mrl) or ("state", "playing" | "paused" | "stopped"), None for other lines.
+    """
+    line = line.strip().lstrip("> ").strip()
+    if not line.startswith("status change:"):
+        return None
+    match = RC_NEW_INPUT_PATTERN.search(line)
+    if match:
+        return "new_input", match.group(1)
+    match = RC_STATE_PATTERN.search(line)
+    if match:
+        state = RC_STATES.get((match.group(1) or match.group(2)).lower())
+        if state:
+            return "state", state
+    return None
+
+def choose_audio_output(vlc_cmd: str, base_cmd: list, stats: Optional[dict] = None) -> Optional[str]:
+    """
+    Return the audio output to start VLC with. Uses the cached probe result while it is valid.
+
+    Args:
+        vlc_cmd (str): The VLC binary.
+        base_cmd (list): The VLC command line the probes extend.
+        stats (dict): Gets the probe time as "last_audio_probe" when a probe runs.
+
+    Returns:
+        str: The first working output in AUDIO_OUTPUTS order, or None if none of them work.
+    """
+    global audio_output
+    forced = os.environ.get("JUKEBOX_VLC_AOUT")
+    if forced:
+        return forced
+
+    fingerprint = _vlc_fingerprint(vlc_cmd)
+    if audio_output is None:
+        audio_output = _load_audio_output()
+    if (audio_output and audio_output.get("vlc") == fingerprint
+            and time.time() - audio_output.get("probed_at", 0) < AUDIO_OUTPUT_TTL):
+        return audio_output["aout"]
+
+    start = time.time()
+    aout = probe_audio_outputs(base_cmd)
+    if stats is not None:
+        stats["last_audio_probe"] = round(time.time() - start, 3)
+    logging.info(f"Probed audio outputs in {time.time() - start:.2f}s")
+    if aout:
+        audio_output = {"aout": aout, "vlc": fingerprint, "probed_at": time.time()}
+        try:
+            os.makedirs(os.path.dirname(AUDIO_OUTPUT_CACHE_PATH), exist_ok=True)
+            with open(AUDIO_OUTPUT_CACHE_PATH, "w") as f:
+                json.dump(audio_output, f)
+        except OSError as e:
+            logging.error(f"Failed to save the audio output choice: {e}")
+    return aout
+
+def probe_audio_outputs(base_cmd: list) -> Optional[str]:
+    """Try every audio output at once and return the most preferred one that works."""
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(AUDIO_OUTPUTS))
+    try:
+        futures = {aout: pool.submit(_probe_audio_output, base_cmd, aout) for aout in AUDIO_OUTPUTS}
+        for aout in AUDIO_OUTPUTS:
+            if futures[aout].result():
+                return aout  # Don't wait for the less preferred probes to finish
+        return None
+    finally:
+        pool.shutdown(wait=False)
+
+def _probe_audio_output(base_cmd: list, aout: str) -> bool:
+    test_cmd = base_cmd + ['--aout', aout, '--intf', 'dummy', '--play-and-exit', '--run-time=1']
+    try:
+        return subprocess.run(test_cmd, capture_output=True, timeout=5).returncode == 0
+    except (subprocess.TimeoutExpired, Exception):
+        return False
+
+def invalidate_audio_output():
+    """Forget the cached audio output, the next start probes again."""
+    global audio_output
+    audio_output = None
+    try:
+        os.remove(AUDIO_OUTPUT_CACHE_PATH)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.error(f"Failed to remove {AUDIO_OUTPUT_CACHE_PATH}: {e}")
+
+def _load_audio_output() -> Optional[dict]:
+    try:
+        with open(AUDIO_OUTPUT_CACHE_PATH, "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) and data.get("aout") else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Ignoring unreadable audio output cache: {e}")
+        return None
+
+def _vlc_fingerprint(vlc_cmd: str) -> str:
+    """Identifies the installed VLC, so an upgrade or a different binary triggers a new probe."""
+    path = shutil.which(vlc_cmd) or vlc_cmd
+    try:
+        stat = os.stat(path)
+        return f"{os.path.realpath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        return path
+
+class RcPlayer(PlayerBackend):
+    """
+    VLC in a subprocess, driven through its RC (remote control) interface.
+
+    Commands are text lines written to VLC's stdin. A reader thread parses stdout into events
+    and answers to queries, a second one drains stderr so VLC never blocks on a full pipe.
+    """
+    name = "rc"
+
+    def __init__(self, ready_timeout: float = VLC_READY_TIMEOUT, poll_interval: float = POSITION_POLL_INTERVAL):
+        super().__init__()
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.process = None
+        self.stderr_tail = deque(maxlen=20)  # Last lines VLC wrote to stderr, logged if it dies
+        self._queries = deque()
+        self._queries_lock = threading.Lock()
+        self._stdin_lock = threading.Lock()  # Commands come from the scanner, the API and the output reader
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._started_at = None
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def send_command(self, command: str) -> bool:
+        """
+        Send a command to the current VLC Process RC interface.
+        """
+        process = self.process
+        if process and process.poll() is None and process.stdin:
+            try:
+                with self._stdin_lock:
+                    process.stdin.write((command + '\n').encode())
+                    process.stdin.flush()
+                logging.debug(f"Sent VLC command: {command}")
+                return True
+            except Exception as e:
+                logging.error(f"Failed to send VLC command: {e}")
+                return False
+        logging.debug("VLC process not available to send command")
+        return False
+
+    def query(self, command: str) -> bool:
+        """Send an RC query whose answer is a bare number, so the reader can attribute the answer to it."""
+        if command not in RC_QUERIES:
+            raise ValueError(f"Unknown RC query {command!r}")
+        with self._queries_lock:
+            self._queries.append(command)
+            if self.send_command(command):
+                return True
+            self._queries.pop()
+        return False
+
+    def start(self) -> bool:
+        """Make sure VLC is running and restart it if needed."""
+        with self._start_lock:
+            if self.is_running():
+                return True
+            self._stop_process()
+            return self._start_process()
+
+    def play(self, mrl: str, length: Optional[float] = None) -> bool:
+        # Clear any existing playlist and add only the new song, VLC starts playing it on add
+        self.send_command('clear')
+        return self.send_command(f'add {mrl}')
+
+    def enqueue(self, mrl: str, length: Optional[float] = None) -> bool:
+        return self.send_command(f'enqueue {mrl}')
+
+    def toggle_pause(self) -> bool:
+        return self.send_command('pause')
+
+    def stop(self) -> bool:
+        stopped = self.send_command('stop')  # Use stop to clear current song
+        return self.send_command('clear') and stopped  # Clear the entire playlist
+
+    def set_volume(self, volume: int) -> bool:
+        self.volume = clamp_volume(volume)
+        return self.send_command(f'volume {self.volume}')
+
+    def refresh(self):
+        if self.status.state == "playing":
+            self.query("get_time")
+
+    def shutdown(self):
+        with self._start_lock:
+            self._stop_process()
+
+    def _stop_process(self):
+        if self.process:
+            try:
+                self.process.terminate()
+                self.process.wait(timeout=2)
+            except (subprocess.TimeoutExpired, Exception):
+                self.process.kill()
+            self.process = None
+
+    def _start_process(self) -> bool:
+        vlc_cmd = find_vlc_binary()
+        if not vlc_cmd:
+            logging.error("VLC binary not found on PATH or expected locations.")
+            return False
+        if not os.path.exists(vlc_cmd) and not shutil.which(vlc_cmd):
+            logging.error(f"VLC binary not accessible: {vlc_cmd}")
+            return False
+
+        cmd = [
+            vlc_cmd,
+            '--intf', 'rc',
+            '--rc-fake-tty',
+            '--no-video',
+            '--audio-time-stretch',
+            '--audio-filter=compressor:normvol',
+            '--gain=2.0',
+            '--sout-keep',
+            '--no-loop',
+            '--no-repeat'
+        ]
+
+        start = time.time()
+        env = None
+        if sys.platform.startswith('linux'):
+            aout = choose_audio_output(vlc_cmd, cmd, self.startup_stats)
+            if aout:
+                cmd.extend(['--aout', aout])
+                logging.info(f"Using audio output: {aout}")
+            else:
+                # Fallback to ALSA if nothing works
+                cmd.extend(['--aout', 'alsa'])
+                logging.warning("Using ALSA as fallback audio output")
+
+            env = os.environ.copy()
+            # Set up environment for audio access
+            env.setdefault('PULSE_LATENCY_MSEC', '60')
+            env.setdefault('ALSA_PCM_CARD', '0')
+            env.setdefault('ALSA_PCM_DEVICE', '0')
+
+        try:
+            logging.info(f"Starting VLC process using: {vlc_cmd}")
+            self._ready.clear()
+            with self._queries_lock:
+                self._queries.clear()
+            self.status.reset()
+            self.stderr_tail.clear()
+            self._started_at = time.time()
+            self.process = process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=env
+            )
+            # Both pipes must be drained or VLC blocks once the OS pipe buffer fills up
+            threading.Thread(target=self._read_output, args=(process,), name="vlc-stdout", daemon=True).start()
+            threading.Thread(target=self._drain_stderr, args=(process,), name="vlc-stderr", daemon=True).start()
+            threading.Thread(target=self._poll_position, args=(process,), name="vlc-position", daemon=True).start()
+            # Handshake: the RC interface prints its banner and answers this query once it reads commands
+            self.query("is_playing")
+            if not self._ready.wait(self.ready_timeout):
+                if process.poll() is not None:
+                    logging.error("VLC exited during startup")
+                    invalidate_audio_output()
+                    return False
+                logging.warning(f"VLC didn't answer within {self.ready_timeout}s, continuing anyway")
+            # Ensure no looping/repeat is enabled
+            self.send_command('loop off')
+            self.send_command('repeat off')
+            self.set_volume(self.volume)
+            self._record_startup(start)
+            return True
+        except Exception as e:
+            logging.error(f"Failed to start VLC: {e}")
+            return False
+
+    def _handle_line(self, line: str, at: Optional[float] = None):
+        """Apply one line of VLC's RC output to the player model and pass status changes on."""
+        at = at or time.time()
+        line = line.strip().lstrip("> ").strip()
+        if not line:
+            return
+
+        if line.startswith(RC_BANNER):
+            self._ready.set()
+            return
+
+        if RC_NUMBER_PATTERN.fullmatch(line):
+            self._ready.set()
+            with self._queries_lock:
+                query = self._queries.popleft() if self._queries else None
+            value = int(line)
+            if query == "get_time":
+                self.status.set_position(value, at)
+            elif query == "get_length":
+                self.status.set_length(value)
+            elif query == "is_playing" and not value and self.status.state != "stopped":
+                self._emit("state", "stopped", at)  # A stop we missed
+            return
+
+        event = parse_rc_status(line)
+        if event is None:
+            return
+        kind, value = event
+        self._emit(kind, value, at)
+        if kind == "state" and value == "playing":
+            self.query("get_length")
+
+    def _read_output(self, process):
+        """Read VLC's RC output until it exits, keeping the player model up to date."""
+        try:
+            for raw in iter(process.stdout.readline, b""):
+                self._handle_line(raw.decode(errors="replace"))
+        except Exception as e:
+            logging.debug(f"VLC output reader stopped: {e}")
+        if process is not self.process:
+            return  # An old process we replaced
+        if self.stderr_tail:
+            logging.warning("VLC exited, last output:\n" + "\n".join(self.stderr_tail))
+        if self._started_at and time.time() - self._started_at < VLC_EARLY_EXIT and _exit_code(process):
+            invalidate_audio_output()  # It may not work with the cached audio output any more
+        self._emit("exit")
+
+    def _drain_stderr(self, process):
+        """Keep reading VLC's stderr so it never blocks on a full pipe."""
+        try:
+            for raw in iter(process.stderr.readline, b""):
+                line = raw.decode(errors="replace").rstrip()
+                if line:
+                    self.stderr_tail.append(line)
+                    logging.debug(f"VLC: {line}")
+        except Exception as e:
+            logging.debug(f"VLC stderr reader stopped: {e}")
+
+    def _poll_position(self, process):
+        """Ask VLC where it is every `poll_interval` seconds while it plays, to correct the extrapolated position."""
+        while process.poll() is None:
+            if process is self.process and self.status.state == "playing":
+                self.query("get_time")
+                self.query("is_playing")  # Catches a stop we missed
+            time.sleep(self.poll_interval)
+
+def _exit_code(process) -> Optional[int]:
+    try:
+        return process.wait(timeout=2)
+    except Exception:
+        return None
@@ -0,0 +1,88 @@
+import time, threading
+from typing import Optional
+
+PLAYER_STATES = ("playing", "paused", "stopped")
+
+class PlayerState:
+    """
+    Live model of what VLC is doing, built from its RC output.
+
+    Positions come from `get_time` answers and are extrapolated between them while playing,
+    so readers get an up-to-date elapsed time without asking VLC on every request.
+    `rate` is how many seconds of media play per second of wall time (only the fake player changes it).
+    """
+    def __init__(self, rate: float = 1.0):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self.state = "stopped"
+        self.input = None  # MRL of the current input
+        self.position = None  # Seconds into the input as of `updated_at`
+        self.length = None  # Seconds, None until VLC knows it
+        self.updated_at = None
+
+    def set_state(self, state: str, at: Optional[float] = None):
+        if state not in PLAYER_STATES:
+            raise ValueError(f"Unknown player state {state!r}")
+        at = at or time.time()
+        with self._lock:
+            if state == self.state:
+                return
+            # Freeze the extrapolated position when playback stops advancing, and restart it from there
+            if self.position is not None:
+                self.position = self._elapsed(at)
+                self.updated_at = at
+            if state == "stopped":
+                self.position = None
+            self.state = state
+
+    def set_input(self, mrl: str, at: Optional[float] = None):
+        with self._lock:
+            self.input = mrl
+            self.position = 0.0
+            self.length = None
+            self.updated_at = at or time.time()
+
+    def set_position(self, seconds: float, at: Optional[float] = None):
+        with self._lock:
+            self.position = float(seconds)
+            self.updated_at = at or time.time()
+
+    def set_length(self, seconds: float):
+        with self._lock:
+            self.length = float(seconds) if seconds and seconds > 0 else None  # 0 means VLC doesn't know yet
+
+    def reset(self):
+        with self._lock:
+            self.state = "stopped"
+            self.input = self.position = self.length = self.updated_at = None
+
+    def elapsed(self, now: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            return self._elapsed(now or time.time())
+
+    def remaining(self, now: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            elapsed = self._elapsed(now or time.time())
+            if elapsed is None or self.length is None:
+                return None
+            return max(self.length - elapsed, 0.0)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._lock:
+            elapsed = self._elapsed(now)
+            return {
+                "state": self.state,
+                "input": self.input,
+                "elapsed": elapsed,
+                "length": self.length,
+                "remaining": max(self.length - elapsed, 0.0) if elapsed is not None and self.length else None,
+            }
+
+    def _elapsed(self, now: float) -> Optional[float]:
+        if self.position is None:
+            return None
+        if self.state != "playing":
+            return self.position
+        elapsed = self.position + max(now - self.updated_at, 0.0) * self.rate
+        return min(elapsed, self.length) if self.length else elapsed
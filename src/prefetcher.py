@@ -0,0 +1,144 @@
+import heapq, itertools, threading, logging
+from typing import Callable, Optional
+
+from src.song import Song
+
+class Prefetcher:
+    """
+    Keeps the songs at the head of the queue ready to play.
+
+    A planner sleeps on `queue_condition` and re-plans only when the head of the queue changes
+    (or every `refresh_interval` seconds, so entries close to expiry get renewed). Planned jobs go
+    into a priority heap ordered by distance from the head of the queue, and a fixed pool of
+    long-lived workers takes them in that order. Jobs for songs that left the window (played,
+    skipped or removed) are dropped before they start; a job that is already running finishes.
+
+    Args:
+        queue: The song queue, read through `queue.queue` while holding `queue_condition`.
+        queue_condition (threading.Condition): Notified whenever the queue changes.
+        fetch (callable): Does the work for a song, e.g. extracts and caches its stream URL.
+            Called as fetch(song, position) with the song's position in the queue.
+        needs_fetch (callable): needs_fetch(song, position) returns True if a song still has to be fetched.
+        ahead (int): How many songs from the head of the queue to keep ready.
+        workers (int): Number of worker threads.
+        refresh_interval (float): Longest time between two plans when the queue doesn't change.
+    """
+    def __init__(self, queue, queue_condition: threading.Condition, fetch: Callable[[Song, int], None],
+                 needs_fetch: Callable[[Song, int], bool], ahead: int = 5, workers: int = 3,
+                 refresh_interval: float = 60):
+        self.queue = queue
+        self.queue_condition = queue_condition
+        self.fetch = fetch
+        self.needs_fetch = needs_fetch
+        self.ahead = ahead
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+        self._jobs = []  # heap of (position, seq, key, generation)
+        self._jobs_condition = threading.Condition()
+        self._wanted = {}  # key -> (position, song, generation)
+        self._running = set()
+        self._seq = itertools.count()
+        self._generation = 0
+        self._stopped = False
+        self._threads = []
+
+    def start(self):
+        """Start the workers and the planner on background threads."""
+        self._start_workers()
+        planner = threading.Thread(target=self._plan_loop, name="prefetch-planner", daemon=True)
+        planner.start()
+        self._threads.append(planner)
+
+    def run(self):
+        """Start the workers and run the planner on the calling thread."""
+        self._start_workers()
+        self._plan_loop()
+
+    def stop(self):
+        self._stopped = True
+        with self._jobs_condition:
+            self._jobs_condition.notify_all()
+        with self.queue_condition:
+            self.queue_condition.notify_all()
+
+    def pending(self) -> list:
+        """Keys of planned jobs that have not started yet, in the order they will run."""
+        with self._jobs_condition:
+            return [key for _, _, key, generation in sorted(self._jobs)
+                    if key in self._wanted and self._wanted[key][2] == generation]
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._worker, name=f"prefetch-{i}", daemon=True)
+            worker.start()
+            self._threads.append(worker)
+
+    def _head(self) -> tuple:
+        return tuple(list(self.queue.queue)[:self.ahead])
+
+    def _plan_loop(self):
+        planned = None
+        while not self._stopped:
+            try:
+                with self.queue_condition:
+                    # Only wake up for a change at the head of the queue, or to renew expiring entries
+                    self.queue_condition.wait_for(
+                        lambda: self._stopped or self._head() != planned,
+                        timeout=self.refresh_interval if planned is not None else 0
+                    )
+                    head = self._head()
+                if self._stopped:
+                    return
+                self._plan(head)
+                planned = head
+            except Exception as e:
+                logging.error(f"Error in prefetch planner: {e}")
+                planned = None
+
+    def _plan(self, songs: tuple):
+        with self._jobs_condition:
+            self._generation += 1
+            self._wanted = {}
+            for position, song in enumerate(songs):
+                key = song.video_id
+                if key in self._wanted or key in self._running:
+                    continue
+                if not self.needs_fetch(song, position):
+                    continue
+                self._wanted[key] = (position, song, self._generation)
+                heapq.heappush(self._jobs, (position, next(self._seq), key, self._generation))
+            # Jobs from earlier plans are superseded; drop them so the heap doesn't grow
+            self._jobs = [job for job in self._jobs if job[3] == self._generation]
+            heapq.heapify(self._jobs)
+            if self._wanted:
+                logging.debug(f"Prefetch planned for {len(self._wanted)} songs")
+                self._jobs_condition.notify_all()
+
+    def _next_job(self) -> Optional[tuple]:
+        with self._jobs_condition:
+            while not self._stopped:
+                while self._jobs:
+                    _, _, key, generation = heapq.heappop(self._jobs)
+                    wanted = self._wanted.get(key)
+                    if wanted is None or wanted[2] != generation or key in self._running:
+                        continue  # Song left the window or was re-planned
+                    del self._wanted[key]
+                    self._running.add(key)
+                    return wanted[1], wanted[0]
+                self._jobs_condition.wait()
+            return None
+
+    def _worker(self):
+        while not self._stopped:
+            job = self._next_job()
+            if job is None:
+                return
+            song, position = job
+            try:
+                if self.needs_fetch(song, position):
+                    self.fetch(song, position)
+            except Exception as e:
+                logging.error(f"Prefetch error for {song.name}: {e}")
+            finally:
+                with self._jobs_condition:
+                    self._running.discard(song.video_id)
@@ -0,0 +1,168 @@
+import os, re, json, glob, threading, logging
+from collections import OrderedDict
+
+class QueueJournal:
+    """
+    Write-ahead log for the song queue, so a restart or crash doesn't lose it.
+
+    Every queue change is appended as one JSON line to `<name>.<generation>.wal.jsonl`, so the cost
+    of a change doesn't depend on the queue's length. Every `snapshot_every` changes the queue
+    starts a new generation and writes the whole queue to `<name>.snapshot.json` in the background.
+    Once the snapshot is in place the older generations are deleted.
+    Loading reads the snapshot and replays the generations from the snapshot's one onwards.
+    """
+    def __init__(self, directory: str, name: str = "queue", snapshot_every: int = 500, fsync: bool = False):
+        self.directory = directory
+        self.name = name
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(directory, f"{name}.snapshot.json")
+        self.generation = 0
+        self._since_snapshot = 0
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def load(self) -> tuple[list, int]:
+        """
+        Rebuild the queue from the snapshot and the log.
+
+        Returns:
+            tuple: (entries, next_id) where entries are entry dicts in play order.
+        """
+        entries, next_id, generation = OrderedDict(), 1, 0
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r") as f:
+                    snapshot = json.load(f)
+                generation = int(snapshot["generation"])
+                next_id = int(snapshot["next_id"])
+                entries = OrderedDict((entry["id"], entry) for entry in snapshot["entries"])
+            except Exception as e:
+                logging.error(f"Ignoring unreadable queue snapshot {self.snapshot_path}: {e}")
+                entries, next_id, generation = OrderedDict(), 1, 0
+
+        replayed = 0
+        for gen, path in self._wal_files():
+            if gen < generation:
+                continue
+            for op in self._read_wal(path):
+                entries = _apply(op, entries)
+                next_id = max(next_id, _op_id(op) + 1)
+                replayed += 1
+
+        with self._lock:
+            self.generation = max([generation] + [gen for gen, _ in self._wal_files()])
+            self._since_snapshot = replayed
+        if entries:
+            logging.info(f"Restored {len(entries)} queued songs ({replayed} logged changes)")
+        return list(entries.values()), next_id
+
+    def record(self, op: dict) -> bool:
+        """
+        Append one change to the log.
+
+        Returns:
+            bool: True once enough changes have piled up that the queue should write a snapshot.
+        """
+        line = json.dumps(op, separators=(",", ":")) + "\n"
+        with self._lock:
+            try:
+                handle = self._open()
+                handle.write(line)
+                handle.flush()
+                if self.fsync:
+                    os.fsync(handle.fileno())
+            except Exception as e:
+                logging.error(f"Failed to journal queue change: {e}")
+                return False
+            self._since_snapshot += 1
+            return self.snapshot_every > 0 and self._since_snapshot >= self.snapshot_every
+
+    def start_generation(self) -> int:
+        """Send the next changes to a fresh log file. Call it while the queue can't change."""
+        with self._lock:
+            if self._handle:
+                self._handle.close()
+                self._handle = None
+            self.generation += 1
+            self._since_snapshot = 0
+            return self.generation
+
+    def write_snapshot(self, generation: int, next_id: int, entries: list):
+        """Store the queue as it was when `generation` started and drop the logs before it."""
+        data = {"generation": generation, "next_id": next_id, "entries": entries}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logging.error(f"Failed to write queue snapshot: {e}")
+            return
+        for gen, path in self._wal_files():
+            if gen < generation:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.error(f"Failed to remove old queue log {path}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._handle:
+                self._handle.close()
+                self._handle = None
+
+    def _open(self):
+        if self._handle is None or self._handle.closed:
+            os.makedirs(self.directory, exist_ok=True)
+            self._handle = open(os.path.join(self.directory, f"{self.name}.{self.generation}.wal.jsonl"), "a")
+        return self._handle
+
+    def _wal_files(self) -> list:
+        """(generation, path) of every log file, oldest first."""
+        pattern = re.compile(rf"{re.escape(self.name)}\.(\d+)\.wal\.jsonl$")
+        files = []
+        for path in glob.glob(os.path.join(self.directory, f"{glob.escape(self.name)}.*.wal.jsonl")):
+            match = pattern.search(os.path.basename(path))
+            if match:
+                files.append((int(match.group(1)), path))
+        return sorted(files)
+
+    @staticmethod
+    def _read_wal(path: str):
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A crash mid-write only tears the last line
+                        logging.warning(f"Skipping corrupt queue log line in {path}")
+        except FileNotFoundError:
+            return
+
+def _apply(op: dict, entries: OrderedDict) -> OrderedDict:
+    """Replay one logged change onto `entries` (entry id -> entry dict, in play order)."""
+    kind = op.get("op")
+    entry_id = op.get("id")
+    if kind == "add" and entry_id not in entries:
+        entries[entry_id] = op["entry"]
+    elif kind == "remove":
+        entries.pop(entry_id, None)
+    elif kind == "move" and entry_id in entries:
+        order = [key for key in entries if key != entry_id]
+        order.insert(op["position"], entry_id)
+        entries = OrderedDict((key, entries[key]) for key in order)
+    elif kind == "clear":
+        entries.clear()
+    return entries
+
+def _op_id(op: dict) -> int:
+    entry_id = op.get("id")
+    return entry_id if isinstance(entry_id, int) else 0
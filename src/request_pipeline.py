@@ -0,0 +1,322 @@
+import uuid, time, threading, logging, concurrent.futures
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+from src.song import Song
+
+# Ticket states. Anything but pending/resolving is final.
+PENDING = "pending"
+RESOLVING = "resolving"
+QUEUED = "queued"
+NOT_FOUND = "not_found"
+FAILED = "failed"
+
+class PipelineFullError(Exception):
+    """Raised when too many song requests are already waiting to be resolved."""
+
+class SongRequestTicket:
+    """Tracks one song request from submission until it is queued (or not found)."""
+    def __init__(self, prompt: str, clean_mode: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.prompt = prompt
+        self.clean_mode = clean_mode
+        self.status = PENDING
+        self.song: Optional[Song] = None
+        self.found: Optional[Song] = None  # Resolved, but waiting for the requests before it to be queued
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def done(self) -> bool:
+        return self.status not in (PENDING, RESOLVING)
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.id,
+            "prompt": self.prompt,
+            "status": self.status,
+            "song": self.song.name if self.song else None,
+            "author": self.song.author if self.song else None,
+            "url": self.song.url if self.song else None,
+            "duration": self.song.duration if self.song else None,
+            "error": self.error,
+        }
+
+class RequestPipeline:
+    """
+    Resolves song requests on a bounded pool of background threads and queues the songs in the
+    order the requests were submitted.
+
+    `find(prompt, clean_mode)` runs on a worker and returns the Song without queueing it, or None
+    when nothing was found. A found song is passed to `enqueue(song, prompt)` once every request
+    submitted before it is queued or given up on, so a quick search doesn't overtake a slow one.
+    `on_update(ticket_dict)` is called from the worker thread every time a ticket changes state.
+    """
+    def __init__(self, find: Callable[[str, bool], Optional[Song]], enqueue: Callable[[Song, str], None],
+                 max_workers: int = 2, max_pending: int = 50, max_tickets: int = 500,
+                 on_update: Optional[Callable[[dict], None]] = None):
+        self.find = find
+        self.enqueue = enqueue
+        self.max_pending = max_pending
+        self.max_tickets = max_tickets
+        self.on_update = on_update
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+        self._tickets = OrderedDict()
+        self._unqueued = deque()  # Tickets not queued or given up on yet, in submission order
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def submit(self, prompt: str, clean_mode: bool = False) -> SongRequestTicket:
+        """Create a ticket and hand it to the resolver pool. Returns without waiting."""
+        ticket = SongRequestTicket(prompt, clean_mode)
+        with self._lock:
+            if self.pending_count() >= self.max_pending:
+                raise PipelineFullError(f"{self.max_pending} requests are already waiting")
+            self._tickets[ticket.id] = ticket
+            self._unqueued.append(ticket)
+            self._prune()
+        self._executor.submit(self._run, ticket)
+        return ticket
+
+    def get(self, ticket_id: str) -> Optional[dict]:
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            return ticket.to_dict() if ticket else None
+
+    def pending_count(self) -> int:
+        return sum(1 for ticket in self._tickets.values() if not ticket.done)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, ticket: SongRequestTicket):
+        self._update(ticket, RESOLVING)
+        try:
+            song = self.find(ticket.prompt, ticket.clean_mode)
+        except Exception as e:
+            logging.error(f"Failed to resolve request '{ticket.prompt}': {e}")
+            self._update(ticket, FAILED, error=str(e))
+        else:
+            if song is None:
+                self._update(ticket, NOT_FOUND, error="Song not found")
+            else:
+                with self._lock:
+                    ticket.found = song
+        self._flush()
+
+    def _flush(self):
+        """Queue the found songs at the front of the submission order. Holds the flush lock, so they go in in order."""
+        with self._flush_lock:
+            while self._unqueued and (self._unqueued[0].done or self._unqueued[0].found is not None):
+                ticket = self._unqueued.popleft()
+                if ticket.done:
+                    continue
+                try:
+                    self.enqueue(ticket.found, ticket.prompt)
+                except Exception as e:
+                    logging.error(f"Failed to queue request '{ticket.prompt}': {e}")
+                    self._update(ticket, FAILED, error=str(e))
+                else:
+                    self._update(ticket, QUEUED, song=ticket.found)
+
+    def _update(self, ticket: SongRequestTicket, status: str, song: Optional[Song] = None, error: Optional[str] = None):
+        with self._lock:
+            ticket.status = status
+            ticket.song = song or ticket.song
+            ticket.error = error
+            ticket.updated_at = time.time()
+            data = ticket.to_dict()
+        if self.on_update:
+            try:
+                self.on_update(data)
+            except Exception as e:
+                logging.error(f"Request update callback failed: {e}")
+
+    def _prune(self):
+        """Forget the oldest finished tickets once more than `max_tickets` are kept."""
+        excess = len(self._tickets) - self.max_tickets
+        if excess <= 0:
+            return
+        for ticket_id in [t.id for t in self._tickets.values() if t.done][:excess]:
+            del self._tickets[ticket_id]
+
+# A resolved bulk item waits in this state until the items before it are done, then it is queued
+RESOLVED = "resolved"
+
+class BulkItem:
+    """One prompt of a bulk request. Songs that are already known (e.g. from a playlist) start out resolved."""
+    def __init__(self, index: int, prompt: str, song: Optional[Song] = None):
+        self.index = index
+        self.prompt = prompt
+        self.song = song
+        self.status = RESOLVED if song else PENDING
+        self.entry_id: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (QUEUED, NOT_FOUND, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "prompt": self.prompt,
+            "status": self.status,
+            "song": self.song.name if self.song else None,
+            "author": self.song.author if self.song else None,
+            "url": self.song.url if self.song else None,
+            "duration": self.song.duration if self.song else None,
+            "entry_id": self.entry_id,
+            "error": self.error,
+        }
+
+class BulkRequest:
+    """A list of prompts that is queued in the order it was given."""
+    def __init__(self, items: list, clean_mode: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.items = items
+        self.clean_mode = clean_mode
+        self.created_at = time.time()
+        self.finished = threading.Event()
+        self.next = 0  # Index of the first item that isn't queued or given up on yet
+        self.lock = threading.Lock()
+
+    def counts(self) -> dict:
+        counts = {QUEUED: 0, NOT_FOUND: 0, FAILED: 0}
+        for item in self.items:
+            if item.status in counts:
+                counts[item.status] += 1
+        return counts
+
+    def to_dict(self, items: bool = True) -> dict:
+        with self.lock:
+            counts = self.counts()
+            data = {
+                "bulk_id": self.id,
+                "status": "done" if self.finished.is_set() else "resolving",
+                "total": len(self.items),
+                "queued": counts[QUEUED],
+                "not_found": counts[NOT_FOUND],
+                "failed": counts[FAILED],
+            }
+            if items:
+                data["items"] = [item.to_dict() for item in self.items]
+            return data
+
+class BulkEnqueuer:
+    """
+    Resolves the prompts of bulk requests on a bounded pool of background threads and queues the
+    songs in the requested order.
+
+    `find(prompt, clean_mode)` runs on a worker and returns the Song without queueing it, or None.
+    As soon as the items at the front of a request are resolved they are passed to
+    `enqueue([(song, prompt), ...])` together, so the first songs can play while the rest are still
+    resolving. `on_update(bulk_dict, item_dict)` is called from the worker thread every time an item
+    changes state, `bulk_dict` has the request's counts but not its items.
+    """
+    def __init__(self, find: Callable[[str, bool], Optional[Song]], enqueue: Callable[[list], list],
+                 workers: int = 4, max_items: int = 500, max_requests: int = 20,
+                 on_update: Optional[Callable[[dict, dict], None]] = None):
+        self.find = find
+        self.enqueue = enqueue
+        self.max_items = max_items
+        self.max_requests = max_requests
+        self.on_update = on_update
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk")
+        self._requests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, entries: list, clean_mode: bool = False) -> BulkRequest:
+        """
+        Start queueing `entries`, prompts or already known Songs, in order. Returns without waiting.
+        Raises ValueError if there are none or more than `max_items`.
+        """
+        if not entries:
+            raise ValueError("Nothing to queue")
+        if len(entries) > self.max_items:
+            raise ValueError(f"At most {self.max_items} songs can be requested at once, got {len(entries)}")
+        items = [BulkItem(index, entry.url, entry) if isinstance(entry, Song) else BulkItem(index, entry)
+                 for index, entry in enumerate(entries)]
+        bulk = BulkRequest(items, clean_mode)
+        with self._lock:
+            self._requests[bulk.id] = bulk
+            self._prune()
+        # Songs known up front are queued before anything is resolved, the pool takes jobs in order
+        self._executor.submit(self._flush, bulk)
+        for item in items:
+            if item.status == PENDING:
+                self._executor.submit(self._resolve, bulk, item)
+        return bulk
+
+    def get(self, bulk_id: str) -> Optional[dict]:
+        with self._lock:
+            bulk = self._requests.get(bulk_id)
+        return bulk.to_dict() if bulk else None
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _resolve(self, bulk: BulkRequest, item: BulkItem):
+        self._set(bulk, item, RESOLVING)
+        try:
+            song = self.find(item.prompt, bulk.clean_mode)
+        except Exception as e:
+            logging.error(f"Failed to resolve '{item.prompt}': {e}")
+            self._set(bulk, item, FAILED, error=str(e))
+        else:
+            if song is None:
+                self._set(bulk, item, NOT_FOUND, error="Song not found")
+            else:
+                self._set(bulk, item, RESOLVED, song=song)
+        self._flush(bulk)
+
+    def _flush(self, bulk: BulkRequest):
+        """Queue the resolved items at the front of the request. Holds the request's lock, so batches go in in order."""
+        updates = []
+        with bulk.lock:
+            batch = []
+            while bulk.next < len(bulk.items) and (bulk.items[bulk.next].done or bulk.items[bulk.next].status == RESOLVED):
+                item = bulk.items[bulk.next]
+                bulk.next += 1
+                if item.status == RESOLVED:
+                    batch.append(item)
+            if batch:
+                try:
+                    ids = self.enqueue([(item.song, item.prompt) for item in batch])
+                except Exception as e:
+                    logging.error(f"Failed to queue {len(batch)} songs: {e}")
+                    ids = None
+                for position, item in enumerate(batch):
+                    if ids is None:
+                        item.status, item.error = FAILED, "Failed to queue"
+                    else:
+                        item.status, item.entry_id = QUEUED, ids[position]
+                    updates.append(item.to_dict())
+            if bulk.next == len(bulk.items):
+                bulk.finished.set()
+        for item in updates:
+            self._notify(bulk, item)
+
+    def _set(self, bulk: BulkRequest, item: BulkItem, status: str, song: Optional[Song] = None, error: Optional[str] = None):
+        with bulk.lock:
+            item.status = status
+            item.song = song or item.song
+            item.error = error
+            data = item.to_dict()
+        self._notify(bulk, data)
+
+    def _notify(self, bulk: BulkRequest, item: dict):
+        if self.on_update:
+            try:
+                self.on_update(bulk.to_dict(items=False), item)
+            except Exception as e:
+                logging.error(f"Bulk update callback failed: {e}")
+
+    def _prune(self):
+        """Forget the oldest finished requests once more than `max_requests` are kept."""
+        excess = len(self._requests) - self.max_requests
+        if excess <= 0:
+            return
+        for bulk_id in [bulk.id for bulk in self._requests.values() if bulk.finished.is_set()][:excess]:
+            del self._requests[bulk_id]
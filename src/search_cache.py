@@ -0,0 +1,188 @@
+import os, json, time, sqlite3, threading, unicodedata, logging
+from collections import OrderedDict
+from typing import Optional
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold and collapse whitespace so trivially different prompts share a cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", prompt).casefold().split())
+
+class SearchCache:
+    """
+    Two-tier cache for search results keyed by normalized prompt and clean-mode flag.
+
+    The first tier is an in-memory LRU, the second an SQLite table that survives restarts.
+    Entries older than `ttl` seconds are treated as misses and removed.
+    """
+    def __init__(self, path: Optional[str], max_memory_entries: int = 256,
+                 max_disk_entries: int = 5000, ttl: Optional[float] = 7 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created_at, result)
+        self._lock = threading.Lock()
+        self._db = None
+
+    @staticmethod
+    def make_key(prompt: str, restricted: bool) -> str:
+        return f"{'clean' if restricted else 'any'}:{normalize_prompt(prompt)}"
+
+    def get(self, prompt: str, restricted: bool = False) -> Optional[tuple]:
+        """Return the cached (song_link, song_name, song_duration, song_author) or None."""
+        key = self.make_key(prompt, restricted)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and not self._expired(entry[0], now):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+
+            row = self._disk_get(key)
+            if row and not self._expired(row[0], now):
+                created_at, result = row
+                self._memory_put(key, created_at, result)
+                self._disk_touch(key, now)
+                self.disk_hits += 1
+                return result
+            if row:
+                self._disk_delete(key)
+            self.misses += 1
+            return None
+
+    def put(self, prompt: str, restricted: bool, result: tuple):
+        key = self.make_key(prompt, restricted)
+        now = time.time()
+        result = tuple(result)
+        with self._lock:
+            self._memory_put(key, now, result)
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO searches (key, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result), now, now)
+                )
+                db.execute(
+                    "DELETE FROM searches WHERE key IN ("
+                    "SELECT key FROM searches ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Search cache write failed: {e}")
+
+    def invalidate(self, prompt: str, restricted: bool = False):
+        key = self.make_key(prompt, restricted)
+        with self._lock:
+            self._memory.pop(key, None)
+            self._disk_delete(key)
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from both tiers. Returns how many disk rows were removed."""
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [k for k, (created_at, _) in self._memory.items() if created_at < cutoff]:
+                del self._memory[key]
+            db = self._connect()
+            if db is None:
+                return 0
+            try:
+                removed = db.execute("DELETE FROM searches WHERE created_at < ?", (cutoff,)).rowcount
+                db.commit()
+                return removed
+            except sqlite3.Error as e:
+                logging.error(f"Search cache purge failed: {e}")
+                return 0
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            db = self._connect()
+            if db is not None:
+                db.execute("DELETE FROM searches")
+                db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _memory_put(self, key: str, created_at: float, result: tuple):
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite tier lazily. A broken database only disables the disk tier."""
+        if self._db is not None or not self.path:
+            return self._db
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        except sqlite3.Error as e:
+            logging.error(f"Search cache database unavailable, using memory only: {e}")
+            self.path = None
+        return self._db
+
+    def _disk_get(self, key: str):
+        db = self._connect()
+        if db is None:
+            return None
+        try:
+            row = db.execute("SELECT created_at, result FROM searches WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Search cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        return row[0], tuple(json.loads(row[1]))
+
+    def _disk_touch(self, key: str, now: float):
+        try:
+            self._db.execute("UPDATE searches SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Search cache write failed: {e}")
+
+    def _disk_delete(self, key: str):
+        db = self._connect()
+        if db is None:
+            return
+        try:
+            db.execute("DELETE FROM searches WHERE key = ?", (key,))
+            db.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Search cache write failed: {e}")
@@ -1,3 +1,54 @@
+import re
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Return the YouTube video id from a watch, youtu.be, shorts or embed URL, or None."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host == "youtu.be":
+        return parsed.path.lstrip("/").split("/")[0] or None
+    if host in YOUTUBE_HOSTS:
+        if parsed.path == "/watch":
+            return (parse_qs(parsed.query).get("v") or [None])[0]
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            return parts[1]
+    return None
+
+def video_id_from_prompt(prompt: str) -> Optional[str]:
+    """
+    Return the video id if a song request is a YouTube URL (the scheme may be left out) or a bare
+    video id, or None if it should be searched for. A bare id needs a digit or a capital letter,
+    so that ordinary 11 letter words are still searched.
+    """
+    prompt = (prompt or "").strip()
+    if not prompt or " " in prompt:
+        return None
+    if VIDEO_ID_PATTERN.match(prompt):
+        return prompt if re.search(r"[0-9A-Z]", prompt) else None
+    if "://" not in prompt:
+        prompt = "https://" + prompt
+    video_id = extract_video_id(prompt)
+    return video_id if video_id and VIDEO_ID_PATTERN.match(video_id) else None
+
+def playlist_id_from_prompt(prompt: str) -> Optional[str]:
+    """Return the playlist id if a prompt is a YouTube playlist URL (youtube.com/playlist?list=...), or None."""
+    prompt = (prompt or "").strip()
+    if not prompt or " " in prompt:
+        return None
+    if "://" not in prompt:
+        prompt = "https://" + prompt
+    parsed = urlparse(prompt)
+    if (parsed.hostname or "").lower() in YOUTUBE_HOSTS and parsed.path == "/playlist":
+        return (parse_qs(parsed.query).get("list") or [None])[0]
+    return None
+
 class Song:
     """Simple object to represent songs. Duration is in seconds."""
     def __init__(self, name: str, url: str, duration: int, author: str):
@@ -6,6 +57,12 @@ class Song:
         self.duration = duration
         self.author = author
         self.active = False
+        self.requested_at: Optional[float] = None  # When it was requested, until its audio first starts
+
+    @property
+    def video_id(self) -> str:
+        """Stable key for this song's video, falls back to the URL for non-YouTube links."""
+        return extract_video_id(self.url) or self.url
 
     def __eq__(self, other):
         return isinstance(other, Song) and self.url == other.url
@@ -0,0 +1,100 @@
+import threading, logging, concurrent.futures
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from src.song import Song
+
+class Speculation:
+    """The speculative fetch for one search: its likely pick and the candidates it was chosen from."""
+    def __init__(self, song: Song, candidates: list):
+        self.song = song
+        self.candidates = {candidate.video_id: candidate for candidate in candidates}
+        self.cancelled = threading.Event()
+        self.future: Optional[concurrent.futures.Future] = None
+
+class SpeculativePrefetcher:
+    """
+    Resolves the stream URL of a search's likely pick while the user is still choosing.
+
+    `speculate(key, candidates)` runs `fetch(song)` for the first candidate of search `key` on a
+    worker thread, and passes a non-empty result to `store(song, url)`. When one of the candidates
+    is picked, `pick` keeps the work if it was for that song and otherwise cancels it: a fetch that
+    hasn't started is dropped, and a running one finishes without its result being stored.
+    Only the newest `max_searches` searches are remembered.
+    """
+    def __init__(self, fetch: Callable[[Song], Optional[str]], store: Callable[[Song, str], None],
+                 workers: int = 1, max_searches: int = 32):
+        self.fetch = fetch
+        self.store = store
+        self.max_searches = max_searches
+        self.stats = {"speculated": 0, "used": 0, "cancelled": 0}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculate")
+        self._searches = OrderedDict()  # Search key -> Speculation
+        self._lock = threading.Lock()
+
+    def speculate(self, key: str, candidates: list):
+        """Start fetching the first of `candidates` (Songs, best match first) unless it already is."""
+        if not candidates:
+            return
+        with self._lock:
+            current = self._searches.pop(key, None)
+            if current and current.song.video_id == candidates[0].video_id and not current.cancelled.is_set():
+                current.candidates.update((candidate.video_id, candidate) for candidate in candidates)
+                self._searches[key] = current
+                return
+            if current:
+                self._cancel(current)
+            speculation = Speculation(candidates[0], candidates)
+            self._searches[key] = speculation
+            while len(self._searches) > self.max_searches:
+                self._cancel(self._searches.popitem(last=False)[1])
+            self.stats["speculated"] += 1
+            speculation.future = self._executor.submit(self._run, speculation)
+
+    def pick(self, video_id: str, timeout: float = 10) -> Optional[Song]:
+        """
+        Record that a video was picked. Speculations of the searches it was a candidate of are
+        cancelled unless they were for it, in which case this waits up to `timeout` seconds for it.
+
+        Returns:
+            Song or None: The candidate's song, or None if it wasn't a candidate of a remembered search.
+        """
+        picked, kept = None, None
+        with self._lock:
+            for key, speculation in list(self._searches.items()):
+                candidate = speculation.candidates.get(video_id)
+                if candidate is None:
+                    continue
+                picked = candidate
+                del self._searches[key]
+                if speculation.song.video_id == video_id:
+                    kept = speculation
+                    self.stats["used"] += 1
+                else:
+                    self._cancel(speculation)
+        if kept is not None:
+            try:
+                kept.future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                logging.info(f"Still resolving {kept.song.name}, queueing it anyway")
+            except Exception:
+                pass  # _run logs it, the prefetcher tries again once it is queued
+        return picked
+
+    def _cancel(self, speculation: Speculation):
+        speculation.cancelled.set()
+        if speculation.future is not None and not speculation.future.done():
+            speculation.future.cancel()
+            self.stats["cancelled"] += 1
+
+    def _run(self, speculation: Speculation) -> Optional[str]:
+        if speculation.cancelled.is_set():
+            return None
+        try:
+            url = self.fetch(speculation.song)
+        except Exception as e:
+            logging.error(f"Speculative fetch failed for {speculation.song.name}: {e}")
+            return None
+        if url and not speculation.cancelled.is_set():
+            self.store(speculation.song, url)
+        return url
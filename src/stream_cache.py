@@ -0,0 +1,126 @@
+import os, json, time, threading, logging
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from src.utils.logger import DebouncedJsonWriter
+
+def parse_stream_expiry(url: str) -> Optional[float]:
+    """
+    Return the unix time a signed stream URL stops working, or None if it doesn't say.
+    googlevideo URLs carry it as an `expire=` query parameter or an `/expire/<ts>/` path segment.
+    """
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    values = parse_qs(parsed.query).get("expire")
+    if not values:
+        parts = parsed.path.split("/")
+        if "expire" in parts and parts.index("expire") + 1 < len(parts):
+            values = [parts[parts.index("expire") + 1]]
+    try:
+        return float(values[0]) if values else None
+    except ValueError:
+        return None
+
+class StreamUrlCache:
+    """
+    LRU cache of extracted stream URLs keyed by video id.
+
+    Every entry remembers when its URL expires. Lookups never return a URL that would expire
+    before the caller is done with it, and `needs_refresh` flags entries close to expiry so the
+    prefetcher can renew them ahead of time. Entries are mirrored to `path` and reloaded on start.
+    """
+    def __init__(self, path: Optional[str], max_entries: int = 20, default_ttl: float = 3600,
+                 refresh_margin: float = 30 * 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self._entries = OrderedDict()  # video_id -> {"url", "expires_at", "cached_at"}
+        self._lock = threading.Lock()
+        self._writer = DebouncedJsonWriter(path, delay=2.0) if path else None
+        self._load()
+
+    def put(self, video_id: str, url: str):
+        now = time.time()
+        expires_at = parse_stream_expiry(url) or now + self.default_ttl
+        with self._lock:
+            self._entries[video_id] = {"url": url, "expires_at": expires_at, "cached_at": now}
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logging.debug(f"Evicted cached URL for: {evicted}")
+            self._persist()
+
+    def get(self, video_id: str, min_valid_for: float = 0) -> Optional[str]:
+        """Return the cached URL if it stays valid for at least `min_valid_for` more seconds."""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                return None
+            if entry["expires_at"] - time.time() <= min_valid_for:
+                if entry["expires_at"] <= time.time():
+                    del self._entries[video_id]
+                    self._persist()
+                return None
+            self._entries.move_to_end(video_id)
+            return entry["url"]
+
+    def needs_refresh(self, video_id: str) -> bool:
+        """True if there is no usable entry or it expires within `refresh_margin`."""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return entry is None or entry["expires_at"] - time.time() <= self.refresh_margin
+
+    def expires_at(self, video_id: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return entry["expires_at"] if entry else None
+
+    def discard(self, video_id: str):
+        with self._lock:
+            if self._entries.pop(video_id, None) is not None:
+                self._persist()
+
+    def __contains__(self, video_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(video_id)
+            return entry is not None and entry["expires_at"] > time.time()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def flush(self):
+        if self._writer:
+            self._writer.flush()
+
+    def _persist(self):
+        if self._writer:
+            self._writer.schedule({k: dict(v) for k, v in self._entries.items()})
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f) or {}
+        except Exception as e:
+            logging.error(f"Ignoring unreadable stream URL cache {self.path}: {e}")
+            return
+        now = time.time()
+        for video_id, entry in data.items():
+            try:
+                if float(entry["expires_at"]) > now:
+                    self._entries[video_id] = {
+                        "url": entry["url"],
+                        "expires_at": float(entry["expires_at"]),
+                        "cached_at": float(entry.get("cached_at", now)),
+                    }
+            except (KeyError, TypeError, ValueError):
+                continue
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logging.info(f"Loaded {len(self._entries)} cached stream URLs")
@@ -0,0 +1,239 @@
+import os, json, gzip, glob, threading, time, datetime, logging
+from typing import Iterator, Iterable, Optional
+
+# Stamp used in rotated segment names, sorts chronologically as a plain string
+SEGMENT_STAMP_FORMAT = "%Y%m%dT%H%M%S%f"
+
+class HistoryStore:
+    """
+    Append-only history log stored as JSON Lines (one entry per line).
+
+    New entries go to `<directory>/<name>.jsonl`. Once that segment grows past `max_bytes`
+    or is older than `max_age` seconds it is rotated to `<name>.<stamp>.jsonl`, and a
+    background thread compacts rotated segments into `.jsonl.gz` archives.
+    Appending never reads the existing history, so the cost of a write doesn't grow with it.
+    """
+    def __init__(self, directory: str, name: str, max_bytes: int = 1024 * 1024,
+                 max_age: Optional[float] = 7 * 24 * 3600, max_segments: Optional[int] = None,
+                 legacy_path: Optional[str] = None):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_segments = max_segments
+        self.active_path = os.path.join(directory, f"{name}.jsonl")
+        self._lock = threading.Lock()
+        self._handle = None
+        self._segment_started = None
+        self._compaction_thread = None
+        self._compaction_lock = threading.Lock()
+        self._compaction_running = False
+        self._compaction_requested = False  # Set by rotations during a compaction, it then runs again
+
+        os.makedirs(directory, exist_ok=True)
+        if legacy_path:
+            self.migrate_legacy(legacy_path)
+
+    def append(self, entry: dict):
+        """Append a single entry to the active segment."""
+        self.append_many([entry])
+
+    def append_many(self, entries: Iterable[dict]):
+        """Append several entries with a single write."""
+        lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+        if not lines:
+            return
+        with self._lock:
+            self._maybe_rotate()
+            handle = self._open_active()
+            handle.write(lines)
+            handle.flush()
+
+    def iter_entries(self) -> Iterator[dict]:
+        """Stream every entry, oldest first, without loading the whole history into memory."""
+        for path in self.segments() + [self.active_path]:
+            yield from self._iter_file(path)
+
+    def tail(self, count: int) -> list:
+        """Return the newest `count` entries, oldest first."""
+        from collections import deque
+        return list(deque(self.iter_entries(), maxlen=count))
+
+    def segments(self) -> list:
+        """Rotated segments (plain and compacted), oldest first."""
+        pattern = os.path.join(self.directory, f"{glob.escape(self.name)}.*.jsonl*")
+        paths = set(glob.glob(pattern))
+        # Mid-compaction both copies can exist for a moment, prefer the finished archive
+        return sorted(p for p in paths
+                      if p.endswith(".jsonl.gz") or (p.endswith(".jsonl") and p + ".gz" not in paths))
+
+    def rotate(self):
+        """Close the active segment, move it aside and schedule compaction."""
+        with self._lock:
+            self._rotate_locked()
+
+    def compact(self):
+        """Gzip rotated plain segments and drop the oldest ones beyond `max_segments`."""
+        for path in self.segments():
+            if not path.endswith(".jsonl"):
+                continue
+            try:
+                with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb") as dst:
+                    for chunk in iter(lambda: src.read(64 * 1024), b""):
+                        dst.write(chunk)
+                os.replace(path + ".gz.tmp", path + ".gz")
+                os.remove(path)
+            except Exception as e:
+                logging.error(f"Failed to compact history segment {path}: {e}")
+
+        if self.max_segments is not None:
+            for path in self.segments()[:-self.max_segments or None]:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.error(f"Failed to remove old history segment {path}: {e}")
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """Block until a running background compaction has finished."""
+        thread = self._compaction_thread
+        if thread:
+            thread.join(timeout)
+
+    def migrate_legacy(self, legacy_path: str) -> int:
+        """
+        One-shot import of an old JSON array history file.
+        Its entries become the oldest rotated segment and the file is renamed to `.migrated`.
+
+        Returns:
+            int: Number of migrated entries.
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        try:
+            with open(legacy_path, "r") as f:
+                songs = json.load(f)
+        except Exception as e:
+            logging.error(f"Could not read legacy history {legacy_path}, leaving it in place: {e}")
+            return 0
+        if not isinstance(songs, list):
+            songs = []
+
+        songs = [s for s in songs if isinstance(s, dict)]
+        if songs:
+            started = _parse_timestamp(songs[0].get("timestamp")) or datetime.datetime.fromtimestamp(0)
+            path = self._segment_path(started)
+            with open(path + ".tmp", "w") as f:
+                for entry in songs:
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            os.replace(path + ".tmp", path)
+        os.replace(legacy_path, legacy_path + ".migrated")
+        logging.info(f"Migrated {len(songs)} history entries from {legacy_path}")
+        self._start_compaction()
+        return len(songs)
+
+    def close(self):
+        with self._lock:
+            if self._handle:
+                self._handle.close()
+                self._handle = None
+
+    def _open_active(self):
+        if self._handle is None or self._handle.closed:
+            self._handle = open(self.active_path, "a")
+            if self._segment_started is None:
+                self._segment_started = self._read_segment_start()
+        return self._handle
+
+    def _read_segment_start(self) -> float:
+        """Start time of the active segment, taken from its first entry when possible."""
+        try:
+            with open(self.active_path, "r") as f:
+                first = json.loads(f.readline())
+            started = _parse_timestamp(first.get("timestamp"))
+            if started:
+                return started.timestamp()
+        except Exception:
+            pass
+        return time.time()
+
+    def _maybe_rotate(self):
+        try:
+            size = os.path.getsize(self.active_path)
+        except OSError:
+            return
+        if size == 0:
+            return
+        if self._segment_started is None:
+            self._segment_started = self._read_segment_start()
+        too_big = self.max_bytes is not None and size >= self.max_bytes
+        too_old = self.max_age is not None and time.time() - self._segment_started >= self.max_age
+        if too_big or too_old:
+            self._rotate_locked()
+
+    def _rotate_locked(self):
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+        if not os.path.exists(self.active_path) or os.path.getsize(self.active_path) == 0:
+            return
+        started = datetime.datetime.fromtimestamp(self._segment_started or self._read_segment_start())
+        os.replace(self.active_path, self._segment_path(started))
+        self._segment_started = None
+        self._start_compaction()
+
+    def _segment_path(self, started: datetime.datetime) -> str:
+        stamp = started.strftime(SEGMENT_STAMP_FORMAT)
+        path = os.path.join(self.directory, f"{self.name}.{stamp}.jsonl")
+        # Two segments started in the same microsecond are unlikely but would overwrite each other
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            started += datetime.timedelta(microseconds=1)
+            stamp = started.strftime(SEGMENT_STAMP_FORMAT)
+            path = os.path.join(self.directory, f"{self.name}.{stamp}.jsonl")
+        return path
+
+    def _start_compaction(self):
+        with self._compaction_lock:
+            self._compaction_requested = True
+            if self._compaction_running:
+                return  # It goes round again before it exits and picks up the new segment
+            self._compaction_running = True
+            self._compaction_thread = threading.Thread(target=self._compact_until_done, daemon=True)
+            self._compaction_thread.start()
+
+    def _compact_until_done(self):
+        """Compact until no rotation asked for another pass while the last one ran."""
+        while True:
+            with self._compaction_lock:
+                if not self._compaction_requested:
+                    self._compaction_running = False
+                    return
+                self._compaction_requested = False
+            try:
+                self.compact()
+            except Exception as e:
+                logging.error(f"History compaction failed: {e}")
+
+    @staticmethod
+    def _iter_file(path: str) -> Iterator[dict]:
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rt") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A torn write (e.g. power loss mid-line) only costs that one entry
+                        logging.warning(f"Skipping corrupt history line in {path}")
+        except FileNotFoundError:
+            # The segment was compacted between listing and opening it
+            if not path.endswith(".gz") and os.path.exists(path + ".gz"):
+                yield from HistoryStore._iter_file(path + ".gz")
+
+def _parse_timestamp(value) -> Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,67 +1,135 @@
-import os, json, datetime
+import os, json, datetime, threading, time, logging
+
+from src.utils.history import HistoryStore
 
 # TODO - Add error logger to log errors to a file with extensive infomation
 
 # TODO - Add logging to skipped songs, log the song skipped and the next song to play
 # TODO - Add logging to paused songs, Log the song that was paused or unpaused
 
-CURRENT_SONG = os.path.join(os.path.dirname(__file__), "..", "logs", "currently_playing.json")
-CURRENT_RESTRICTION_MODE = os.path.join(os.path.dirname(__file__), "..", "logs", "current_restriction_mode.json")
-ALL_QUEUED_SONGS = os.path.join(os.path.dirname(__file__), "..", "logs", "all_queued_songs.json")
-ALL_PLAYED_SONGS = os.path.join(os.path.dirname(__file__), "..", "logs", "all_played_songs.json")
+LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
+CURRENT_SONG = os.path.join(LOG_DIR, "currently_playing.json")
+CURRENT_RESTRICTION_MODE = os.path.join(LOG_DIR, "current_restriction_mode.json")
+# Legacy JSON array history files, migrated into the JSON Lines history stores on first use
+ALL_QUEUED_SONGS = os.path.join(LOG_DIR, "all_queued_songs.json")
+ALL_PLAYED_SONGS = os.path.join(LOG_DIR, "all_played_songs.json")
+
+# History segments are rotated once they reach this size or age
+HISTORY_MAX_BYTES = 1024 * 1024
+HISTORY_MAX_AGE = 7 * 24 * 3600
+
+_history_stores = {}
+_history_lock = threading.Lock()
+
+def current_song_data(song, active: bool = False, paused: bool = False):
+    """Build the currently playing record for `song`, or None when nothing is playing."""
+    if song is None:
+        return None
+    return {
+        "name": song.name,
+        "author": song.author,
+        "duration": song.duration,
+        "url": song.url,
+        "played_at": datetime.datetime.now().isoformat(),
+        "active": active,  # Add active status
+        "paused": paused   # Add paused status
+    }
 
 def write_current_song(song, active: bool = False, paused: bool = False):
     os.makedirs(os.path.dirname(CURRENT_SONG), exist_ok=True)
-    if song is None:
-        data = None
-    else:
-        data = {
-            "name": song.name,
-            "author": song.author,
-            "duration": song.duration,
-            "url": song.url,
-            "played_at": datetime.datetime.now().isoformat(),
-            "active": active,  # Add active status
-            "paused": paused   # Add paused status
-        }
+    data = current_song_data(song, active, paused)
     with open(CURRENT_SONG, "w") as f:
         json.dump(data, f, indent=2)
-        
+
+class DebouncedJsonWriter:
+    """
+    Mirrors a value to a JSON file from a background thread.
+    Bursts of updates within `delay` seconds collapse into a single write of the latest value,
+    and the file is replaced atomically so readers never see a half-written document.
+    """
+    def __init__(self, path: str, delay: float = 0.5):
+        self.path = path
+        self.delay = delay
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._pending = False
+        self._data = None
+        self._thread = None
+
+    def schedule(self, data):
+        with self._condition:
+            self._data = data
+            self._pending = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self):
+        """Write any pending value immediately."""
+        with self._write_lock:
+            with self._condition:
+                if not self._pending:
+                    return
+                data = self._data
+                self._pending = False
+            self._write(data)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            time.sleep(self.delay)  # Let a burst of updates settle first
+            self.flush()
+
+    def _write(self, data):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to write {self.path}: {e}")
+
 def write_current_restriction_mode(clean: bool = False):
     os.makedirs(os.path.dirname(CURRENT_RESTRICTION_MODE), exist_ok=True)
     data = {"clean mode": bool(clean)}
     with open(CURRENT_RESTRICTION_MODE, "w") as f:
         json.dump(data, f, indent=2)
         
-def write_played_song(song):
-    os.makedirs(os.path.dirname(ALL_PLAYED_SONGS), exist_ok=True)
-    if song is None:
-        return
-    data = {
+def _history_store(path: str, name: str) -> HistoryStore:
+    """Return the shared history store for `name`, creating it (and migrating `path`) on first use."""
+    with _history_lock:
+        store = _history_stores.get(name)
+        if store is None:
+            store = HistoryStore(
+                LOG_DIR, name,
+                max_bytes=HISTORY_MAX_BYTES,
+                max_age=HISTORY_MAX_AGE,
+                legacy_path=path
+            )
+            _history_stores[name] = store
+        return store
+
+def get_played_history() -> HistoryStore:
+    return _history_store(ALL_PLAYED_SONGS, "all_played_songs")
+
+def get_queued_history() -> HistoryStore:
+    return _history_store(ALL_QUEUED_SONGS, "all_queued_songs")
+
+def _played_entry(song) -> dict:
+    return {
         "name": song.name,
         "author": song.author,
         "duration": song.duration,
         "url": song.url,
         "timestamp": datetime.datetime.now().isoformat()
     }
-    # We have to read all the data in the file and and add it before the new song to prevent overwriting
-    if os.path.exists(ALL_PLAYED_SONGS):
-        with open(ALL_PLAYED_SONGS, "r") as f:
-            try:
-                songs = json.load(f)
-            except Exception:
-                songs = []
-    else:
-        songs = []
-    songs.append(data)
-    with open(ALL_PLAYED_SONGS, "w") as f:
-        json.dump(songs, f, indent=2)
 
-def write_queued_song(song, search_prompt, active: bool = False):
-    os.makedirs(os.path.dirname(ALL_QUEUED_SONGS), exist_ok=True)
-    if song is None:
-        return
-    data = {
+def _queued_entry(song, search_prompt, active: bool = False) -> dict:
+    return {
         "name": song.name,
         "author": song.author,
         "duration": song.duration,
@@ -70,15 +138,17 @@ def write_queued_song(song, search_prompt, active: bool = False):
         "timestamp": datetime.datetime.now().isoformat(),
         "active": active  # Add active status to queue log
     }
-    # We have to read all the data in the file and add it before the new song to prevent overwriting
-    if os.path.exists(ALL_QUEUED_SONGS):
-        with open(ALL_QUEUED_SONGS, "r") as f:
-            try:
-                songs = json.load(f)
-            except Exception:
-                songs = []
-    else:
-        songs = []
-    songs.append(data)
-    with open(ALL_QUEUED_SONGS, "w") as f:
-        json.dump(songs, f, indent=2)
+
+def write_played_song(song):
+    if song is None:
+        return
+    get_played_history().append(_played_entry(song))
+
+def write_queued_song(song, search_prompt, active: bool = False):
+    if song is None:
+        return
+    get_queued_history().append(_queued_entry(song, search_prompt, active))
+
+def write_queued_songs(items):
+    """Log several (song, search_prompt) pairs with a single history write."""
+    get_queued_history().append_many(_queued_entry(song, search_prompt) for song, search_prompt in items if song is not None)
@@ -0,0 +1,116 @@
+import sys
+import os
+# This correctly adds the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import pytest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from src.audio_cache import AudioCache
+
+PAYLOAD = bytes(range(256)) * 4  # 1 KiB
+
+class RangeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        start, end = self.headers["Range"].split("=")[1].split("-")
+        body = PAYLOAD[int(start):int(end) + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{int(start) + len(body) - 1}/{len(PAYLOAD)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(handler):
+    server = HTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/videoplayback"
+
+@pytest.fixture
+def range_url():
+    server, url = serve(RangeHandler)
+    yield url
+    server.shutdown()
+
+def test_audio_cache_downloads_in_chunks_and_evicts_lru(tmp_path, range_url):
+    cache = AudioCache(str(tmp_path), max_bytes=2500, chunk_size=100, range_size=300)
+    first = cache.download("video1", range_url)
+    with open(first, "rb") as f:
+        assert f.read() == PAYLOAD
+    cache.download("video2", range_url)
+    cache.path_for("video1")  # video1 is now more recently used than video2
+    cache.download("video3", range_url)
+
+    assert cache.total_bytes() == 2048
+    assert cache.is_cached("video1")
+    assert not cache.is_cached("video2")
+    assert sorted(os.listdir(tmp_path)) == ["video1.audio", "video3.audio"]
+    # A restart picks the finished downloads back up
+    assert AudioCache(str(tmp_path), max_bytes=2500).is_cached("video3")
+
+class TruncatingHandler(RangeHandler):
+    """Announces twice the payload, then runs out of bytes."""
+    def do_GET(self):
+        start = int(self.headers["Range"].split("=")[1].split("-")[0])
+        body = PAYLOAD[start:start + 300]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{start + len(body) - 1}/{2 * len(PAYLOAD)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class WholeFileHandler(RangeHandler):
+    """Ignores the range and sends the whole file, with or without a Content-Length."""
+    send_length = True
+
+    def do_GET(self):
+        self.send_response(200)
+        if self.send_length:
+            self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+def test_audio_cache_discards_truncated_downloads(tmp_path):
+    server, url = serve(TruncatingHandler)
+    try:
+        cache = AudioCache(str(tmp_path), max_bytes=10000, chunk_size=100, range_size=300)
+        assert cache.download("video1", url) is None
+        assert not cache.is_cached("video1")
+        assert os.listdir(tmp_path) == []
+    finally:
+        server.shutdown()
+
+def test_audio_cache_checks_whole_file_responses_against_content_length(tmp_path):
+    server, url = serve(WholeFileHandler)
+    try:
+        cache = AudioCache(str(tmp_path), max_bytes=10000, chunk_size=100, range_size=300)
+        path = cache.download("video1", url)
+        with open(path, "rb") as f:
+            assert f.read() == PAYLOAD
+
+        # Without a size there is nothing to check the download against
+        WholeFileHandler.send_length = False
+        assert cache.download("video2", url) is None
+        assert sorted(os.listdir(tmp_path)) == ["video1.audio"]
+    finally:
+        WholeFileHandler.send_length = True
+        server.shutdown()
+
+def test_audio_cache_does_not_evict_files_in_use(tmp_path, range_url):
+    playing = {"video1"}
+    cache = AudioCache(str(tmp_path), max_bytes=2500, chunk_size=100, range_size=300, in_use=lambda: playing)
+    cache.download("video1", range_url)
+    cache.download("video2", range_url)
+    cache.download("video3", range_url)
+
+    # video1 is the least recently used but the player is reading it
+    assert cache.is_cached("video1")
+    assert not cache.is_cached("video2")
+    assert cache.is_cached("video3")
+
+    playing.clear()
+    cache.download("video4", range_url)
+    assert not cache.is_cached("video1")
+    assert sorted(os.listdir(tmp_path)) == ["video3.audio", "video4.audio"]
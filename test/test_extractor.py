@@ -0,0 +1,34 @@
+import sys
+import os
+# This correctly adds the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from unittest.mock import patch
+from src.extractor import ExtractionService
+
+def test_extraction_service_reuses_youtubedl_per_thread():
+    info = {"id": "abc123", "title": "Fake Song", "duration": 120, "uploader": "Fake Author",
+            "url": "https://rr1.googlevideo.com/videoplayback?expire=1"}
+    with patch('yt_dlp.YoutubeDL') as MockYoutubeDL:
+        MockYoutubeDL.return_value.extract_info.return_value = info
+        service = ExtractionService(mode="thread")
+        for _ in range(3):
+            summary = service.extract("https://www.youtube.com/watch?v=abc123")
+    assert MockYoutubeDL.call_count == 1
+    assert summary["stream_url"] == info["url"]
+    assert summary["author"] == "Fake Author"
+
+def test_extraction_service_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        ExtractionService(mode="gpu")
+
+def test_unknown_extraction_mode_falls_back_to_thread():
+    import subprocess
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    result = subprocess.run([sys.executable, "-c", "import src.media_scanner as m; print(m.EXTRACTION_MODE)"],
+                            cwd=root, env={**os.environ, "JUKEBOX_EXTRACTION_MODE": "procss"},
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "thread"
+    assert "Unknown JUKEBOX_EXTRACTION_MODE 'procss'" in result.stderr
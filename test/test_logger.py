@@ -1,15 +1,101 @@
+import sys
+import os
+import json
+import threading
+# This correctly adds the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.history import HistoryStore
+
 def test_log_file_creation():
     # Verify log files are created in correct location
     raise NotImplementedError
-    
-def test_concurrent_logging():
+
+def test_concurrent_logging(tmp_path):
     # Test multiple threads writing logs simultaneously
-    raise NotImplementedError
-    
-def test_log_file_corruption_recovery():
+    store = HistoryStore(str(tmp_path), "played")
+
+    def writer(n):
+        for i in range(50):
+            store.append({"writer": n, "i": i})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    entries = list(store.iter_entries())
+    assert len(entries) == 400
+    for n in range(8):
+        assert [e["i"] for e in entries if e["writer"] == n] == list(range(50))
+
+def test_log_file_corruption_recovery(tmp_path):
     # Test behavior when log files are corrupted
-    raise NotImplementedError
-    
+    store = HistoryStore(str(tmp_path), "played")
+    store.append({"name": "First"})
+    store.close()
+    with open(store.active_path, "a") as f:
+        f.write('{"name": "Torn wri')  # Simulate a write cut off by power loss
+        f.write("\n")
+    store.append({"name": "Second"})
+
+    assert [e["name"] for e in store.iter_entries()] == ["First", "Second"]
+
 def test_disk_space_handling():
     # Test behavior when disk is full
-    raise NotImplementedError
\ No newline at end of file
+    raise NotImplementedError
+
+def test_history_rotation_and_compaction(tmp_path):
+    store = HistoryStore(str(tmp_path), "played", max_bytes=200)
+    for i in range(30):
+        store.append({"name": f"Song {i}", "timestamp": "2025-01-01T12:00:00"})
+    store.rotate()
+    store.wait_for_compaction(timeout=5)
+
+    segments = store.segments()
+    assert len(segments) > 1
+    assert all(path.endswith(".jsonl.gz") for path in segments)
+    # Readback streams archives and the active segment in order
+    assert [e["name"] for e in store.iter_entries()] == [f"Song {i}" for i in range(30)]
+    assert [e["name"] for e in store.tail(2)] == ["Song 28", "Song 29"]
+
+def test_history_migrates_legacy_array_once(tmp_path):
+    legacy = tmp_path / "all_played_songs.json"
+    legacy.write_text(json.dumps([
+        {"name": "Old 1", "timestamp": "2024-01-01T12:00:00"},
+        {"name": "Old 2", "timestamp": "2024-01-02T12:00:00"},
+    ]))
+    store = HistoryStore(str(tmp_path), "all_played_songs", legacy_path=str(legacy))
+    store.append({"name": "New", "timestamp": "2025-01-01T12:00:00"})
+
+    assert not legacy.exists()
+    assert (tmp_path / "all_played_songs.json.migrated").exists()
+    assert [e["name"] for e in store.iter_entries()] == ["Old 1", "Old 2", "New"]
+
+    # A second store on the same directory must not migrate again
+    again = HistoryStore(str(tmp_path), "all_played_songs", legacy_path=str(legacy))
+    assert [e["name"] for e in again.iter_entries()] == ["Old 1", "Old 2", "New"]
+
+def test_segments_rotated_during_compaction_are_compacted(tmp_path):
+    store = HistoryStore(str(tmp_path), "played", max_segments=2)
+    compact, started, release = store.compact, threading.Event(), threading.Event()
+    def lingering_compact():
+        compact()
+        if not started.is_set():
+            # The first pass has listed and compacted its segments but hasn't exited yet
+            started.set()
+            release.wait(5)
+    store.compact = lingering_compact
+
+    for i in range(4):
+        store.append({"name": f"Song {i}", "timestamp": "2025-01-01T12:00:00"})
+        store.rotate()
+        started.wait(5)  # The other rotations land while the first compaction is still running
+    release.set()
+    store.wait_for_compaction(timeout=5)
+
+    segments = store.segments()
+    assert all(path.endswith(".jsonl.gz") for path in segments)
+    assert len(segments) == 2
+    assert [e["name"] for e in store.iter_entries()] == ["Song 2", "Song 3"]
@@ -3,8 +3,16 @@ import os
 # This correctly adds the project root to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import pytest
 from unittest.mock import patch, MagicMock
 from src.main import search_song
+from src.search_cache import SearchCache
+
+@pytest.fixture(autouse=True)
+def isolated_search_caches():
+    # Keep mocked results out of the real logs/search_cache.sqlite3, and cached ones out of the tests
+    with patch('src.main.search_cache', SearchCache(None)), patch('src.main.candidate_cache', SearchCache(None)):
+        yield
 
 class TestSearchSong:
     @patch('src.main.Search')
@@ -39,4 +47,36 @@ class TestSearchSong:
         MockSearch.return_value.videos = []
         
         result = search_song("Fake Song Not Real lol")
-        assert result == (None, None, None, None)
\ No newline at end of file
+        assert result == (None, None, None, None)
+
+class TestSearchCache:
+    @patch('src.main.Search')
+    def test_repeat_prompt_is_served_from_cache(self, MockSearch, tmp_path):
+        fake_video = MagicMock()
+        fake_video.title = "Mr. Brightside"
+        fake_video.watch_url = "https://youtube.com/watch?v=gGdGFtwCNBE"
+        fake_video.length = 223
+        fake_video.author = "The Killers"
+        MockSearch.return_value.videos = [fake_video]
+
+        cache = SearchCache(str(tmp_path / "search_cache.sqlite3"))
+        with patch('src.main.search_cache', cache):
+            first = search_song("Mr Brightside")
+            second = search_song("  mr   brightside ")
+            clean = search_song("mr brightside", restricted=True)
+
+        assert first == second == clean
+        # The clean-mode lookup is a separate entry and needs its own search
+        assert MockSearch.call_count == 2
+        assert cache.stats()["memory_hits"] == 1
+
+        # A fresh cache on the same file still knows the prompt after a "restart"
+        restarted = SearchCache(str(tmp_path / "search_cache.sqlite3"))
+        assert restarted.get("MR BRIGHTSIDE") == first
+        assert restarted.stats()["disk_hits"] == 1
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        cache = SearchCache(str(tmp_path / "search_cache.sqlite3"), ttl=0)
+        cache.put("song", False, ("url", "name", 1, "author"))
+        assert cache.get("song") is None
+        assert cache.stats()["misses"] == 1
@@ -1,36 +1,249 @@
 import sys
 import os
+import time
 import unittest
 # This correctly adds the project root to the path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from unittest.mock import patch, MagicMock
-from src.media_scanner import skip_playback
+from src import media_scanner
+from src.media_scanner import skip_playback, set_now_playing, get_now_playing, extract_audio_url
+from src.utils.logger import DebouncedJsonWriter
+from src.song import Song
 
 class TestMediaScanner(unittest.TestCase):
-    @patch('src.media_scanner.send_vlc_command')
-    @patch('src.media_scanner.vlc_process')
-    def test_skip_playback_works(self, mock_vlc_process, mock_send_command):
-        # Test when VLC process is active
+    def setUp(self):
+        # The playback state and stats are module globals, every test starts from fresh ones and puts the old ones back
+        fresh = {"current_playing_song": None, "next_song": None, "is_paused": False, "awaiting_input": False,
+                 "played_seconds": 0.0, "resumed_at": None, "handoff_retry_at": 0.0,
+                 "last_track_end": None, "last_handoff_gapless": False}
+        patchers = [patch.object(media_scanner, name, value) for name, value in fresh.items()]
+        patchers.append(patch.dict(media_scanner.playback_stats, {
+            "transitions": 0, "gapless_transitions": 0, "last_gap": None, "max_gap": None, "total_gap": 0.0}))
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch('src.media_scanner.player')
+    def test_skip_playback_works(self, mock_player):
+        # Test when the player is running
         with self.subTest("Active process"):
-            mock_vlc_process.poll.return_value = None  # Simulate active process
+            mock_player.is_running.return_value = True  # Simulate active process
             skip_playback()
-            mock_send_command.assert_called_once_with('stop')
-            mock_send_command.reset_mock()  # Reset for next subtest
+            mock_player.stop.assert_called_once_with()
+            mock_player.reset_mock()  # Reset for next subtest
         
-        # Test when VLC process is None
+        # Test when the player isn't running (never started, or terminated)
         with self.subTest("No process"):
-            mock_vlc_process.__bool__ = lambda self: False  
-            mock_vlc_process.poll.return_value = None  # Not relevant, but safe
-            skip_playback()
-            mock_send_command.assert_not_called()
-            mock_send_command.reset_mock()
-        
-        # Test when VLC process is terminated
-        with self.subTest("Terminated process"):
-            mock_vlc_process.poll.return_value = 0  # Simulate terminated process
+            mock_player.is_running.return_value = False
             skip_playback()
-            mock_send_command.assert_not_called()
+            mock_player.stop.assert_not_called()
+
+    def test_now_playing_snapshot_is_mirrored_to_disk(self):
+        import json, tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "currently_playing.json")
+            mirror = DebouncedJsonWriter(path, delay=60)
+            with patch('src.media_scanner.current_song_mirror', mirror):
+                song = Song("Fake Song", "https://youtube.com/watch?v=abc", 120, "Fake Author")
+                set_now_playing(song, active=True, paused=False)
+                set_now_playing(song, active=True, paused=True)
+
+                # The API reads the in-memory snapshot, the file is written later
+                self.assertEqual(get_now_playing()["name"], "Fake Song")
+                self.assertTrue(get_now_playing()["paused"])
+                self.assertFalse(os.path.exists(path))
+
+                mirror.flush()
+                with open(path) as f:
+                    self.assertTrue(json.load(f)["paused"])
+                set_now_playing(None)
+                self.assertIsNone(get_now_playing())
+
+    def test_concurrent_extractions_are_coalesced(self):
+        import threading, time
+        started = threading.Event()
+        calls = []
+
+        def slow_extract(song):
+            calls.append(song)
+            started.set()
+            time.sleep(0.2)
+            return "https://rr1.googlevideo.com/videoplayback?expire=1"
+
+        song = Song("Fake Song", "https://www.youtube.com/watch?v=abc123", 120, "Fake Author")
+        same_video = Song("Fake Song", "https://youtu.be/abc123", 120, "Fake Author")
+        results = []
+        with patch('src.media_scanner._extract_audio_url', side_effect=slow_extract):
+            leader = threading.Thread(target=lambda: results.append(extract_audio_url(song)))
+            leader.start()
+            started.wait(1)
+            followers = [threading.Thread(target=lambda: results.append(extract_audio_url(same_video))) for _ in range(4)]
+            for t in followers:
+                t.start()
+            for t in [leader] + followers:
+                t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["https://rr1.googlevideo.com/videoplayback?expire=1"] * 5)
+
+    def test_gapless_handoff_follows_vlc_track_change(self):
+        import queue as queue_module, threading
+        from src.player import FakePlayer
+        song_queue, queue_condition = queue_module.Queue(), threading.Condition()
+        first = Song("First", "https://www.youtube.com/watch?v=aaaaaaaaaaa", 200, "Author A")
+        second = Song("Second", "https://www.youtube.com/watch?v=bbbbbbbbbbb", 180, "Author B")
+        song_queue.put(second)
+
+        player = FakePlayer()
+        with patch.object(media_scanner, "player", player), \
+             patch.object(media_scanner, "write_played_song") as played, \
+             patch.object(media_scanner, "set_now_playing"), \
+             patch.object(media_scanner, "_ready_source", return_value="file:///tmp/second.audio"), \
+             patch.object(media_scanner, "GAPLESS_LEAD", 15):
+            media_scanner.current_playing_song = first
+            media_scanner.awaiting_input = False
+            media_scanner.played_seconds, media_scanner.resumed_at = 190, time.time()
+            gapless_before = media_scanner.get_playback_stats()["gapless_transitions"]
+
+            # 10 seconds left: the next song gets enqueued behind the current one
+            self.assertLessEqual(media_scanner._handoff_in(), 0)
+            self.assertTrue(media_scanner._enqueue_next(song_queue, queue_condition))
+            self.assertEqual(player.commands, [("enqueue", "file:///tmp/second.audio")])
+            self.assertIsNone(media_scanner._handoff_in())
+
+            # The bookkeeping follows VLC's own track change
+            ended = time.time()
+            self.assertTrue(media_scanner._handle_player_event("new_input", "file:///tmp/second.audio", ended))
+            media_scanner._start_next_song(song_queue, queue_condition, ended)
+            self.assertIs(media_scanner.get_current_playing_song(), second)
+            self.assertTrue(song_queue.empty())
+            played.assert_called_once_with(second)
+
+            # A late stop event of the old track doesn't end the new one
+            self.assertFalse(media_scanner._handle_player_event("state", "stopped", ended + 0.01))
+            self.assertIs(media_scanner.get_current_playing_song(), second)
+            media_scanner._handle_player_event("state", "playing", ended + 0.05)
+            stats = media_scanner.get_playback_stats()
+            self.assertEqual(stats["gapless_transitions"] - gapless_before, 1)
+            self.assertAlmostEqual(stats["last_gap"], 0.05, places=3)
+
+            media_scanner._finish_current_song()
+
+    def test_skip_is_applied_by_the_scanner_thread(self):
+        import threading
+        from collections import deque
+        from src.player import FakePlayer
+        from src.jukebox_queue import JukeboxQueue
+        queue_condition = threading.Condition()
+        song_queue = JukeboxQueue(queue_condition)
+        first = Song("First", "https://www.youtube.com/watch?v=aaaaaaaaaaa", 200, "Author A")
+        second = Song("Second", "https://www.youtube.com/watch?v=bbbbbbbbbbb", 180, "Author B")
+        song_queue.put(second)
+
+        player = FakePlayer()
+        player.start()
+        with patch.object(media_scanner, "player", player), \
+             patch.object(media_scanner, "scanner_condition", queue_condition), \
+             patch.object(media_scanner, "player_events", deque()), \
+             patch.object(media_scanner, "write_played_song"), \
+             patch.object(media_scanner, "set_now_playing"):
+            media_scanner.current_playing_song = first
+            media_scanner.awaiting_input = False
+            media_scanner.next_song = (second, "file:///tmp/second.audio")
+
+            # The API thread only posts the skip, the playback state is left to the scanner
+            media_scanner.skip_playback()
+            self.assertIs(media_scanner.get_current_playing_song(), first)
+            self.assertNotIn(("stop",), player.commands)
+            self.assertEqual(list(media_scanner.player_events)[-1][:2], ("skip", first))
+
+            # The first song ended on its own before the scanner got to the skip
+            ended = time.time()
+            self.assertTrue(media_scanner._handle_player_event("state", "stopped", ended))
+            media_scanner._start_next_song(song_queue, queue_condition, ended)
+            media_scanner._skip(first)
+            self.assertIs(media_scanner.get_current_playing_song(), second)
+            self.assertNotIn(("stop",), player.commands)
+            self.assertTrue(song_queue.empty())
+
+            media_scanner._skip(second)
+            self.assertIsNone(media_scanner.get_current_playing_song())
+            self.assertIn(("stop",), player.commands)
+            player.shutdown()
+
+    def test_song_removed_after_gapless_enqueue_is_skipped(self):
+        import threading
+        from src.player import FakePlayer
+        from src.jukebox_queue import JukeboxQueue
+        queue_condition = threading.Condition()
+        song_queue = JukeboxQueue(queue_condition)
+        first = Song("First", "https://www.youtube.com/watch?v=aaaaaaaaaaa", 200, "Author A")
+        second = Song("Second", "https://www.youtube.com/watch?v=bbbbbbbbbbb", 180, "Author B")
+        third = Song("Third", "https://www.youtube.com/watch?v=ccccccccccc", 150, "Author C")
+        second_id = song_queue.put(second)
+        song_queue.put(third)
+
+        player = FakePlayer()
+        player.start()
+        with patch.object(media_scanner, "player", player), \
+             patch.object(media_scanner, "write_played_song") as played, \
+             patch.object(media_scanner, "set_now_playing"), \
+             patch.object(media_scanner, "_ready_source", side_effect=lambda song: f"file:///tmp/{song.video_id}.audio"), \
+             patch.object(media_scanner, "GAPLESS_LEAD", 15):
+            media_scanner.current_playing_song = first
+            media_scanner.awaiting_input = False
+            media_scanner.played_seconds, media_scanner.resumed_at = 190, time.time()
+            self.assertTrue(media_scanner._enqueue_next(song_queue, queue_condition))
+
+            # DELETE /queue/{id} after the song was already handed to the player
+            song_queue.remove(second_id)
+            ended = time.time()
+            self.assertTrue(media_scanner._handle_player_event("new_input", "file:///tmp/bbbbbbbbbbb.audio", ended))
+            media_scanner._start_next_song(song_queue, queue_condition, ended)
+
+            self.assertIn(("stop",), player.commands)
+            self.assertIsNone(media_scanner.get_current_playing_song())
+            self.assertEqual(song_queue.qsize(), 1)
+            media_scanner._play_next(song_queue, queue_condition)
+            self.assertIs(media_scanner.get_current_playing_song(), third)
+            self.assertEqual(player.commands[-1], ("play", "file:///tmp/ccccccccccc.audio"))
+            played.assert_called_once_with(third)
+
+            media_scanner._finish_current_song()
+            player.shutdown()
+
+    def test_playback_changes_are_published_as_events(self):
+        import queue as queue_module, threading
+        from src.player import FakePlayer
+        from src.event_log import EventLog
+        song_queue, queue_condition = queue_module.Queue(), threading.Condition()
+        song = Song("First", "https://www.youtube.com/watch?v=aaaaaaaaaaa", 200, "Author A")
+        song_queue.put(song)
+
+        log = EventLog()
+        with patch.object(media_scanner, "player", FakePlayer()), \
+             patch.object(media_scanner, "events", log), \
+             patch.object(media_scanner, "write_played_song"), \
+             patch.object(media_scanner, "current_song_mirror"), \
+             patch.object(media_scanner, "_ready_source", return_value="file:///tmp/first.audio"):
+            media_scanner._play_next(song_queue, queue_condition)
+            media_scanner._handle_player_event("state", "playing", time.time())
+            media_scanner.pause_playback()
+            media_scanner.skip_playback()
+
+        kinds = [(event["type"], event.get("song") and event["song"]["active"]) for event in log.since(0)]
+        self.assertEqual(kinds, [
+            ("now_playing", False),  # Picked off the queue
+            ("now_playing", True),   # Accepted by the player
+            ("progress", None),      # Reported playing
+            ("now_playing", True),   # Paused
+            ("paused", None),
+            ("progress", None),
+            ("now_playing", None),   # Skipped
+        ])
+        self.assertTrue(log.since(0)[4]["paused"])
+        self.assertEqual(log.since(0)[2]["remaining"], 200)
 
     def test_extract_audio_url_valid_video(self):
         # Test URL extraction from known good video
@@ -42,8 +255,40 @@ class TestMediaScanner(unittest.TestCase):
         
     def test_audio_url_caching(self):
         # Verify prefetch cache works correctly
-        raise NotImplementedError
+        import tempfile, time
+        from src.stream_cache import StreamUrlCache, parse_stream_expiry
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stream_cache.json")
+            cache = StreamUrlCache(path)
+            soon = int(time.time()) + 120
+            later = int(time.time()) + 6 * 3600
+            cache.put("soon", f"https://rr1.googlevideo.com/videoplayback?expire={soon}&itag=140")
+            cache.put("later", f"https://rr1.googlevideo.com/videoplayback/expire/{later}/itag/140")
+            cache.put("expired", f"https://rr1.googlevideo.com/videoplayback?expire={int(time.time()) - 1}")
+
+            self.assertEqual(parse_stream_expiry(f"https://x.googlevideo.com/videoplayback?expire={soon}"), soon)
+            self.assertIsNone(cache.get("expired"))
+            # A URL that expires mid-song must not be handed to the player
+            self.assertIsNone(cache.get("soon", min_valid_for=240))
+            self.assertIsNotNone(cache.get("soon", min_valid_for=60))
+            self.assertTrue(cache.needs_refresh("soon"))
+            self.assertFalse(cache.needs_refresh("later"))
+
+            # Entries survive a restart
+            cache.flush()
+            reloaded = StreamUrlCache(path)
+            self.assertIn("later", reloaded)
+            self.assertNotIn("expired", reloaded)
         
     def test_cache_eviction(self):
         # Test that cache doesn't grow infinitely
-        raise NotImplementedError
\ No newline at end of file
+        from src.stream_cache import StreamUrlCache
+        cache = StreamUrlCache(None, max_entries=3)
+        for i in range(10):
+            cache.put(f"video{i}", f"https://example.com/{i}")
+        cache.get("video7")  # Recently used entries are kept
+        cache.put("video10", "https://example.com/10")
+        self.assertEqual(len(cache), 3)
+        self.assertIn("video7", cache)
+        self.assertIn("video10", cache)
+        self.assertNotIn("video8", cache)
\ No newline at end of file
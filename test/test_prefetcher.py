@@ -0,0 +1,51 @@
+import sys
+import os
+import time
+# This correctly adds the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import queue, threading
+from src.prefetcher import Prefetcher
+from src.song import Song
+
+def test_prefetcher_orders_by_queue_position_and_drops_removed_songs():
+    song_queue = queue.Queue()
+    condition = threading.Condition()
+    songs = [Song(f"Song {i}", f"https://www.youtube.com/watch?v=vid{i}", 120, "Author") for i in range(4)]
+    for song in songs:
+        song_queue.put(song)
+
+    release = threading.Event()
+    fetched = []
+    def fetch(song, position):
+        fetched.append(song.name)
+        release.wait(2)
+
+    prefetcher = Prefetcher(song_queue, condition, fetch, needs_fetch=lambda song, position: song.name not in fetched,
+                            ahead=3, workers=1, refresh_interval=60)
+    prefetcher.start()
+    try:
+        deadline = time.time() + 2
+        while not fetched and time.time() < deadline:
+            time.sleep(0.01)
+        # The worker is busy with the head of the queue, the rest wait in queue order
+        assert fetched == ["Song 0"]
+        assert prefetcher.pending() == ["vid1", "vid2"]
+
+        # Song 1 is removed from the queue before its turn, its job must not run
+        with condition:
+            song_queue.queue.remove(songs[1])
+            condition.notify_all()
+        deadline = time.time() + 2
+        while prefetcher.pending() != ["vid2", "vid3"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert prefetcher.pending() == ["vid2", "vid3"]
+
+        release.set()
+        deadline = time.time() + 2
+        while len(fetched) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert fetched == ["Song 0", "Song 2", "Song 3"]
+    finally:
+        release.set()
+        prefetcher.stop()
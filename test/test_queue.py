@@ -6,6 +6,9 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from unittest.mock import patch, MagicMock
 from src.main import add_song_to_queue, song_queue 
 from src.song import Song
+from src.jukebox_queue import JukeboxQueue
+from src.queue_journal import QueueJournal
+import threading
 
 def test_add_song_to_queue():
     # Verify songs are added in correct order
@@ -19,9 +22,67 @@ def test_add_song_to_queue():
     
 def test_queue_thread_safety():
     # Test concurrent access to queue (multiple API requests)
-    raise NotImplementedError
+    queue = JukeboxQueue()
+    songs = [Song(f"Song {i}", f"https://youtu.be/song{i:07d}", 60, "Author") for i in range(200)]
+    ids = []
+
+    def add(batch):
+        for song in batch:
+            ids.append(queue.put(song))
+
+    threads = [threading.Thread(target=add, args=(songs[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert queue.qsize() == 200
+    assert len(set(ids)) == 200, "Entry ids must be unique"
+    assert [entry["id"] for entry in queue.snapshot()] == sorted(ids)
+
+    removed = [queue.remove(entry_id) for entry_id in ids[:50]]
+    assert all(removed) and queue.qsize() == 150
+    assert queue.remove(ids[0]) is None
+
+    head = queue.snapshot()[-1]["id"]
+    version = queue.version
+    assert queue.move(head, 0)
+    assert queue.version > version
+    assert queue.snapshot()[0]["id"] == head
+    moved_url = queue.entry(head).song.url
+    assert queue.get().url == moved_url
+    assert queue.entry(head) is None
+    assert queue.qsize() == 149
+
+def test_queue_snapshot_is_cached():
+    queue = JukeboxQueue()
+    song = Song("Song", "https://youtu.be/abcdefghijk", 60, "Author")
+    queue.put(song)
+    assert queue.snapshot() is queue.snapshot()
+    assert queue.snapshot_json() is queue.snapshot_json()
+    assert queue.contains_video("abcdefghijk")
+    assert queue.queue[0] is song
+    queue.get()
+    assert queue.snapshot() == [] and not queue.contains_video("abcdefghijk")
     
-def test_queue_persistence_across_restarts():
+def test_queue_persistence_across_restarts(tmp_path):
     # Ensure queue state survives application restarts
-    # NOTE - This is not an Implemented feature yet
-    raise NotImplementedError
\ No newline at end of file
+    directory = str(tmp_path)
+    songs = [Song(f"Song {i}", f"https://youtu.be/song{i:07d}", 60 + i, "Author") for i in range(10)]
+
+    queue = JukeboxQueue(journal=QueueJournal(directory, snapshot_every=4))
+    ids = [queue.put(song, f"prompt {i}") for i, song in enumerate(songs)]
+    queue.get()  # Played
+    queue.remove(ids[3])
+    queue.move(ids[9], 0)
+    queue._snapshot_thread.join()
+    queue.put(songs[0])  # Only in the log tail, after the last snapshot
+
+    # A "crash": the journal is never closed and the next process just reads the files
+    restored = JukeboxQueue(journal=QueueJournal(directory, snapshot_every=4))
+    assert restored.snapshot() == queue.snapshot()
+    assert restored.snapshot()[0]["search_prompt"] == "prompt 9"
+    assert restored.put(songs[1]) > max(entry["id"] for entry in queue.snapshot()), "Entry ids must not be reused"
+
+    # Logs from before the latest snapshot are compacted away
+    assert len([name for name in os.listdir(directory) if name.endswith(".wal.jsonl")]) <= 2
\ No newline at end of file
@@ -0,0 +1,43 @@
+import sys
+import os
+import time
+# This correctly adds the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from unittest.mock import patch
+from src.player.rc import RcPlayer, parse_rc_status
+
+def test_parse_rc_status_lines():
+    assert parse_rc_status("status change: ( new input: https://example.com/a.m4a )") == ("new_input", "https://example.com/a.m4a")
+    assert parse_rc_status("> status change: ( play state: 3 ): Play") == ("state", "playing")
+    assert parse_rc_status("status change: ( pause state: 4 ): Pause") == ("state", "paused")
+    assert parse_rc_status("status change: ( stop state: 5 )") == ("state", "stopped")
+    assert parse_rc_status("status change: ( end state: 6 )") == ("state", "stopped")
+    assert parse_rc_status("status change: ( audio volume: 256 )") is None
+    assert parse_rc_status("Remote control interface initialized. Type `help' for help.") is None
+
+def test_rc_answers_update_player_model_in_query_order():
+    player = RcPlayer()
+    events = []
+    player.on_event = lambda kind, value, at: events.append((kind, value))
+    with patch.object(player, "send_command", return_value=True):
+        start = time.time()
+        player._handle_line("status change: ( new input: file:///tmp/a.audio )", start)
+        player._handle_line("status change: ( play state: 3 ): Play", start)  # Queries get_length
+        player.query("get_time")
+        player._handle_line("> 240", start + 1)
+        player._handle_line("42", start + 1)
+        status = player.status
+        assert status.length == 240
+        assert status.input == "file:///tmp/a.audio"
+        # Extrapolated while playing, frozen while paused
+        assert status.elapsed(start + 3) == pytest.approx(44)
+        assert status.remaining(start + 3) == pytest.approx(196)
+        player._handle_line("status change: ( pause state: 4 ): Pause", start + 5)
+        assert status.elapsed(start + 60) == pytest.approx(46)
+        assert status.snapshot()["state"] == "paused"
+        assert len(player._queries) == 0
+        assert events == [("new_input", "file:///tmp/a.audio"), ("state", "playing"), ("state", "paused")]
+        with pytest.raises(ValueError):
+            player.query("status")